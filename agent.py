@@ -1,37 +1,19 @@
 import os
 from typing import List, Dict, Any, Optional
-from langgraph.prebuilt import create_react_agent
 from langchain_core.runnables import Runnable
-from langchain.tools import Tool
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_openai import ChatOpenAI
-from langchain_tavily import TavilySearch
-from langchain_community.tools.semanticscholar.tool import SemanticScholarQueryRun
-from langchain_community.tools import WikipediaQueryRun
-from langchain_community.utilities import WikipediaAPIWrapper
-from langchain_experimental.tools.python.tool import PythonREPLTool
 from crawler import SimpleCrawl4AITool, AdvancedCrawl4AITool, SmartExtractionTool, BatchCrawl4AITool
-import json
-import sys
-from io import StringIO
-import traceback
-import re
-
-# Initialize the global list to store captured figures
-_captured_figures: List[str] = []
-
-def get_captured_figures() -> List[str]:
-    """Get any captured Plotly figures as JSON strings."""
-    global _captured_figures
-    print(f"Getting captured figures: {len(_captured_figures)} available")
-    return _captured_figures.copy()
-
-def clear_captured_figures():
-    """Clear the captured figures."""
-    global _captured_figures
-    count = len(_captured_figures)
-    _captured_figures.clear()
-    print(f"Cleared {count} captured figures")
+from search_tools import AsyncTavilySearchTool, AsyncSemanticScholarTool, AsyncWikipediaTool
+from tool_runtime import BoundedTool
+from knowledge_base import KnowledgeBaseTool
+from figures import install_plotly_capture
+from code_executor import PythonExecutionTool
+from uploaded_data import DatasetSummaryTool
+from documents import UploadedDocumentTool
+from tool_output import ToolOutputPagerTool
+from history import make_pre_model_hook
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 
 def load_system_prompt() -> str:
     """Load the system prompt from the esi_agent_instruction.md file."""
@@ -55,66 +37,86 @@ When creating visualizations:
 
 Always cite your sources and provide accurate, helpful information."""
 
-def create_tavily_tool() -> Tool:
+def create_tavily_tool() -> AsyncTavilySearchTool:
     """Create the Tavily search tool."""
-    # Initialize Tavily search
-    tavily_search = TavilySearch(
+    return AsyncTavilySearchTool(
         max_results=5,
         search_depth="advanced",
-        include_answer=True,
-        include_raw_content=False,
-        include_images=False
-    )
-    
-    return Tool(
-        name="tavily_search",
-        description="Search the web for current information, news, and general knowledge. Use this for real-time information, current events, or when you need up-to-date web content.",
-        func=tavily_search.run
+        include_answer=True
     )
 
 
-def create_agent(temperature: float = 0.5, model: str = "gemini-2.5-flash", verbosity: int = 3) -> Runnable:
-    """Create and configure the React agent with tools."""
-    
-    # Load environment variables
+def create_llm(model: str = "gemini-2.5-flash", temperature: float = 0.5):
+    """Create the chat model for a Gemini or OpenRouter model name.
+
+    Provider packages are imported here, on first use, to keep server start-up fast.
+    """
     google_api_key = os.getenv("GOOGLE_API_KEY")
-    tavily_api_key = os.getenv("TAVILY_API_KEY")
     openrouter_api_key = os.getenv("OPENROUTER_API_KEY")
- 
-    
-    if not tavily_api_key:
-        raise ValueError("TAVILY_API_KEY environment variable is required")
-    
-    # Initialize the LLM based on the selected model
+
     if model.startswith("gemini"):
         if not google_api_key:
             raise ValueError("GOOGLE_API_KEY environment variable is required for Gemini models")
-        llm = ChatGoogleGenerativeAI(
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        return ChatGoogleGenerativeAI(
             model=model,
             temperature=temperature,
             google_api_key=google_api_key,
         )
-    else: # Assume OpenRouter model
-        if not openrouter_api_key:
-            raise ValueError("OPENROUTER_API_KEY environment variable is required for OpenRouter models")
-        llm = ChatOpenAI(
-            model=model,
-            temperature=temperature,
-            openai_api_key=openrouter_api_key, # Use openai_api_key for OpenRouter
-            base_url="https://openrouter.ai/api/v1",
-        )
+    # Assume OpenRouter model
+    if not openrouter_api_key:
+        raise ValueError("OPENROUTER_API_KEY environment variable is required for OpenRouter models")
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(
+        model=model,
+        temperature=temperature,
+        openai_api_key=openrouter_api_key, # Use openai_api_key for OpenRouter
+        base_url="https://openrouter.ai/api/v1",
+    )
+
+@lru_cache(maxsize=8)
+def get_summary_llm(model: str):
+    """Low-temperature model used to summarise long chat histories."""
+    return create_llm(model=model, temperature=0.2)
+
+
+def create_agent(temperature: float = 0.5, model: str = "gemini-2.5-flash", verbosity: int = 3,
+                 llm: Optional[Any] = None) -> Runnable:
+    """Create and configure the React agent with tools.
+
+    `llm` replaces the model built from `model` (e.g. a fake model in benchmarks).
+    """
+    
+    # Load environment variables
+    tavily_api_key = os.getenv("TAVILY_API_KEY")
     
+    if not tavily_api_key:
+        raise ValueError("TAVILY_API_KEY environment variable is required")
+    
+    # Initialize the LLM based on the selected model
+    if llm is None:
+        llm = create_llm(model=model, temperature=temperature)
+    
+    # fig.show() inside the REPL sends figures to the running turn's figure store
+    install_plotly_capture()
+
     # Create tools
     tools = [
+        KnowledgeBaseTool(),
         create_tavily_tool(),
-        SemanticScholarQueryRun(top_k_results=10),
-        WikipediaQueryRun(api_wrapper=WikipediaAPIWrapper()),
-        PythonREPLTool(), # Reverted to original PythonREPLTool
+        AsyncSemanticScholarTool(top_k_results=10),
+        AsyncWikipediaTool(),
+        PythonExecutionTool(),
+        DatasetSummaryTool(),
+        UploadedDocumentTool(),
+        ToolOutputPagerTool(),
         SimpleCrawl4AITool(),
         AdvancedCrawl4AITool(),
         SmartExtractionTool(),
         BatchCrawl4AITool()
     ]
+    # Independent tool calls in one step run concurrently, bounded by the turn budget
+    tools = [BoundedTool(tool) for tool in tools]
 
 
     # Load system prompt
@@ -130,15 +132,70 @@ def create_agent(temperature: float = 0.5, model: str = "gemini-2.5-flash", verb
     elif verbosity == 5:
         system_prompt += "\n\nYour responses should be extremely verbose, comprehensive, and elaborate on all points."
     
-    # Create the React agent
+    # Create the React agent (langgraph is imported on the first build)
+    from langgraph.prebuilt import create_react_agent
     agent = create_react_agent(
         llm,
         tools=tools,
         prompt = system_prompt,
+        # Shorten already-used tool outputs when a turn outgrows the model's history budget
+        pre_model_hook=make_pre_model_hook(model),
     )
     
     return agent
 
+# Registry of built agents, keyed by (model, temperature, verbosity).
+# Agents are stateless between invocations (history is passed in by the caller),
+# so one instance can safely be shared by every session using the same settings.
+AGENT_CACHE_SIZE = int(os.getenv("AGENT_CACHE_SIZE", "8"))
+_agent_registry: "OrderedDict[tuple, Runnable]" = OrderedDict()
+_agent_registry_lock = threading.Lock()
+_agent_build_locks: Dict[tuple, threading.Lock] = {}
+
+def _agent_key(temperature: float, model: str, verbosity: int) -> tuple:
+    """Normalise agent settings into a registry key."""
+    return (model, round(float(temperature), 2), int(verbosity))
+
+def get_agent(temperature: float = 0.5, model: str = "gemini-2.5-flash", verbosity: int = 3) -> Runnable:
+    """Return a shared agent for these settings, building it on first use.
+
+    Entries are evicted least-recently-used once more than AGENT_CACHE_SIZE
+    setting combinations are live. Concurrent requests for the same key wait
+    for a single build instead of each building their own.
+    """
+    key = _agent_key(temperature, model, verbosity)
+    with _agent_registry_lock:
+        agent = _agent_registry.get(key)
+        if agent is not None:
+            _agent_registry.move_to_end(key)
+            return agent
+        build_lock = _agent_build_locks.setdefault(key, threading.Lock())
+
+    with build_lock:
+        with _agent_registry_lock:
+            agent = _agent_registry.get(key)
+            if agent is not None:
+                _agent_registry.move_to_end(key)
+                return agent
+
+        print(f"Building agent for {key}")
+        agent = create_agent(temperature=key[1], model=key[0], verbosity=key[2])
+
+        with _agent_registry_lock:
+            _agent_registry[key] = agent
+            _agent_registry.move_to_end(key)
+            while len(_agent_registry) > AGENT_CACHE_SIZE:
+                evicted, _ = _agent_registry.popitem(last=False)
+                _agent_build_locks.pop(evicted, None)
+                print(f"Evicted idle agent {evicted}")
+        return agent
+
+def clear_agent_registry():
+    """Drop every cached agent (e.g. after changing API keys or the system prompt)."""
+    with _agent_registry_lock:
+        _agent_registry.clear()
+        _agent_build_locks.clear()
+
 if __name__ == "__main__":
     # Test the agent creation
     try:
@@ -161,9 +218,6 @@ if __name__ == "__main__":
         # result = agent.invoke({"input": test_query})
         # print(f"Test result: {result}")
         
-        # Check if figures were captured
-        # figures = get_captured_figures()
-        # print(f"Captured {len(figures)} figures during test")
         
     except Exception as e:
         print(f"Error creating agent: {e}")
@@ -2,26 +2,46 @@ import chainlit as cl
 from chainlit.input_widget import Select, Slider, Switch
 from chainlit.data.sql_alchemy import SQLAlchemyDataLayer
 from chainlit.types import ThreadDict
-from agent import create_agent, get_captured_figures, clear_captured_figures
+from agent import get_agent
 import asyncio
 from typing import Dict, Optional
 import os
-import json
-import plotly.graph_objects as go
-from plotly.utils import PlotlyJSONEncoder
+import time
+from chainlit.element import Element
 
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
-from agent import load_system_prompt
+from agent import load_system_prompt, get_summary_llm
+from history import ChatHistory, cache_history, cached_history
+from chainlit.data import get_data_layer as chainlit_data_layer
+from data_layer import create_data_layer, database_url
+from streaming import TokenStreamer
+from crawler import close_crawler_pool, get_crawler_pool
+from loop_bridge import stop_background_loop
+from search_tools import close_search_clients
+from tool_runtime import turn_budget
+from tool_output import tool_output_model, forget_session_tool_outputs
+from tracing import span, record, metrics, install_metrics_endpoint
+from chainlit.server import app as server_app
+from knowledge_base import warm_knowledge_base
+from figures import FigureStore, capture_figures
+from code_executor import code_session, get_code_pool, close_code_pool
+from uploaded_data import is_dataset, get_dataset_store, register_datasets, forget_session_datasets
+from documents import is_document, get_document_store, session_documents, forget_session_documents
 import random
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Per-turn latency percentiles (TTFT, LLM, tools, figures, DB) for scraping
+install_metrics_endpoint(server_app)
+
 OAUTH_GOOGLE_CLIENT_ID = os.getenv("OAUTH_GOOGLE_CLIENT_ID")
 OAUTH_GOOGLE_CLIENT_SECRET = os.getenv("OAUTH_GOOGLE_CLIENT_SECRET")
 
-# Global agent variable
-agent = None
+# Warm the default agent, knowledge base, code workers and browsers in the background at start-up
+STARTUP_PREWARM = os.getenv("STARTUP_PREWARM", "true").lower() in ("1", "true", "yes")
+# Browsers launched by the pre-warm (0 leaves the crawler pool to start on first use)
+PREWARM_CRAWLERS = int(os.getenv("PREWARM_CRAWLERS", "1"))
 
 THINKING_PHRASES_FILE = "thinking_phrases.md"
 _thinking_phrases = []
@@ -75,28 +95,17 @@ def oauth_callback(
 
 @cl.data_layer
 def get_data_layer():
-    """Initialize SQLAlchemy data layer with async database connection"""
-    # Create data directory if it doesn't exist
-    data_dir = "data"
-    if not os.path.exists(data_dir):
-        os.makedirs(data_dir)
-    
-    # SQLite connection string - using aiosqlite for async support
-    # This is required by Chainlit's SQLAlchemy data layer
-    db_path = os.path.join(data_dir, "chainlit_app.db")
-    
-    # Use async SQLite connection (requires aiosqlite)
-    conninfo = f"sqlite+aiosqlite:///{db_path}"
-    
-    print(f"Initializing async database at: {db_path}")
+    """Initialize the SQLAlchemy data layer (tuned SQLite, or Postgres via DATABASE_URL)"""
+    url = database_url()
+    print(f"Initializing async database at: {url.split('@')[-1]}")
     
     try:
-        data_layer = SQLAlchemyDataLayer(conninfo=conninfo)
+        data_layer = create_data_layer(url)
         print("SQLAlchemy data layer initialized successfully")
         return data_layer
     except Exception as e:
         print(f"Error initializing data layer: {e}")
-        print("Make sure to install aiosqlite: pip install aiosqlite")
+        print("Make sure the database driver is installed: pip install aiosqlite (or asyncpg for Postgres)")
         # Return None to use in-memory storage as fallback
         return None
 
@@ -139,18 +148,18 @@ async def set_starters():
 @cl.on_settings_update
 async def setup_agent(settings):
     """Handle settings updates."""
-    global agent
     print(f"Settings updated: {settings}")
     
     try:
-        # Recreate agent with new settings
+        # Look up (or build once) the shared agent for the new settings
         agent = await asyncio.get_event_loop().run_in_executor(
-            None, lambda: create_agent(
+            None, lambda: get_agent(
                 temperature=settings.get("temperature", 1.0),
                 model=settings.get("model", "gemini-2.5-flash"),
                 verbosity=settings.get("verbosity", 3)
             )
         )
+        cl.user_session.set("agent", agent)
         
         temperature = settings.get("temperature", 1.0)
         model = settings.get("model", "gemini-2.5-flash")
@@ -163,53 +172,97 @@ async def setup_agent(settings):
     except Exception as e:
         await cl.Message(content=f"❌ Error updating settings: {str(e)}" ).send()
         
-async def display_plotly_figures():
-    """Check for and display any captured Plotly figures using cl.Pyplot."""
-    try:
-        figures = get_captured_figures()
-        if figures:
-            await cl.Message(content=f"📊 **{len(figures)} visualization(s) generated:**").send()
+class EncodedPlotly(cl.Plotly):
+    """cl.Plotly built from figure JSON that was already encoded by figures.encode_figure.
+
+    Skips the parse -> go.Figure -> validate -> re-serialise round trip that
+    cl.Plotly does, so typed-array (bdata) buffers reach the client untouched.
+    """
+
+    def __post_init__(self) -> None:
+        self.mime = "application/json"
+        Element.__post_init__(self)
+
+async def stream_plotly_figures(store: FigureStore):
+    """Send each captured Plotly figure to the client as soon as it is produced."""
+    i = 0
+    async for fig_json in store:
+        i += 1
+        try:
+            # The figure is already compact JSON; send it as the element content
+            plotly_element = [EncodedPlotly(
+                name=f"plot_{i}",
+                content=fig_json,
+                display="inline"
+            )]
+            with span("figure_render"):
+                await cl.Message(content="This message has a chart", elements=plotly_element).send()
+            metrics.observe("figure_bytes", len(fig_json))
+            print(f"Successfully displayed plot {i} ({len(fig_json)} bytes)")
             
-            for i, fig_json in enumerate(figures):
-                try:
-                    # Parse the JSON and create a Plotly figure
-                    fig_dict = json.loads(fig_json)
-                    fig = go.Figure(fig_dict)
-                    
-                    # Use cl.plotly to display the figure
-                    plotly_element = [cl.Plotly(
-                        name=f"plot_{i+1}",
-                        figure=fig,
-                        display="inline"
-                    )]
-                    await cl.Message(content="This message has a chart", elements=plotly_element).send()
-                    print(f"Successfully displayed plot {i+1} using cl.Pyplot")
-                    
-                except json.JSONDecodeError as e:
-                    print(f"JSON decode error for plot {i+1}: {e}")
-                    await cl.Message(
-                        content=f"❌ Error parsing plot {i+1}: Invalid JSON data"
-                    ).send()
-                except Exception as e:
-                    print(f"Error processing plot {i+1}: {e}")
-                    await cl.Message(
-                        content=f"❌ Error processing plot {i+1}: {str(e)}"
-                    ).send()
-            
-            # Clear the captured figures after processing
-            clear_captured_figures()
-            
-    except Exception as e:
-        print(f"Error in display_plotly_figures: {e}")
-        import traceback
-        traceback.print_exc()
-        # Still try to clear figures even if there was an error
-        clear_captured_figures()
+        except Exception as e:
+            print(f"Error processing plot {i}: {e}")
+            await cl.Message(
+                content=f"❌ Error processing plot {i}: {str(e)}"
+            ).send()
+    if store.dropped:
+        await cl.Message(content=f"⚠️ {store.dropped} visualization(s) could not be displayed.").send()
+
+async def get_session_agent():
+    """Return this session's agent, looking it up from the registry if it was dropped."""
+    agent = cl.user_session.get("agent")
+    if agent is None:
+        settings = cl.user_session.get("chat_settings") or {}
+        agent = await asyncio.get_event_loop().run_in_executor(
+            None, lambda: get_agent(
+                temperature=settings.get("temperature", 1.0),
+                model=settings.get("model", "gemini-2.5-flash"),
+                verbosity=settings.get("verbosity", 3)
+            )
+        )
+        cl.user_session.set("agent", agent)
+    return agent
+
+async def load_uploaded_datasets(message: cl.Message) -> list:
+    """Convert dataset uploads (once) to Arrow and load them, memory-mapped, into this chat's Python session."""
+    session_id = cl.context.session.id
+    loaded = []
+    for element in message.elements or []:
+        if not getattr(element, "path", None) or not is_dataset(element.name):
+            continue
+        try:
+            datasets = await asyncio.to_thread(get_dataset_store().ingest, element.path, element.name)
+            result = await asyncio.to_thread(
+                get_code_pool().load_datasets, session_id, {d.name: d.path for d in datasets}
+            )
+            if not result.get("ok"):
+                raise RuntimeError(result.get("error"))
+            register_datasets(session_id, datasets)
+            loaded.extend(datasets)
+        except Exception as e:
+            print(f"Error loading dataset {element.name}: {e}")
+            await cl.Message(content=f"❌ Error loading {element.name}: {str(e)}").send()
+    return loaded
+
+async def load_uploaded_documents(message: cl.Message) -> list:
+    """Parse document uploads page by page and add them to this chat's document index."""
+    docs = session_documents(cl.context.session.id)
+    loaded = []
+    for element in message.elements or []:
+        if not getattr(element, "path", None) or not is_document(element.name):
+            continue
+        try:
+            document = await asyncio.to_thread(get_document_store().ingest, element.path, element.name)
+            await asyncio.to_thread(docs.add, document)
+            loaded.append(document)
+        except Exception as e:
+            print(f"Error loading document {element.name}: {e}")
+            await cl.Message(content=f"❌ Error loading {element.name}: {str(e)}").send()
+    return loaded
 
 @cl.on_chat_start
 async def start():
     """Initialize the agent when a new chat session starts."""
-    global agent
     # load thinking phrases
     load_thinking_phrases()
 
@@ -254,6 +307,12 @@ async def start():
             max=5,
             step=1,
             description="Controls the length and detail of responses (1: Laconic, 5: Extremely Verbose)."
+        ),
+        Switch(
+            id="typewriter",
+            label="Typewriter Effect",
+            initial=False,
+            description="Stream responses word by word with a small delay (slower)."
         )
     ]).send()
 
@@ -261,53 +320,109 @@ async def start():
     # cl.user_session.set("chat_history", [])
 
     try:
-        # Create the agent with initial settings
+        # Reuse the shared agent for the initial settings (built on first use)
         agent = await asyncio.get_event_loop().run_in_executor(
-            None, lambda: create_agent(
+            None, lambda: get_agent(
                 temperature=settings.get("temperature", 1.0),
                 model=settings.get("model", "gemini-2.5-flash"),
                 verbosity=settings.get("verbosity", 3)
             )
         )
+        cl.user_session.set("agent", agent)
     except Exception as e:
         error_msg = f"❌ Error initializing agent: {str(e)}"
         await cl.Message(content=error_msg).send()
 
 
 
-@cl.on_chat_resume
-async def on_chat_resume(thread: ThreadDict):
-    memory = ConversationBufferMemory(return_messages=True)
-    root_messages = [m for m in thread["steps"] if m["parentId"] == None]
-    for message in root_messages:
-        if message["type"] == "user_message":
-            memory.chat_memory.add_user_message(message["output"])
-        else:
-            memory.chat_memory.add_ai_message(message["output"])
+# Most recent root messages loaded when a thread is resumed (older turns are summarised later)
+RESUME_MAX_MESSAGES = int(os.getenv("RESUME_MAX_MESSAGES", "40"))
 
-    cl.user_session.set("memory", memory)
+ROOT_MESSAGES_SQL = """
+    SELECT "type", "output" FROM steps
+    WHERE "threadId" = :thread_id AND "parentId" IS NULL
+      AND "type" IN ('user_message', 'assistant_message')
+    ORDER BY "createdAt" DESC
+    LIMIT :limit
+"""
 
-    setup_runnable()
+async def rebuild_history(thread: ThreadDict) -> ChatHistory:
+    """Rebuild a thread's chat history from its root user/assistant messages only."""
+    data_layer = chainlit_data_layer()
+    rows = None
+    if isinstance(data_layer, SQLAlchemyDataLayer):
+        # Indexed query for just the last N root messages, instead of walking every step
+        rows = await data_layer.execute_sql(ROOT_MESSAGES_SQL, {"thread_id": thread["id"], "limit": RESUME_MAX_MESSAGES})
+    if isinstance(rows, list):
+        rows.reverse()
+    else:
+        rows = [step for step in thread.get("steps", [])
+                if step.get("parentId") is None and step.get("type") in ("user_message", "assistant_message")]
+        rows = rows[-RESUME_MAX_MESSAGES:]
+
+    messages = []
+    for row in rows:
+        output = row.get("output") or ""
+        if not output or output == "This message has a chart":
+            continue
+        messages.append(HumanMessage(content=output) if row["type"] == "user_message" else AIMessage(content=output))
+    # The cap may cut mid-turn; start the history at a user message
+    while messages and not isinstance(messages[0], HumanMessage):
+        messages.pop(0)
+    return ChatHistory(messages)
 
+@cl.on_chat_resume
+async def on_chat_resume(thread: ThreadDict):
+    """Restore the agent and chat history when a user reopens a past conversation."""
+    load_thinking_phrases()
+    history = cached_history(thread["id"])
+    if history is None:
+        history = await rebuild_history(thread)
+        cache_history(thread["id"], history)
+        print(f"Rebuilt history for thread {thread['id']} ({len(history.messages)} messages)")
+    cl.user_session.set("history", history)
 
+    try:
+        await get_session_agent()
+        settings = cl.user_session.get("chat_settings") or {}
+        model = settings.get("model", "gemini-2.5-flash")
+        history.maybe_summarize(get_summary_llm(model), model)
+    except Exception as e:
+        await cl.Message(content=f"❌ Error initializing agent: {str(e)}").send()
 
 
 @cl.on_message
 async def main(message: cl.Message):
     """Handle incoming messages and process them with the agent."""
-    global agent
-
+    turn_started = time.perf_counter()
     response_message = cl.Message(content=random.choice(_thinking_phrases))
     await response_message.send()
+    figure_task = None
 
     try:
-        chat_history = cl.user_session.get("chat_history", [])
+        agent = await get_session_agent()
+        settings = cl.user_session.get("chat_settings") or {}
+        model = settings.get("model", "gemini-2.5-flash")
+        history = cl.user_session.get("history")
+        if history is None:
+            history = ChatHistory()
+            cl.user_session.set("history", history)
+            cache_history(cl.context.session.thread_id, history)
+        
+        # Tell the agent about files uploaded with this message
+        content = message.content
+        for dataset in await load_uploaded_datasets(message):
+            content += (f"\n\n[Uploaded dataset {dataset.source}: available in python_repl as "
+                        f"{dataset.name} ({dataset.rows} rows x {dataset.columns} columns)]")
+        for document in await load_uploaded_documents(message):
+            content += (f"\n\n[Uploaded document {document.source}: {document.unit_count} pages/sections, "
+                        f"readable with read_uploaded_document]")
         
         # Add the new user message to history
-        chat_history.append(HumanMessage(content=message.content))
+        history.append(HumanMessage(content=content))
         
-        # Prepare the input for the agent
-        agent_input = {"messages": chat_history}
+        # Prepare the input for the agent: summary of older turns plus recent ones, within the model's budget
+        agent_input = {"messages": history.prompt_messages(model)}
         
         # Track the full response content for the final message
         full_response_content = ""
@@ -316,60 +431,80 @@ async def main(message: cl.Message):
         final_ai_message_obj: Optional[AIMessage] = None
         
         is_first_token = True # Flag to track the first actual LLM token
+        llm_started: Dict[str, float] = {}  # run id -> start time of each LLM call
+        
+        streamer = TokenStreamer(response_message, typewriter=settings.get("typewriter", False))
         
-        # Stream the agent's response using astream_events for token-level granularity
-        async for event in agent.astream_events(agent_input, version="v1"):
-            kind = event["event"]
+        figure_store = FigureStore()
+        
+        # Tool calls in this turn share a concurrency limit and a deadline
+        # Python runs in this chat's own interpreter session
+        # Tool, figure and DB spans started during the turn nest under its trace
+        # Tool outputs are trimmed to budgets counted with this model's tokenizer
+        with span("turn", model=model), turn_budget(), tool_output_model(model), \
+                capture_figures(figure_store), code_session(cl.context.session.id):
+            # Figures produced during this turn are streamed by a separate task
+            figure_task = asyncio.create_task(stream_plotly_figures(figure_store))
+            
+            # Stream the agent's response using astream_events for token-level granularity
+            async for event in agent.astream_events(agent_input, version="v1"):
+                kind = event["event"]
 #            print(f"Received event kind: {kind}") # Debug print
             
-            if kind == "on_chat_model_stream":
-                # This event provides token-level chunks from the LLM
-                token = event["data"]["chunk"].content
-                if token:
-                    if is_first_token:
-                        # Clear "Thinking..." and start actual streaming
-                        response_message.content = ""
-                        await response_message.update()
-                        is_first_token = False
+                if kind == "on_chat_model_start":
+                    llm_started[event["run_id"]] = time.perf_counter()
+            
+                elif kind == "on_chat_model_stream":
+                    # This event provides token-level chunks from the LLM
+                    token = event["data"]["chunk"].content
+                    if token:
+                        if is_first_token:
+                            # Clear "Thinking..." and start actual streaming
+                            response_message.content = ""
+                            await response_message.update()
+                            is_first_token = False
+                            record("ttft", time.perf_counter() - turn_started, model=model)
 
 #                    print(f"Streaming token: '{token}'") # Debug print
                     
-                    # Split by space to simulate word-by-word streaming
-                    words = token.split(' ')
-                    for i, word in enumerate(words):
-                        await response_message.stream_token(word)
-                        if i < len(words) - 1: # Add space between words
-                            await response_message.stream_token(" ")
-                        await asyncio.sleep(0.005) # Small delay for visual effect
+                        # Coalesce tokens into frames (or typewrite if enabled in settings)
+                        await streamer.push(token)
                     
-                    full_response_content += token # Accumulate original token for history
+                        full_response_content += token # Accumulate original token for history
+            
+                elif kind == "on_chat_model_end":
+                    # Don't hold buffered text back while tools run
+                    await streamer.flush()
+                    if event["run_id"] in llm_started:
+                        record("llm_call", time.perf_counter() - llm_started.pop(event["run_id"]), model=model)
             
-            elif kind == "on_chain_end":
-                print(f"Chain end event: {event['name']}") # Debug print
-                # This event signifies the end of a chain or the overall graph.
-                # The final output of the agent is usually in event["data"]["output"]
-                if "output" in event["data"] and event["data"]["output"] is not None and "messages" in event["data"]["output"]:
-                    # Find the last AIMessage in the final output messages
-                    for msg in reversed(event["data"]["output"]["messages"]):
-                        if isinstance(msg, AIMessage):
-                            final_ai_message_obj = msg
-                            break
+                elif kind == "on_chain_end":
+                    # This event signifies the end of a chain or the overall graph.
+                    # The final output of the agent is usually in event["data"]["output"]
+                    if "output" in event["data"] and event["data"]["output"] is not None and "messages" in event["data"]["output"]:
+                        # Find the last AIMessage in the final output messages
+                        for msg in reversed(event["data"]["output"]["messages"]):
+                            if isinstance(msg, AIMessage):
+                                final_ai_message_obj = msg
+                                break
+        
+        await streamer.flush()
         
         # After streaming, add the complete AI response to chat history
         # Use the accumulated streamed content for the AIMessage content.
         if final_ai_message_obj:
             final_ai_message_obj.content = full_response_content
-            chat_history.append(final_ai_message_obj)
+            history.append(final_ai_message_obj)
         elif full_response_content:
             # Fallback if no specific AIMessage object was found from on_chain_end
-            chat_history.append(AIMessage(content=full_response_content))
+            history.append(AIMessage(content=full_response_content))
         
-        # Check for plots after the stream is complete
-        print("Checking for captured figures...")
-        await display_plotly_figures()
+        # Let the figure task send anything still queued, then finish
+        await figure_store.close()
+        await figure_task
         
-        # Update the chat history in the session
-        cl.user_session.set("chat_history", chat_history)
+        # Fold older turns into the running summary in the background if the history is long
+        history.maybe_summarize(get_summary_llm(model), model)
         
         # Ensure the response message is fully updated (though stream_token does this incrementally)
         await response_message.update()
@@ -380,13 +515,66 @@ async def main(message: cl.Message):
         import traceback
         traceback.print_exc()
         await cl.Message(content=error_msg).send()
+        if figure_task is not None and not figure_task.done():
+            figure_task.cancel()
 
 @cl.on_stop
 async def stop():
     """Clean up when the chat session ends."""
-    global agent
-    agent = None
+    # The agent itself is shared via the registry; only drop this session's reference
+    cl.user_session.set("agent", None)
     print("Chat session ended, agent cleaned up.")
 
+@cl.on_chat_end
+async def end():
+    """Free this chat's Python interpreter state, uploaded files and stored tool outputs."""
+    await asyncio.to_thread(get_code_pool().reset_session, cl.context.session.id)
+    forget_session_datasets(cl.context.session.id)
+    forget_session_documents(cl.context.session.id)
+    forget_session_tool_outputs(cl.context.session.id)
+
+_prewarm_task: Optional[asyncio.Task] = None
+
+async def prewarm():
+    """Open long-lived resources in the background, before the first chat needs them."""
+    async def warm(name: str, step):
+        started = time.perf_counter()
+        try:
+            await step()
+            print(f"Pre-warmed {name} in {time.perf_counter() - started:.1f}s")
+        except Exception as e:
+            print(f"Error pre-warming {name}: {e}")
+
+    steps = [
+        # Code workers import the analysis stack in their own processes
+        warm("code workers", lambda: asyncio.to_thread(get_code_pool().warm)),
+        warm("knowledge base", lambda: asyncio.to_thread(warm_knowledge_base)),
+        # Same settings as a new chat's defaults, so the first chat reuses it
+        warm("default agent", lambda: asyncio.to_thread(
+            get_agent, temperature=1.0, model="gemini-2.5-flash", verbosity=3)),
+    ]
+    if PREWARM_CRAWLERS > 0:
+        steps.append(warm("crawler pool", lambda: get_crawler_pool().warm(PREWARM_CRAWLERS)))
+    await asyncio.gather(*steps)
+
+@cl.on_app_startup
+async def startup():
+    """Start pre-warming without holding up the server accepting connections."""
+    global _prewarm_task
+    if STARTUP_PREWARM:
+        _prewarm_task = asyncio.create_task(prewarm())
+
+@cl.on_app_shutdown
+async def shutdown():
+    """Close shared resources when the server stops."""
+    if _prewarm_task is not None and not _prewarm_task.done():
+        _prewarm_task.cancel()
+    await close_crawler_pool()
+    await close_search_clients()
+    # Closes the background loop used by sync tool calls, and its crawler pool
+    await asyncio.to_thread(stop_background_loop)
+    print("Crawler pool closed.")
+    await asyncio.to_thread(close_code_pool)
+
 if __name__ == "__main__":
     pass
\ No newline at end of file
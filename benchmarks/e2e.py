@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Offline end-to-end benchmark of a chat turn (app.main + the agent + tools).
+
+A deterministic fake chat model streams tokens at a fixed rate and makes
+the tool calls a research turn would (web, paper and Wikipedia search, then
+a page crawl). Tavily, Semantic Scholar, Wikipedia and the crawled pages are
+served by a local HTTP stand-in, so no API keys or network are needed. N
+simulated Chainlit sessions send messages concurrently; each level reports
+turns/s, TTFT, end-to-end latency, the per-span breakdown from tracing and
+peak RSS.
+
+    python benchmarks/e2e.py --sessions 1 8 32
+    python benchmarks/e2e.py --no-crawl               # skip the headless browser
+    python benchmarks/e2e.py --python                 # also run a Plotly chart in the code workers
+    python benchmarks/e2e.py --token-rate 200 --service-latency 20
+
+Crawling uses Crawl4AI's local Chromium against the stand-in pages. Step
+writes go to a fresh temporary SQLite database unless DATABASE_URL is set.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import warnings
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+BENCH_MODEL = "bench/fake-model"
+WORDS = ("the", "evidence", "suggests", "that", "supervision", "quality", "predicts", "completion",
+         "rates", "across", "cohorts", "(Smith", "&", "Jones,", "2021).", "However,", "effects",
+         "vary", "by", "discipline", "and", "study", "mode.")
+PLOT_CODE = """import plotly.express as px
+import pandas as pd
+df = pd.DataFrame({"year": list(range(2010, 2024)), "completions": [i * i % 37 for i in range(14)]})
+fig = px.line(df, x="year", y="completions", title="Completions by year")
+fig.show()
+print(df.describe())"""
+
+
+# ---------------------------------------------------------------------------
+# Fake chat model
+
+class FakeStreamingChatModel(BaseChatModel):
+    """Deterministic chat model: scripted tool-call steps, then a streamed answer.
+
+    The step is the number of AI messages since the last user message, so the
+    same instance serves every session. Tool call arguments may use {query}
+    (the user's message) and {page} (a counter, for distinct crawl URLs).
+    """
+
+    tool_steps: List[List[Tuple[str, Dict[str, Any]]]] = []
+    answer_tokens: int = 150
+    tokens_per_second: float = 100.0
+    first_token_latency: float = 0.2
+    page_count: int = 50
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-streaming"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _chunks(self, messages: List[BaseMessage]) -> List[AIMessageChunk]:
+        last_human = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=-1)
+        step = sum(isinstance(m, AIMessage) for m in messages[last_human + 1:])
+        if step < len(self.tool_steps):
+            query = str(messages[last_human].content).split("\n")[0][:200] if last_human >= 0 else ""
+            page = zlib.crc32(query.encode("utf-8")) % self.page_count
+            calls = []
+            for index, (name, args) in enumerate(self.tool_steps[step]):
+                args = {k: v.replace("{query}", query).replace("{page}", str(page)) if isinstance(v, str) else v
+                        for k, v in args.items()}
+                calls.append({"name": name, "args": json.dumps(args), "id": f"call_{uuid.uuid4().hex[:12]}",
+                              "index": index})
+            return [AIMessageChunk(content="", tool_call_chunks=calls)]
+        return [AIMessageChunk(content=(" " if i else "") + WORDS[i % len(WORDS)])
+                for i in range(self.answer_tokens)]
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs) -> ChatResult:
+        message = None
+        for chunk in self._stream(messages, stop, run_manager, **kwargs):
+            message = chunk.message if message is None else message + chunk.message
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(**message.model_dump(exclude={"type"})))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.first_token_latency)
+        for i, chunk in enumerate(self._chunks(messages)):
+            if i:
+                time.sleep(1.0 / self.tokens_per_second)
+            yield ChatGenerationChunk(message=chunk)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.first_token_latency)
+        for i, chunk in enumerate(self._chunks(messages)):
+            if i:
+                await asyncio.sleep(1.0 / self.tokens_per_second)
+            if run_manager and chunk.content:
+                await run_manager.on_llm_new_token(chunk.content, chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
+
+
+# ---------------------------------------------------------------------------
+# Local stand-ins for the search APIs and crawled pages
+
+def _page_html(n: int) -> str:
+    paragraphs = "\n".join(
+        f"<p>Paragraph {i} of page {n}: {' '.join(WORDS)} Doctoral completion studies report "
+        f"mixed findings on supervision frequency and student outcomes.</p>" for i in range(40))
+    return (f"<html><head><title>Stand-in page {n}</title></head><body>"
+            f"<nav><a href='/'>Home</a> <a href='/about'>About</a> <a href='/contact'>Contact</a></nav>"
+            f"<article><h1>Stand-in page {n}</h1>{paragraphs}</article>"
+            f"<footer>Cookie notice. All rights reserved.</footer></body></html>")
+
+def make_handler(base_url: str, latency: float):
+    class StandInHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, body: str, content_type: str = "application/json"):
+            data = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            time.sleep(latency)
+            length = int(self.headers.get("Content-Length") or 0)
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if self.path.startswith("/tavily/search"):
+                query = request.get("query", "")
+                self._send(json.dumps({
+                    "answer": f"A short answer about {query}.",
+                    "results": [{"title": f"Result {i} for {query}", "url": f"{base_url}/pages/{i}",
+                                 "content": " ".join(WORDS) * 4} for i in range(request.get("max_results", 5))],
+                }))
+            else:
+                self.send_error(404)
+
+        def do_GET(self):
+            time.sleep(latency)
+            url = urlsplit(self.path)
+            params = {k: v[0] for k, v in parse_qs(url.query).items()}
+            if url.path.startswith("/s2/paper/search"):
+                self._send(json.dumps({"data": [{
+                    "title": f"Paper {i} on {params.get('query', '')}", "abstract": " ".join(WORDS) * 8,
+                    "authors": [{"name": "A. Smith"}, {"name": "B. Jones"}], "year": 2015 + i % 9,
+                    "venue": "Studies in Higher Education", "citationCount": 10 * i,
+                    "externalIds": {"DOI": f"10.0000/bench.{i}"},
+                } for i in range(int(params.get("limit", 10)))]}))
+            elif url.path.startswith("/wikipedia"):
+                self._send(json.dumps({"query": {"pages": {str(i): {
+                    "title": f"Article {i}", "index": i, "extract": " ".join(WORDS) * 6,
+                } for i in range(int(params.get("gsrlimit", 3)))}}}))
+            elif url.path.startswith("/pages/"):
+                self._send(_page_html(int(url.path.rsplit("/", 1)[1] or 0)), "text/html; charset=utf-8")
+            else:
+                self.send_error(404)
+
+    return StandInHandler
+
+def start_stand_ins(latency: float) -> Tuple[ThreadingHTTPServer, str]:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), None)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    server.RequestHandlerClass = make_handler(base_url, latency)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stand-ins", daemon=True).start()
+    return server, base_url
+
+
+# ---------------------------------------------------------------------------
+# Driving sessions through app.main
+
+def _percentiles(values: List[float]) -> str:
+    if not values:
+        return "n/a"
+    ordered = sorted(values)
+    p = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    return f"p50 {p(0.5):7.0f} ms  p95 {p(0.95):7.0f} ms  p99 {p(0.99):7.0f} ms"
+
+def _rss_mb() -> Tuple[float, float]:
+    """Peak RSS of this process and of its largest reaped child process, in MB."""
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale)
+
+async def run_session(app, index: int, turns: int, shared_queries: bool,
+                      latencies: List[float], failures: List[str]):
+    import chainlit as cl
+    from chainlit.context import init_http_context
+    from chainlit.data import get_data_layer
+
+    context = init_http_context(thread_id=str(uuid.uuid4()))
+    data_layer = get_data_layer()
+    if data_layer is not None:
+        await data_layer.update_thread(context.session.thread_id, name=f"benchmark session {index}")
+    cl.user_session.set("chat_settings", {"model": BENCH_MODEL, "temperature": 0.5, "verbosity": 3,
+                                          "typewriter": False})
+    for turn in range(turns):
+        topic = "doctoral supervision and completion" if shared_queries else f"topic {index}-{turn}-{uuid.uuid4().hex[:6]}"
+        message = cl.Message(content=f"What does research say about {topic}?", author="User", type="user_message")
+        started = time.perf_counter()
+        await message.send()
+        await app.main(message)
+        latencies.append(time.perf_counter() - started)
+        history = cl.user_session.get("history")
+        if history is None or not history.messages or not isinstance(history.messages[-1], AIMessage):
+            failures.append(f"session {index} turn {turn}")
+
+async def benchmark(app, levels: List[int], turns: int, shared_queries: bool):
+    from tracing import metrics
+
+    # One warm-up turn (graph compilation, pools, imports) before measuring
+    await run_session(app, -1, 1, shared_queries, [], [])
+    for sessions in levels:
+        metrics.reset()
+        latencies: List[float] = []
+        failures: List[str] = []
+        started = time.perf_counter()
+        await asyncio.gather(*(run_session(app, i, turns, shared_queries, latencies, failures)
+                               for i in range(sessions)))
+        elapsed = time.perf_counter() - started
+        summary = metrics.summary()
+        own, children = _rss_mb()
+        print(f"\n{sessions:>4} sessions x {turns} turns | {len(latencies) / elapsed:6.2f} turns/s | "
+              f"failed turns {len(failures)} | peak RSS {own:.0f} MB (+{children:.0f} MB child processes)")
+        print(f"  end-to-end    {_percentiles(latencies)}")
+        for row in summary.get("ttft_seconds", []):
+            print(f"  ttft          p50 {row['p50'] * 1000:7.0f} ms  p95 {row['p95'] * 1000:7.0f} ms  "
+                  f"p99 {row['p99'] * 1000:7.0f} ms")
+        for name in ("llm_call_seconds", "tool_seconds", "db_query_seconds", "figure_render_seconds"):
+            for row in summary.get(name, []):
+                label = ",".join(f"{v}" for k, v in row["labels"].items() if k != "model") or "-"
+                print(f"  {name[:-8]:<14}{label[:20]:<21}n={row['count']:<5} p50 {row['p50'] * 1000:7.1f} ms  "
+                      f"p95 {row['p95'] * 1000:7.1f} ms  p99 {row['p99'] * 1000:7.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--turns", type=int, default=3, help="messages sent per session")
+    parser.add_argument("--token-rate", type=float, default=100.0, help="fake model tokens per second")
+    parser.add_argument("--ttft", type=float, default=0.2, help="fake model delay before its first chunk (s)")
+    parser.add_argument("--answer-tokens", type=int, default=150)
+    parser.add_argument("--service-latency", type=float, default=50.0, help="stand-in API latency (ms)")
+    parser.add_argument("--no-crawl", action="store_true", help="skip the page crawl step")
+    parser.add_argument("--python", action="store_true", help="add a python_repl step that draws a Plotly chart")
+    parser.add_argument("--shared-queries", action="store_true",
+                        help="every session asks the same question (measures the warm caches)")
+    args = parser.parse_args()
+
+    # app.main still streams with astream_events v1; keep the report readable
+    warnings.filterwarnings("ignore", message=".*astream_events version='v1'.*")
+    server, base_url = start_stand_ins(args.service_latency / 1000)
+    scratch = tempfile.mkdtemp(prefix="esi-bench-")
+    # Chainlit writes element files (.files/) and missing translations under its app root;
+    # give it a scratch root with the repo's config so runs leave the checkout untouched
+    app_root = os.path.join(scratch, "app")
+    os.makedirs(os.path.join(app_root, ".chainlit"))
+    shutil.copy(os.path.join(ROOT, ".chainlit", "config.toml"), os.path.join(app_root, ".chainlit"))
+    # Provider endpoints and storage paths are read at import time, so set them first
+    os.environ.update({
+        "TAVILY_API_URL": f"{base_url}/tavily",
+        "SEMANTIC_SCHOLAR_API_URL": f"{base_url}/s2",
+        "WIKIPEDIA_API_URL": f"{base_url}/wikipedia",
+        "TAVILY_API_KEY": os.getenv("TAVILY_API_KEY", "offline-benchmark"),
+        "SQLITE_PATH": os.path.join(scratch, "chainlit.db"),
+        "PAGE_CACHE_PATH": os.path.join(scratch, "page_cache.sqlite"),
+        "DATASET_DIR": os.path.join(scratch, "datasets"),
+        "DOCUMENT_DIR": os.path.join(scratch, "documents"),
+        "SEARCH_CACHE_SEMANTIC": "false",
+        "CHAINLIT_APP_ROOT": app_root,
+    })
+    # app.py registers the OAuth callback at import, which needs a provider configured
+    os.environ.setdefault("OAUTH_GOOGLE_CLIENT_ID", "offline-benchmark")
+    os.environ.setdefault("OAUTH_GOOGLE_CLIENT_SECRET", "offline-benchmark")
+    # The system prompt and thinking phrases are read relative to the working directory
+    os.chdir(ROOT)
+
+    steps: List[List[Tuple[str, Dict[str, Any]]]] = [
+        [("tavily_search", {"query": "{query}"}), ("semanticscholar", {"query": "{query}"})],
+        [("wikipedia", {"query": "{query}"})],
+    ]
+    if not args.no_crawl:
+        steps[1].append(("crawl4ai_scraper", {"url": f"{base_url}/pages/{{page}}"}))
+    if args.python:
+        steps.append([("python_repl", {"query": PLOT_CODE})])
+    llm = FakeStreamingChatModel(tool_steps=steps, answer_tokens=args.answer_tokens,
+                                 tokens_per_second=args.token_rate, first_token_latency=args.ttft)
+    summary_llm = FakeStreamingChatModel(answer_tokens=60, tokens_per_second=1000, first_token_latency=0)
+
+    import app
+    from agent import create_agent
+    from code_executor import close_code_pool, get_code_pool
+    from crawler import close_crawler_pool
+    from loop_bridge import stop_background_loop
+    from search_tools import close_search_clients
+
+    agent = create_agent(model=BENCH_MODEL, llm=llm)
+    # Every session uses the fake-model agent and summariser
+    app.get_agent = lambda **settings: agent
+    app.get_summary_llm = lambda model: summary_llm
+    app.load_thinking_phrases()
+    if args.python:
+        get_code_pool().warm()
+
+    print(f"Stand-ins at {base_url} ({args.service_latency:.0f} ms latency); fake model "
+          f"{args.token_rate:.0f} tok/s, {args.answer_tokens} tokens, TTFT {args.ttft * 1000:.0f} ms; "
+          f"tool steps: {' -> '.join('+'.join(name for name, _ in step) for step in steps)}")
+
+    async def run():
+        from chainlit.data import get_data_layer
+        try:
+            await benchmark(app, args.sessions, args.turns, args.shared_queries)
+        finally:
+            await close_search_clients()
+            await close_crawler_pool()
+            # Chainlit persists steps in fire-and-forget tasks; let them finish (and return their
+            # connections) before the pool is disposed and the loop closes
+            pending = asyncio.all_tasks() - {asyncio.current_task()}
+            if pending:
+                await asyncio.wait(pending, timeout=10)
+            data_layer = get_data_layer()
+            if data_layer is not None and hasattr(data_layer, "engine"):
+                await data_layer.engine.dispose()
+
+    try:
+        asyncio.run(run())
+    finally:
+        close_code_pool()
+        stop_background_loop()
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Import-time report for the server's modules (python -X importtime).
+
+Each module is imported in a fresh interpreter (best of --repeat runs). The
+report gives its cumulative import time, the slowest modules it imports
+directly, and the top-level packages that account for the most self time.
+Saved reports can be compared to catch start-up regressions, e.g. a
+provider SDK or crawl4ai being imported eagerly again.
+
+    python benchmarks/import_time.py                           # app and the modules it is built from
+    python benchmarks/import_time.py agent crawler --top 20
+    python benchmarks/import_time.py --save import_times.json
+    python benchmarks/import_time.py --compare import_times.json --tolerance 0.25   # exits 1 on regression
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+DEFAULT_MODULES = ["app", "agent", "crawler", "knowledge_base", "search_tools", "code_executor",
+                   "uploaded_data", "documents", "history", "data_layer", "tracing"]
+# Differences smaller than this are noise, whatever the relative change
+MIN_REGRESSION_MS = 20.0
+
+Entry = Tuple[str, int, float, float]  # name, depth, self ms, cumulative ms
+
+
+def parse_importtime(stderr: str) -> List[Entry]:
+    """Parse `-X importtime` lines into (name, depth, self ms, cumulative ms)."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        entries.append((name.strip(), depth, int(self_us) / 1000, int(cumulative_us) / 1000))
+    return entries
+
+def measure(module: str, repeat: int) -> Tuple[Optional[List[Entry]], str]:
+    """Import `module` in fresh interpreters; return the fastest run's entries (or None and the error)."""
+    # app.py registers its OAuth callback at import, which needs a provider configured
+    env = {"OAUTH_GOOGLE_CLIENT_ID": "import-time", "OAUTH_GOOGLE_CLIENT_SECRET": "import-time", **os.environ}
+    best, best_total = None, float("inf")
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                              cwd=ROOT, env=env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            error = [line for line in proc.stderr.splitlines() if not line.startswith("import time:")]
+            return None, error[-1] if error else f"exit code {proc.returncode}"
+        entries = parse_importtime(proc.stderr)
+        total = next((cum for name, depth, _, cum in entries if name == module and depth == 0), 0.0)
+        if total < best_total:
+            best, best_total = entries, total
+    return best, ""
+
+def children(entries: List[Entry], module: str) -> List[Entry]:
+    """Modules imported directly by `module` (output is post-order: children precede their parent)."""
+    end = next(i for i, (name, depth, _, _) in enumerate(entries) if name == module and depth == 0)
+    start = end
+    while start > 0 and entries[start - 1][1] > 0:
+        start -= 1
+    return [entry for entry in entries[start:end] if entry[1] == 1]
+
+def packages_by_self_time(entries: List[Entry]) -> List[Tuple[str, float]]:
+    totals: Dict[str, float] = defaultdict(float)
+    for name, _, self_ms, _ in entries:
+        totals[name.split(".")[0]] += self_ms
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per module (the fastest is kept)")
+    parser.add_argument("--top", type=int, default=10, help="rows shown per breakdown")
+    parser.add_argument("--save", help="write {module: cumulative ms} to this JSON file")
+    parser.add_argument("--compare", help="compare with a file written by --save")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slow-down")
+    args = parser.parse_args()
+
+    results: Dict[str, float] = {}
+    for module in args.modules:
+        entries, error = measure(module, args.repeat)
+        if entries is None:
+            print(f"\n{module}: import failed ({error})")
+            continue
+        total = next(cum for name, depth, _, cum in entries if name == module and depth == 0)
+        results[module] = round(total, 1)
+        print(f"\n{module}: {total:8.1f} ms cumulative")
+        print("  slowest direct imports:")
+        for name, _, _, cumulative in sorted(children(entries, module), key=lambda e: e[3], reverse=True)[:args.top]:
+            print(f"    {cumulative:8.1f} ms  {name}")
+        print("  packages by self time:")
+        for package, self_ms in packages_by_self_time(entries)[:args.top]:
+            print(f"    {self_ms:8.1f} ms  {package}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"\nSaved import times to {args.save}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = []
+        print(f"\nCompared with {args.compare}:")
+        for module, total in results.items():
+            if module not in baseline:
+                continue
+            before = baseline[module]
+            change = total - before
+            flag = ""
+            if change > MIN_REGRESSION_MS and total > before * (1 + args.tolerance):
+                regressions.append(module)
+                flag = "  REGRESSION"
+            print(f"  {module:<16}{before:8.1f} ms -> {total:8.1f} ms ({change:+.1f} ms){flag}")
+        if regressions:
+            print(f"\nImport time regressed for: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Offline check of the page cache against a local HTTP stand-in.
+
+A local server plays the origin site, so the ETag / Last-Modified
+revalidation path can be exercised without network access:
+
+- a stale entry whose ETag or Last-Modified still matches is revalidated with
+  a 304 and served from the cache;
+- a stale entry whose validator changed (the server answers 200) is a miss;
+- a stale entry without validators is a miss without any request;
+- a fresh entry is served without any request.
+
+It also reports the longest event-loop stall while a large page is stored
+and read back. Exits 1 if any check fails.
+
+    python benchmarks/page_cache_offline.py
+    python benchmarks/page_cache_offline.py --payload-mb 16
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from page_cache import PageCache
+
+LAST_MODIFIED = "Wed, 01 Oct 2025 08:00:00 GMT"
+
+
+class Origin(BaseHTTPRequestHandler):
+    """Answers conditional GETs the way a well-behaved origin server does."""
+    etags = {"/etag": '"v1"', "/changed": '"v2"'}
+    requests: list = []
+
+    def do_GET(self):
+        Origin.requests.append((self.path, dict(self.headers)))
+        etag = self.etags.get(self.path)
+        if etag and self.headers.get("If-None-Match") == etag:
+            return self._reply(304)
+        if self.path == "/last-modified" and self.headers.get("If-Modified-Since") == LAST_MODIFIED:
+            return self._reply(304)
+        self._reply(200, b"<html><body>page</body></html>")
+
+    def _reply(self, status: int, body: bytes = b""):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_origin() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Origin)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+async def max_loop_stall(coro) -> float:
+    """Run `coro` while a ticker measures the longest gap between event-loop turns."""
+    longest = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal longest
+        last = time.perf_counter()
+        while not done:
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            longest = max(longest, now - last)
+            last = now
+
+    task = asyncio.create_task(ticker())
+    try:
+        await coro
+    finally:
+        done = True
+        await task
+    return longest
+
+async def run(payload_mb: float) -> bool:
+    server = start_origin()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    failures = []
+
+    def check(name: str, ok: bool):
+        print(f"  {'ok  ' if ok else 'FAIL'} {name}")
+        if not ok:
+            failures.append(name)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # A negative TTL makes every entry stale as soon as it is written
+        stale = PageCache(os.path.join(tmp, "stale.sqlite"), default_ttl=-1, domain_ttls={})
+        payload = {"title": "page", "cleaned_html": "<p>page</p>"}
+
+        print("Revalidation:")
+        stale.put(f"{base}/etag", payload, headers={"ETag": '"v1"'})
+        Origin.requests.clear()
+        result = await stale.aget(f"{base}/etag")
+        check("matching ETag -> 304, served from cache", result == payload and stale.revalidated == 1)
+        check("If-None-Match sent", any(h.get("If-None-Match") == '"v1"' for _, h in Origin.requests))
+
+        stale.put(f"{base}/last-modified", payload, headers={"Last-Modified": LAST_MODIFIED})
+        Origin.requests.clear()
+        result = await stale.aget(f"{base}/last-modified")
+        check("matching Last-Modified -> 304, served from cache", result == payload and stale.revalidated == 2)
+        check("If-Modified-Since sent", any(h.get("If-Modified-Since") == LAST_MODIFIED for _, h in Origin.requests))
+
+        stale.put(f"{base}/changed", payload, headers={"ETag": '"v1"'})
+        check("changed ETag -> 200, cache miss", await stale.aget(f"{base}/changed") is None)
+
+        stale.put(f"{base}/plain", payload)
+        Origin.requests.clear()
+        check("no validators -> miss without a request",
+              await stale.aget(f"{base}/plain") is None and not Origin.requests)
+
+        fresh = PageCache(os.path.join(tmp, "fresh.sqlite"), default_ttl=3600, domain_ttls={})
+        fresh.put(f"{base}/etag", payload, headers={"ETag": '"v1"'})
+        Origin.requests.clear()
+        check("fresh entry -> hit without a request",
+              await fresh.aget(f"{base}/etag") == payload and not Origin.requests)
+
+        print("Event loop:")
+        big = {"title": "big", "cleaned_html": "x" * int(payload_mb * 1024 * 1024), "links": {"internal": []}}
+
+        async def store_and_read():
+            await fresh.aput(f"{base}/big", big)
+            assert (await fresh.aget(f"{base}/big"))["title"] == "big"
+
+        stall = await max_loop_stall(store_and_read())
+        print(f"  longest stall while storing and reading {payload_mb:g} MB: {stall * 1000:.1f} ms")
+
+    server.shutdown()
+    if failures:
+        print(f"\n{len(failures)} check(s) failed")
+    return not failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--payload-mb", type=float, default=8, help="size of the page used for the stall measurement")
+    args = parser.parse_args()
+    if not asyncio.run(run(args.payload_mb)):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+# Keeps codes like "NBS-7095x", "e.g." or "o'neill" together as single tokens
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_.'][a-z0-9]+)*")
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have i in is it its of on or that the this
+to was were what when where which who will with you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens; compound tokens also contribute their parts."""
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        parts = re.split(r"[-_.']", token)
+        if len(parts) > 1:
+            tokens.extend(p for p in parts if p and p not in STOPWORDS)
+    return tokens
+
+
+class BM25Index:
+    """A small persisted BM25 inverted index that supports incremental updates.
+
+    Only per-document term frequencies are persisted; the postings lists are
+    rebuilt in memory on load, which keeps updates (add/remove a document)
+    cheap and the file format simple.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_terms: Dict[str, Dict[str, int]] = {}
+        self.doc_len: Dict[str, int] = {}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.total_len = 0
+
+    def __len__(self) -> int:
+        return len(self.doc_terms)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.doc_terms
+
+    def add(self, doc_id: str, text: str):
+        """Index a document, replacing any previous version with the same id."""
+        if doc_id in self.doc_terms:
+            self.remove(doc_id)
+        tokens = tokenize(text)
+        terms = dict(Counter(tokens))
+        self.doc_terms[doc_id] = terms
+        self.doc_len[doc_id] = len(tokens)
+        self.total_len += len(tokens)
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+
+    def remove(self, doc_id: str):
+        """Drop a document from the index (no-op if it is not indexed)."""
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        self.total_len -= self.doc_len.pop(doc_id, 0)
+        for term in terms:
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(doc_id, None)
+                if not docs:
+                    del self.postings[term]
+
+    def remove_many(self, doc_ids: Iterable[str]):
+        for doc_id in doc_ids:
+            self.remove(doc_id)
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+        """Return up to top_k (doc_id, score) pairs, best first."""
+        n_docs = len(self.doc_terms)
+        if n_docs == 0:
+            return []
+        avg_len = self.total_len / n_docs or 1.0
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf in docs.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_len[doc_id] / avg_len)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+    def save(self, path: str):
+        """Persist the index atomically."""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "docs": self.doc_terms}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        """Load a saved index, or return an empty one if the file does not exist."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cls()
+        index = cls(k1=data.get("k1", 1.5), b=data.get("b", 0.75))
+        for doc_id, terms in data.get("docs", {}).items():
+            index.doc_terms[doc_id] = terms
+            length = sum(terms.values())
+            index.doc_len[doc_id] = length
+            index.total_len += length
+            for term, tf in terms.items():
+                index.postings.setdefault(term, {})[doc_id] = tf
+        return index
+
+    @classmethod
+    def from_collection(cls, collection, batch_size: int = 500) -> "BM25Index":
+        """Build an index from every document already stored in a Chroma collection."""
+        index = cls()
+        offset = 0
+        while True:
+            batch = collection.get(include=["documents"], limit=batch_size, offset=offset)
+            if not batch["ids"]:
+                break
+            for doc_id, text in zip(batch["ids"], batch["documents"]):
+                index.add(doc_id, text or "")
+            offset += len(batch["ids"])
+        return index
@@ -0,0 +1,285 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Type
+
+from langchain_core.tools import BaseTool
+from pydantic import BaseModel, Field
+
+from code_worker import worker_main
+from figures import capture_figure
+
+# Idle interpreters kept warm, ready to be handed to the next new session
+CODE_SPARE_WORKERS = int(os.getenv("CODE_SPARE_WORKERS", "2"))
+# Sessions holding their own interpreter at once; the least recently used idle one is evicted beyond this
+CODE_MAX_SESSIONS = int(os.getenv("CODE_MAX_SESSIONS", "8"))
+CODE_MAX_RUNS_PER_WORKER = int(os.getenv("CODE_MAX_RUNS_PER_WORKER", "100"))
+CODE_CPU_SECONDS = float(os.getenv("CODE_CPU_SECONDS", "30"))
+CODE_MEMORY_MB = int(os.getenv("CODE_MEMORY_MB", "4096"))
+CODE_WALL_TIMEOUT = float(os.getenv("CODE_WALL_TIMEOUT", "60"))
+# Time allowed for a new worker to import the scientific stack
+CODE_STARTUP_TIMEOUT = float(os.getenv("CODE_STARTUP_TIMEOUT", "120"))
+
+# Workers are spawned (not forked) so they don't inherit the server's threads and sockets
+_mp = multiprocessing.get_context("spawn")
+
+
+class _Worker:
+    """One pre-warmed interpreter process, owned by at most one session."""
+
+    def __init__(self):
+        self.conn, child_conn = _mp.Pipe()
+        self.process = _mp.Process(target=worker_main, args=(child_conn, CODE_MEMORY_MB), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.lock = threading.Lock()
+        self.runs = 0
+        self.ready = False
+
+    def wait_ready(self):
+        if not self.ready:
+            if not self.conn.poll(CODE_STARTUP_TIMEOUT):
+                raise TimeoutError("Code worker did not start in time")
+            self.conn.recv()
+            self.ready = True
+
+    def request(self, message: dict, timeout: Optional[float]) -> dict:
+        self.wait_ready()
+        self.conn.send(message)
+        if not self.conn.poll(timeout):
+            raise TimeoutError
+        return self.conn.recv()
+
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+    def kill(self):
+        try:
+            if self.process.is_alive():
+                self.conn.send({"op": "stop"})
+                self.process.join(1)
+        except Exception:
+            pass
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(5)
+        self.conn.close()
+
+
+class CodeExecutionPool:
+    """Per-session Python worker processes, handed out from pre-warmed spares.
+
+    Each active session gets an interpreter process of its own, so module
+    patches, options, the working directory and a long-running loop in one
+    chat never affect another. Every run has a CPU-time limit and a
+    wall-clock timeout, and each worker has an address-space limit. A worker
+    that times out, crashes or has served CODE_MAX_RUNS_PER_WORKER runs is
+    killed and only its own session loses state (its next run says so and
+    reloads its datasets). At most CODE_MAX_SESSIONS sessions hold a worker;
+    beyond that the least recently used idle session is evicted the same way.
+    """
+
+    def __init__(self, spares: int = CODE_SPARE_WORKERS, max_sessions: int = CODE_MAX_SESSIONS):
+        self.spares = max(0, spares)
+        self.max_sessions = max(1, max_sessions)
+        self._idle: List[_Worker] = []
+        # Session id -> its worker, least recently used first
+        self._sessions: "OrderedDict[str, _Worker]" = OrderedDict()
+        self._reset_sessions: set = set()
+        # Datasets each session has loaded, reloaded if its worker is replaced
+        self._session_paths: Dict[str, Dict[str, str]] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def warm(self):
+        """Top up the idle spares (imports happen in parallel in the children)."""
+        with self._lock:
+            if self._closed:
+                return
+            self._idle = [worker for worker in self._idle if worker.alive()]
+            missing = self.spares - len(self._idle)
+        # Starting a process takes a moment; don't hold the lock for it
+        started = [_Worker() for _ in range(max(0, missing))]
+        with self._lock:
+            if not self._closed:
+                self._idle.extend(started)
+                started = []
+        for worker in started:
+            worker.kill()
+
+    def _worker_for(self, session_id: str) -> _Worker:
+        evicted = []
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Code execution pool is closed")
+            worker = self._sessions.get(session_id)
+            if worker is not None and worker.alive():
+                self._sessions.move_to_end(session_id)
+                return worker
+            if worker is not None:
+                # Died outside a run (e.g. killed by the OS)
+                del self._sessions[session_id]
+                self._reset_sessions.add(session_id)
+            while len(self._sessions) >= self.max_sessions:
+                victim = next((sid for sid, w in self._sessions.items() if not w.lock.locked()), None)
+                if victim is None:
+                    break  # every worker is busy; go over the cap rather than wait
+                evicted.append(self._sessions.pop(victim))
+                self._reset_sessions.add(victim)
+            while self._idle and not self._idle[0].alive():
+                self._idle.pop(0).kill()
+            worker = self._idle.pop(0) if self._idle else _Worker()
+            self._sessions[session_id] = worker
+        for old in evicted:
+            old.kill()
+        self.warm()
+        return worker
+
+    def _replace(self, session_id: str, worker: _Worker):
+        """Kill a session's worker; its next run starts on a fresh one."""
+        with self._lock:
+            if self._sessions.get(session_id) is worker:
+                del self._sessions[session_id]
+                self._reset_sessions.add(session_id)
+        worker.kill()
+
+    def run(self, session_id: str, code: str, timeout: float = CODE_WALL_TIMEOUT,
+            cpu_seconds: float = CODE_CPU_SECONDS) -> Dict[str, Any]:
+        """Execute code in the session's interpreter; returns output, error flag and figures."""
+        worker = self._worker_for(session_id)
+        with worker.lock:
+            with self._lock:
+                was_reset = session_id in self._reset_sessions
+                self._reset_sessions.discard(session_id)
+                paths = self._session_paths.get(session_id)
+            note = "[Note: the Python session was restarted, so earlier variables are gone.]\n" if was_reset else ""
+            if was_reset and paths:
+                try:
+                    worker.request({"op": "load", "session": session_id, "paths": paths}, timeout=timeout)
+                    note += f"[Uploaded datasets were reloaded: {', '.join(paths)}]\n"
+                except Exception as e:
+                    print(f"Error reloading datasets: {e}")
+            try:
+                result = worker.request(
+                    {"op": "run", "session": session_id, "code": code, "cpu_seconds": cpu_seconds},
+                    timeout=timeout
+                )
+            except TimeoutError:
+                self._replace(session_id, worker)
+                return {"output": note + f"Execution timed out after {timeout:.0f}s and the interpreter was restarted.",
+                        "error": True, "figures": []}
+            except (EOFError, OSError, BrokenPipeError):
+                self._replace(session_id, worker)
+                return {"output": note + "The interpreter crashed (possibly out of memory) and was restarted.",
+                        "error": True, "figures": []}
+
+            worker.runs += 1
+            if worker.runs >= CODE_MAX_RUNS_PER_WORKER:
+                self._replace(session_id, worker)
+            result["output"] = note + result["output"]
+            return result
+
+    def set_values(self, session_id: str, values: Dict[str, Any]):
+        """Inject picklable values into a session's namespace."""
+        worker = self._worker_for(session_id)
+        with worker.lock:
+            worker.request({"op": "set", "session": session_id, "values": values}, timeout=CODE_WALL_TIMEOUT)
+
+    def load_datasets(self, session_id: str, paths: Dict[str, str]) -> Dict[str, Any]:
+        """Load memory-mapped Arrow files into a session as DataFrames ({variable name: path}).
+
+        Numeric columns without nulls share the mapped pages; other columns are converted.
+        """
+        worker = self._worker_for(session_id)
+        with self._lock:
+            self._session_paths.setdefault(session_id, {}).update(paths)
+        with worker.lock:
+            return worker.request({"op": "load", "session": session_id, "paths": paths},
+                                  timeout=CODE_WALL_TIMEOUT)
+
+    def reset_session(self, session_id: str):
+        """Drop a session's interpreter; its process is killed rather than reused."""
+        with self._lock:
+            worker = self._sessions.pop(session_id, None)
+            self._reset_sessions.discard(session_id)
+            self._session_paths.pop(session_id, None)
+        if worker is not None:
+            worker.kill()
+            self.warm()
+
+    def close(self):
+        """Stop all worker processes."""
+        with self._lock:
+            self._closed = True
+            workers = self._idle + list(self._sessions.values())
+            self._idle, self._sessions = [], OrderedDict()
+        for worker in workers:
+            worker.kill()
+
+
+_pool: Optional[CodeExecutionPool] = None
+_pool_lock = threading.Lock()
+
+def get_code_pool() -> CodeExecutionPool:
+    """Return the process-wide code execution pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool._closed:
+            _pool = CodeExecutionPool()
+        return _pool
+
+def close_code_pool():
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+
+
+_current_session: ContextVar[str] = ContextVar("code_session", default="default")
+
+def current_code_session() -> str:
+    """Id of the chat session whose interpreter code in this context runs in."""
+    return _current_session.get()
+
+@contextmanager
+def code_session(session_id: str):
+    """Run code executed within this context in the given session's interpreter."""
+    token = _current_session.set(session_id)
+    try:
+        yield
+    finally:
+        _current_session.reset(token)
+
+
+class PythonInput(BaseModel):
+    """Input for the Python execution tool."""
+    query: str = Field(description="Python code to execute")
+
+class PythonExecutionTool(BaseTool):
+    """Runs Python in an isolated, pre-warmed worker process with per-session state."""
+
+    name: str = "python_repl"
+    description: str = """
+    A Python interpreter for data manipulation, statistics and visualization.
+    Variables persist between calls in the same chat. pandas (pd), numpy (np), scipy,
+    scipy.stats (stats), statsmodels (sm, smf), plotly.express (px) and
+    plotly.graph_objects (go) are already imported. Use print(...) to see values;
+    the value of a final expression is also shown. Call fig.show() to display Plotly figures.
+    """
+    args_schema: Type[BaseModel] = PythonInput
+
+    def _run(self, query: str) -> str:
+        result = get_code_pool().run(current_code_session(), query)
+        for fig_json in result.get("figures", []):
+            capture_figure(fig_json)
+        output = result["output"].strip()
+        if result.get("figures"):
+            output += f"\n[{len(result['figures'])} figure(s) displayed to the user]"
+        return output or "Code executed successfully (no output)."
+
+    async def _arun(self, query: str) -> str:
+        # Waiting on the worker blocks; to_thread keeps the event loop (and context) free
+        return await asyncio.to_thread(self._run, query)
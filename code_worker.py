@@ -0,0 +1,170 @@
+"""Worker process for the code execution pool (see code_executor.py).
+
+Kept free of heavy top-level imports so the worker can cap thread counts and
+memory before the scientific stack is loaded.
+"""
+import ast
+import io
+import os
+import signal
+import sys
+import traceback
+from contextlib import redirect_stderr, redirect_stdout
+
+# Preloaded into every session namespace as (name, module)
+PRELOAD = [
+    ("np", "numpy"),
+    ("pd", "pandas"),
+    ("scipy", "scipy"),
+    ("stats", "scipy.stats"),
+    ("sm", "statsmodels.api"),
+    ("smf", "statsmodels.formula.api"),
+    ("px", "plotly.express"),
+    ("go", "plotly.graph_objects"),
+]
+MAX_OUTPUT_CHARS = 20000
+
+
+class CPUTimeExceeded(Exception):
+    pass
+
+
+def _on_sigxcpu(signum, frame):
+    raise CPUTimeExceeded("CPU time limit exceeded")
+
+
+def _set_limits(memory_mb: int):
+    try:
+        import resource
+    except ImportError:  # not available on Windows
+        return
+    if memory_mb:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    signal.signal(signal.SIGXCPU, _on_sigxcpu)
+
+
+def _cpu_limit(seconds: float):
+    """Allow `seconds` more CPU time from now (SIGXCPU is raised when it runs out)."""
+    try:
+        import resource
+    except ImportError:
+        return
+    used = resource.getrusage(resource.RUSAGE_SELF)
+    hard = resource.getrlimit(resource.RLIMIT_CPU)[1]
+    soft = resource.RLIM_INFINITY if not seconds else int(used.ru_utime + used.ru_stime + seconds) + 1
+    if hard != resource.RLIM_INFINITY and (soft == resource.RLIM_INFINITY or soft > hard):
+        soft = hard
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def sanitize_input(code: str) -> str:
+    """Strip markdown code fences and surrounding whitespace."""
+    code = code.strip()
+    if code.startswith("```"):
+        code = code.split("\n", 1)[1] if "\n" in code else ""
+        if code.rstrip().endswith("```"):
+            code = code.rstrip()[:-3]
+    return code.strip()
+
+
+def _execute(code: str, namespace: dict) -> None:
+    """Run code; like a REPL, echo the value of a trailing expression."""
+    tree = ast.parse(code, mode="exec")
+    last = None
+    if tree.body and isinstance(tree.body[-1], ast.Expr):
+        last = ast.Expression(tree.body.pop().value)
+    exec(compile(tree, "<session>", "exec"), namespace)
+    if last is not None:
+        value = eval(compile(last, "<session>", "eval"), namespace)
+        if value is not None:
+            print(repr(value))
+
+
+def worker_main(conn, memory_mb: int):
+    """Serve execution requests over `conn` until told to stop."""
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ.setdefault(var, "1")
+    _set_limits(memory_mb)
+
+    modules = {}
+    for alias, name in PRELOAD:
+        try:
+            modules[alias] = __import__(name, fromlist=["_"])
+        except Exception as e:
+            print(f"Code worker could not preload {name}: {e}", file=sys.stderr)
+
+    # fig.show() inside a run is collected and returned with the output
+    figures = []
+    try:
+        from plotly.basedatatypes import BaseFigure
+        from figures import encode_figure
+        BaseFigure.show = lambda self, *args, **kwargs: figures.append(encode_figure(self))
+    except Exception as e:
+        print(f"Code worker could not install figure capture: {e}", file=sys.stderr)
+
+    sessions = {}
+    conn.send({"ready": True, "pid": os.getpid()})
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        op = request.get("op")
+        if op == "stop":
+            return
+        if op == "reset":
+            sessions.pop(request["session"], None)
+            conn.send({"ok": True})
+            continue
+        if op == "load":
+            # Load converted datasets (uncompressed Arrow files) into the session namespace.
+            # One block per column lets numeric columns without nulls stay views of the
+            # mapped file instead of being copied into consolidated blocks; self_destruct
+            # frees the Arrow buffers of the columns that do need converting as it goes.
+            namespace = sessions.setdefault(request["session"], {"__name__": "__main__", **modules})
+            try:
+                from pyarrow import feather
+                for var, path in request["paths"].items():
+                    table = feather.read_table(path, memory_map=True)
+                    namespace[var] = table.to_pandas(split_blocks=True, self_destruct=True)
+                    del table
+                conn.send({"ok": True})
+            except Exception as e:
+                conn.send({"ok": False, "error": str(e)})
+            continue
+        if op == "set":
+            # Inject values (e.g. preloaded datasets) into a session namespace
+            namespace = sessions.setdefault(request["session"], {"__name__": "__main__", **modules})
+            namespace.update(request["values"])
+            conn.send({"ok": True})
+            continue
+
+        namespace = sessions.setdefault(request["session"], {"__name__": "__main__", **modules})
+        figures.clear()
+        buffer = io.StringIO()
+        error = False
+        _cpu_limit(request.get("cpu_seconds", 0))
+        try:
+            with redirect_stdout(buffer), redirect_stderr(buffer):
+                _execute(sanitize_input(request["code"]), namespace)
+        except CPUTimeExceeded:
+            error = True
+            buffer.write(f"\nCPUTimeExceeded: the code used more than {request.get('cpu_seconds')}s of CPU time")
+        except MemoryError:
+            error = True
+            buffer.write(f"\nMemoryError: the code exceeded the {memory_mb} MB memory limit")
+        except BaseException:
+            error = True
+            # Only show the frames from the user's code, not the worker's
+            etype, value, tb = sys.exc_info()
+            while tb is not None and tb.tb_frame.f_code.co_filename != "<session>":
+                tb = tb.tb_next
+            buffer.write("".join(traceback.format_exception(etype, value, tb)))
+        finally:
+            _cpu_limit(0)
+
+        output = buffer.getvalue()
+        if len(output) > MAX_OUTPUT_CHARS:
+            output = output[:MAX_OUTPUT_CHARS] + f"\n... [output truncated, {len(output)} chars total]"
+        conn.send({"output": output, "error": error, "figures": list(figures)})
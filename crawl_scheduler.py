@@ -0,0 +1,274 @@
+import asyncio
+import os
+import random
+import re
+import time
+import weakref
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from page_cache import normalize_url
+from tracing import metrics, record
+
+# Global crawl concurrency: starting point and bounds for the adaptive limit
+CRAWL_INITIAL_CONCURRENCY = int(os.getenv("CRAWL_INITIAL_CONCURRENCY", "4"))
+CRAWL_MIN_CONCURRENCY = int(os.getenv("CRAWL_MIN_CONCURRENCY", "1"))
+CRAWL_MAX_CONCURRENCY = int(os.getenv("CRAWL_MAX_CONCURRENCY", "10"))
+# Page loads slower than this (seconds, smoothed) make the limit back off
+CRAWL_TARGET_LATENCY = float(os.getenv("CRAWL_TARGET_LATENCY", "8"))
+# Politeness per host: parallel requests and minimum gap between request starts (seconds)
+CRAWL_DOMAIN_CONCURRENCY = int(os.getenv("CRAWL_DOMAIN_CONCURRENCY", "2"))
+CRAWL_DOMAIN_INTERVAL = float(os.getenv("CRAWL_DOMAIN_INTERVAL", "0.5"))
+# Deadline for one page load, and retries (with exponential backoff) after a failure
+CRAWL_URL_TIMEOUT = float(os.getenv("CRAWL_URL_TIMEOUT", "30"))
+CRAWL_RETRIES = int(os.getenv("CRAWL_RETRIES", "2"))
+CRAWL_BACKOFF_SECONDS = float(os.getenv("CRAWL_BACKOFF_SECONDS", "1"))
+
+# Failures that a retry will not fix: these HTTP statuses (from the result, or quoted as a
+# status in the error message) and unresolvable or malformed URLs
+_PERMANENT_STATUSES = {400, 401, 403, 404, 410, 451}
+_PERMANENT_ERROR_RE = re.compile(
+    r"\b(?:http(?:/[\d.]+)?|status(?:[ _]code)?)[\s:=]{0,3}(?:40[0134]|410|451)\b"
+    r"|invalid url|name or service not known",
+    re.IGNORECASE,
+)
+
+
+class AdaptiveLimiter:
+    """Concurrency limit adjusted AIMD-style from observed latency and errors.
+
+    Each fast, successful request raises the limit by 1/limit (about one per
+    round of requests); an error, timeout or a smoothed latency above the
+    target cuts it by 30%. Bound to one event loop.
+    """
+
+    def __init__(self, initial: int = CRAWL_INITIAL_CONCURRENCY, minimum: int = CRAWL_MIN_CONCURRENCY,
+                 maximum: int = CRAWL_MAX_CONCURRENCY, target_latency: float = CRAWL_TARGET_LATENCY):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(self.maximum, max(self.minimum, initial)))
+        self.target_latency = target_latency
+        self.latency: Optional[float] = None
+        self.in_flight = 0
+        self._waiters: List[asyncio.Future] = []
+
+    async def acquire(self):
+        while self.in_flight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        self.in_flight += 1
+
+    def release(self, latency: float, ok: bool):
+        """Free a slot and adapt the limit (synchronous, so it is safe during cancellation)."""
+        self.in_flight -= 1
+        self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+        if not ok or self.latency > self.target_latency:
+            self.limit = max(self.minimum, self.limit * 0.7)
+        else:
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+        metrics.observe("crawl_concurrency_limit", self.limit)
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+class _DomainGate:
+    """Per-host concurrency limit and minimum interval between request starts."""
+
+    def __init__(self, concurrency: int, interval: float):
+        self.semaphore = asyncio.Semaphore(max(1, concurrency))
+        self.interval = interval
+        self.users = 0                  # requests holding or waiting for a slot
+        self._next_start = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def idle(self) -> bool:
+        """No requests in or waiting, and the interval since the last start has passed."""
+        return self.users == 0 and time.monotonic() >= self._next_start
+
+    @asynccontextmanager
+    async def slot(self):
+        self.users += 1
+        try:
+            async with self.semaphore:
+                async with self._lock:
+                    wait = self._next_start - time.monotonic()
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                    self._next_start = time.monotonic() + self.interval
+                yield
+        finally:
+            self.users -= 1
+
+
+@dataclass
+class CrawlOutcome:
+    """One URL's final result (after retries), as yielded by CrawlScheduler.crawl."""
+    url: str
+    result: Any = None                  # what `fetch` returned, e.g. a PageResult
+    error: Optional[str] = None
+    attempts: int = 0
+    seconds: float = 0.0
+    from_cache: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _is_permanent(outcome: CrawlOutcome) -> bool:
+    """Whether a failed outcome is one a retry will not fix."""
+    if outcome.error is None:
+        return False
+    if getattr(outcome.result, "status_code", None) in _PERMANENT_STATUSES:
+        return True
+    return bool(_PERMANENT_ERROR_RE.search(outcome.error))
+
+def _failure(result: Any) -> Optional[str]:
+    """Error message of an unsuccessful fetch result (crawl4ai-style `success`/`error_message`)."""
+    if getattr(result, "success", True):
+        return None
+    return getattr(result, "error_message", None) or "crawl failed"
+
+
+class CrawlScheduler:
+    """Schedules page fetches across all batches on one event loop.
+
+    Requests share an adaptive global limit and per-host politeness gates,
+    each attempt has its own deadline, failed attempts are retried with
+    backoff, and duplicate URLs in a batch are fetched once.
+    """
+
+    def __init__(self):
+        self.limiter = AdaptiveLimiter()
+        self._domains: Dict[str, _DomainGate] = {}
+
+    def _gate(self, host: str) -> _DomainGate:
+        gate = self._domains.get(host)
+        if gate is None:
+            # Gates of hosts no longer being crawled carry no state worth keeping
+            for idle_host in [h for h, g in self._domains.items() if g.idle]:
+                del self._domains[idle_host]
+            gate = self._domains[host] = _DomainGate(CRAWL_DOMAIN_CONCURRENCY, CRAWL_DOMAIN_INTERVAL)
+        return gate
+
+    async def _fetch_one(self, url: str, fetch: Callable[[str], Awaitable[Any]],
+                         lookup: Optional[Callable[[str], Awaitable[Any]]],
+                         batch_limit: Optional[asyncio.Semaphore]) -> CrawlOutcome:
+        started = time.monotonic()
+        if lookup is not None:
+            cached = await lookup(url)
+            if cached is not None:
+                return CrawlOutcome(url, result=cached, attempts=0, from_cache=True,
+                                    seconds=time.monotonic() - started)
+
+        outcome = CrawlOutcome(url)
+        host = (urlsplit(url).hostname or "").lower()
+        for attempt in range(1, CRAWL_RETRIES + 2):
+            outcome.attempts = attempt
+            async with batch_limit or _no_limit():
+                # Host politeness first, so waiting on a busy host does not hold a global slot
+                async with self._gate(host).slot():
+                    await self.limiter.acquire()
+                    attempt_started = time.monotonic()
+                    status = "ok"
+                    try:
+                        result = await asyncio.wait_for(fetch(url), timeout=CRAWL_URL_TIMEOUT)
+                        outcome.result, outcome.error = result, _failure(result)
+                    except asyncio.TimeoutError:
+                        outcome.result, outcome.error = None, f"timed out after {CRAWL_URL_TIMEOUT:.0f}s"
+                        status = "timeout"
+                    except asyncio.CancelledError:
+                        # Cut off by the batch deadline: a hung load, not a fast success
+                        outcome.result, outcome.error = None, "cancelled"
+                        raise
+                    except Exception as e:
+                        outcome.result, outcome.error = None, str(e) or type(e).__name__
+                    finally:
+                        elapsed = time.monotonic() - attempt_started
+                        # A 404 says nothing about load; only transient failures slow the crawl down
+                        permanent = _is_permanent(outcome)
+                        self.limiter.release(elapsed, outcome.error is None or permanent)
+                    if outcome.error and status == "ok":
+                        status = "error"
+                    record("crawl_url", elapsed, result=status)
+
+            if outcome.error is None or permanent or attempt > CRAWL_RETRIES:
+                break
+            metrics.increment("crawl_retries")
+            # Exponential backoff with jitter, outside every slot
+            await asyncio.sleep(CRAWL_BACKOFF_SECONDS * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+        outcome.seconds = time.monotonic() - started
+        return outcome
+
+    async def crawl(self, urls: List[str], fetch: Callable[[str], Awaitable[Any]],
+                    lookup: Optional[Callable[[str], Awaitable[Any]]] = None,
+                    deadline: Optional[float] = None,
+                    max_concurrent: Optional[int] = None) -> AsyncIterator[CrawlOutcome]:
+        """Fetch URLs, yielding each outcome as soon as it is final.
+
+        `lookup` returns an already cached result (or None) and bypasses the
+        limits. URLs still running at `deadline` (seconds from now) are
+        cancelled and yielded with an error. Duplicates (after URL
+        normalisation) are fetched once, for their first spelling.
+        """
+        unique: Dict[str, str] = {}
+        for url in urls:
+            unique.setdefault(normalize_url(url), url)
+        batch_limit = asyncio.Semaphore(max_concurrent) if max_concurrent else None
+        tasks = {asyncio.ensure_future(self._fetch_one(url, fetch, lookup, batch_limit)): url
+                 for url in unique.values()}
+        ends_at = time.monotonic() + deadline if deadline is not None else None
+        try:
+            pending = set(tasks)
+            while pending:
+                timeout = None if ends_at is None else max(0.0, ends_at - time.monotonic())
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    # A fetch that failed outside its per-attempt handling (e.g. in the cache
+                    # lookup) is reported like any other failed URL instead of ending the batch
+                    if task.cancelled():
+                        yield CrawlOutcome(tasks[task], error="cancelled")
+                    elif task.exception() is not None:
+                        error = task.exception()
+                        yield CrawlOutcome(tasks[task], error=str(error) or type(error).__name__)
+                    else:
+                        yield task.result()
+                if not done:
+                    for task in pending:
+                        task.cancel()
+                    # Let the cancelled fetches unwind (and release what they hold) before reporting them
+                    await asyncio.gather(*pending, return_exceptions=True)
+                    for task in pending:
+                        yield CrawlOutcome(tasks[task], error="not finished before the batch deadline",
+                                           seconds=deadline or 0.0)
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+@asynccontextmanager
+async def _no_limit():
+    yield
+
+
+# Limits are bound to the event loop they were created on, so keep one scheduler per loop
+_schedulers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, CrawlScheduler]" = weakref.WeakKeyDictionary()
+
+def get_crawl_scheduler() -> CrawlScheduler:
+    """Return the crawl scheduler of the running event loop, creating it lazily."""
+    loop = asyncio.get_running_loop()
+    scheduler = _schedulers.get(loop)
+    if scheduler is None:
+        scheduler = _schedulers[loop] = CrawlScheduler()
+    return scheduler
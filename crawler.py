@@ -1,10 +1,205 @@
 import asyncio
-from crawl4ai import AsyncWebCrawler
-from crawl4ai.extraction_strategy import LLMExtractionStrategy
-from langchain.tools import BaseTool
-from typing import Optional, Type, Dict, Any
+import os
+import weakref
+from contextlib import AsyncExitStack, asynccontextmanager
+from dataclasses import dataclass
+from langchain_core.tools import BaseTool
+from typing import TYPE_CHECKING, Optional, Type, Dict, Any
 from pydantic import BaseModel, Field
 import json
+from page_cache import get_page_cache
+from loop_bridge import run_sync, on_background_shutdown
+from tracing import annotate, metrics
+from crawl_scheduler import get_crawl_scheduler
+from tool_runtime import turn_time_remaining
+
+# crawl4ai (and Playwright behind it) is imported when the first browser is launched
+if TYPE_CHECKING:
+    from crawl4ai import AsyncWebCrawler
+
+# Number of warm browser instances kept per event loop
+CRAWLER_POOL_SIZE = int(os.getenv("CRAWLER_POOL_SIZE", "2"))
+# Upper bound (seconds) a sync caller waits for a crawler tool
+CRAWLER_TOOL_TIMEOUT = float(os.getenv("CRAWLER_TOOL_TIMEOUT", "120"))
+# Seconds before the tool or turn deadline at which a batch returns what has finished
+CRAWL_BATCH_MARGIN = float(os.getenv("CRAWL_BATCH_MARGIN", "5"))
+
+
+def _is_healthy(crawler: "AsyncWebCrawler") -> bool:
+    """Best-effort check that a pooled crawler's browser is still usable."""
+    if not getattr(crawler, "ready", True):
+        return False
+    strategy = getattr(crawler, "crawler_strategy", None)
+    browser_manager = getattr(strategy, "browser_manager", None)
+    browser = getattr(browser_manager, "browser", None)
+    if browser is not None and hasattr(browser, "is_connected"):
+        return browser.is_connected()
+    return True
+
+
+class CrawlerPool:
+    """Pool of warm AsyncWebCrawler instances shared by all crawler tools.
+
+    Browsers are launched lazily on first use and returned to the pool after
+    each crawl, so a tool call only pays for a page load instead of a full
+    Chromium start-up. At most `size` crawlers exist at once; extra callers wait.
+    """
+
+    def __init__(self, size: int = CRAWLER_POOL_SIZE):
+        self.size = max(1, size)
+        self._semaphore = asyncio.Semaphore(self.size)
+        self._idle: list["AsyncWebCrawler"] = []
+        # ids of borrowed crawlers to close instead of reuse when they come back
+        self._invalid: set = set()
+        self._closed = False
+
+    async def _launch(self) -> "AsyncWebCrawler":
+        from crawl4ai import AsyncWebCrawler
+        crawler = AsyncWebCrawler(verbose=True)
+        await crawler.__aenter__()
+        return crawler
+
+    async def _discard(self, crawler: "AsyncWebCrawler"):
+        try:
+            await crawler.__aexit__(None, None, None)
+        except Exception as e:
+            print(f"Error closing crawler: {e}")
+
+    @asynccontextmanager
+    async def acquire(self):
+        """Borrow a healthy crawler for the duration of the `async with` block."""
+        if self._closed:
+            raise RuntimeError("Crawler pool is closed")
+        async with self._semaphore:
+            crawler = None
+            while self._idle:
+                candidate = self._idle.pop()
+                if _is_healthy(candidate):
+                    crawler = candidate
+                    break
+                print("Discarding unhealthy pooled crawler")
+                await self._discard(candidate)
+            if crawler is None:
+                crawler = await self._launch()
+
+            reusable = False
+            try:
+                yield crawler
+                reusable = True
+            finally:
+                # A crawler that raised may have a broken browser; replace it
+                if id(crawler) in self._invalid:
+                    self._invalid.discard(id(crawler))
+                    reusable = False
+                if reusable and not self._closed and _is_healthy(crawler):
+                    self._idle.append(crawler)
+                else:
+                    await self._discard(crawler)
+
+    def invalidate(self, crawler: "AsyncWebCrawler"):
+        """Close a borrowed crawler when it is released (e.g. it has a cancelled page load in flight)."""
+        self._invalid.add(id(crawler))
+
+    async def warm(self, count: Optional[int] = None):
+        """Launch browsers ahead of time so the first tool calls don't pay for it."""
+        count = min(self.size, count or self.size)
+        missing = count - len(self._idle)
+        if missing > 0 and not self._closed:
+            crawlers = await asyncio.gather(*[self._launch() for _ in range(missing)])
+            self._idle.extend(crawlers)
+
+    async def close(self):
+        """Close all idle browsers; crawlers still in use are closed when released."""
+        self._closed = True
+        idle, self._idle = self._idle, []
+        await asyncio.gather(*[self._discard(c) for c in idle])
+
+
+# Crawlers are bound to the event loop they were started on, so keep one pool per loop
+_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, CrawlerPool]" = weakref.WeakKeyDictionary()
+
+def get_crawler_pool() -> CrawlerPool:
+    """Return the crawler pool for the running event loop, creating it lazily."""
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None or pool._closed:
+        pool = CrawlerPool()
+        _pools[loop] = pool
+    return pool
+
+async def close_crawler_pool():
+    """Close the crawler pool of the running event loop, if one was created."""
+    pool = _pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool.close()
+
+# Sync tool calls run on the shared background loop; close its browsers when it stops
+on_background_shutdown(close_crawler_pool)
+
+@dataclass
+class PageResult:
+    """The parts of a crawl result the tools use, whether fresh or from the page cache."""
+    url: str
+    success: bool
+    title: Optional[str] = None
+    cleaned_html: str = ""
+    markdown: Optional[str] = None
+    links: Any = None
+    media: Any = None
+    extracted_content: Optional[str] = None
+    error_message: Optional[str] = None
+    status_code: Optional[int] = None
+    from_cache: bool = False
+
+async def cached_page(url: str, css_selector: Optional[str] = None,
+                      variant: Optional[str] = None) -> Optional[PageResult]:
+    """Return the page from the page cache, or None on a miss."""
+    cached = await get_page_cache().aget(url, css_selector, variant)
+    annotate(cache="hit" if cached is not None else "miss")
+    metrics.increment("page_cache", result="hit" if cached is not None else "miss")
+    if cached is None:
+        return None
+    return PageResult(url=url, success=True, from_cache=True, **cached)
+
+async def crawl_page(url: str, css_selector: Optional[str] = None,
+                     crawler: Optional["AsyncWebCrawler"] = None,
+                     variant: Optional[str] = None, **crawl_kwargs) -> PageResult:
+    """Crawl a page and store a successful result in the page cache."""
+    if crawler is None:
+        async with get_crawler_pool().acquire() as pooled:
+            result = await pooled.arun(url=url, css_selector=css_selector, **crawl_kwargs)
+    else:
+        result = await crawler.arun(url=url, css_selector=css_selector, **crawl_kwargs)
+
+    if not result.success:
+        return PageResult(url=url, success=False, error_message=result.error_message,
+                          status_code=getattr(result, "status_code", None))
+
+    payload = {
+        "title": result.title,
+        "cleaned_html": result.cleaned_html or "",
+        "markdown": str(result.markdown) if result.markdown else None,
+        "links": result.links,
+        "media": result.media,
+        "extracted_content": getattr(result, "extracted_content", None),
+    }
+    await get_page_cache().aput(url, payload, css_selector=css_selector, variant=variant,
+                                headers=getattr(result, "response_headers", None))
+    return PageResult(url=url, success=True, **payload)
+
+async def fetch_page(url: str, css_selector: Optional[str] = None,
+                     crawler: Optional["AsyncWebCrawler"] = None,
+                     variant: Optional[str] = None, **crawl_kwargs) -> PageResult:
+    """Fetch a page through the page cache, crawling it only on a miss.
+
+    `variant` distinguishes results of the same URL that depend on extra
+    inputs (e.g. an LLM extraction prompt). If no crawler is given one is
+    borrowed from the pool.
+    """
+    cached = await cached_page(url, css_selector, variant)
+    if cached is not None:
+        return cached
+    return await crawl_page(url, css_selector, crawler=crawler, variant=variant, **crawl_kwargs)
 
 class Crawl4AIInput(BaseModel):
     """Input for the Crawl4AI scraper tool."""
@@ -29,30 +224,29 @@ class SimpleCrawl4AITool(BaseTool):
              extraction_strategy: str = "text", word_count_threshold: int = 10,
              only_text: bool = True) -> str:
         """Execute web scraping with Crawl4AI."""
-        return asyncio.run(self._arun(url, css_selector, extraction_strategy, word_count_threshold, only_text))
+        return run_sync(self._arun(url, css_selector, extraction_strategy, word_count_threshold, only_text), timeout=CRAWLER_TOOL_TIMEOUT)
     
     async def _arun(self, url: str, css_selector: Optional[str] = None,
                    extraction_strategy: str = "text", word_count_threshold: int = 10,
                    only_text: bool = True) -> str:
         """Async web scraping with Crawl4AI."""
         try:
-            async with AsyncWebCrawler(verbose=True) as crawler:
-                result = await crawler.arun(
-                    url=url,
-                    css_selector=css_selector,
-                    word_count_threshold=word_count_threshold,
-                    only_text=only_text
-                )
-                
-                if result.success:
-                    if extraction_strategy == "markdown":
-                        return result.markdown
-                    elif extraction_strategy == "structured":
-                        return f"Title: {result.title}\n\nContent: {result.cleaned_html[:2000]}..."
-                    else:
-                        return result.cleaned_html
+            result = await fetch_page(
+                url,
+                css_selector=css_selector,
+                word_count_threshold=word_count_threshold,
+                only_text=only_text
+            )
+            
+            if result.success:
+                if extraction_strategy == "markdown":
+                    return result.markdown
+                elif extraction_strategy == "structured":
+                    return f"Title: {result.title}\n\nContent: {result.cleaned_html}"
                 else:
-                    return f"Failed to scrape {url}: {result.error_message}"
+                    return result.cleaned_html
+            else:
+                return f"Failed to scrape {url}: {result.error_message}"
                     
         except Exception as e:
             return f"Error scraping with Crawl4AI: {str(e)}"
@@ -71,32 +265,31 @@ class AdvancedCrawl4AITool(BaseTool):
     def _run(self, url: str, css_selector: Optional[str] = None,
              extraction_strategy: str = "text", word_count_threshold: int = 10,
              only_text: bool = True) -> str:
-        return asyncio.run(self._arun(url, css_selector, extraction_strategy, word_count_threshold, only_text))
+        return run_sync(self._arun(url, css_selector, extraction_strategy, word_count_threshold, only_text), timeout=CRAWLER_TOOL_TIMEOUT)
     
     async def _arun(self, url: str, css_selector: Optional[str] = None,
                    extraction_strategy: str = "text", word_count_threshold: int = 10,
                    only_text: bool = True) -> str:
         try:
-            async with AsyncWebCrawler(verbose=True) as crawler:
-                # Basic extraction
-                result = await crawler.arun(
-                    url=url,
-                    css_selector=css_selector,
-                    word_count_threshold=word_count_threshold,
-                    only_text=only_text
-                )
-                
-                if result.success:
-                    return {
-                        "url": url,
-                        "title": result.title,
-                        "content": result.cleaned_html[:3000],
-                        "markdown": result.markdown[:3000] if result.markdown else None,
-                        "links": result.links,
-                        "media": result.media
-                    }
-                else:
-                    return f"Failed to scrape {url}: {result.error_message}"
+            # Basic extraction
+            result = await fetch_page(
+                url,
+                css_selector=css_selector,
+                word_count_threshold=word_count_threshold,
+                only_text=only_text
+            )
+            
+            if result.success:
+                return {
+                    "url": url,
+                    "title": result.title,
+                    # One copy of the page text; markdown keeps headings and lists
+                    "content": result.markdown or result.cleaned_html,
+                    "links": result.links,
+                    "media": result.media
+                }
+            else:
+                return f"Failed to scrape {url}: {result.error_message}"
                     
         except Exception as e:
             return f"Error in advanced scraping: {str(e)}"
@@ -117,10 +310,12 @@ class SmartExtractionTool(BaseTool):
     args_schema: Type[BaseModel] = SmartExtractionInput
     
     def _run(self, url: str, extraction_prompt: str) -> str:
-        return asyncio.run(self._arun(url, extraction_prompt))
+        return run_sync(self._arun(url, extraction_prompt), timeout=CRAWLER_TOOL_TIMEOUT)
     
     async def _arun(self, url: str, extraction_prompt: str) -> str:
         try:
+            from crawl4ai.extraction_strategy import LLMExtractionStrategy
+
             # Create extraction strategy
             extraction_strategy = LLMExtractionStrategy(
                 provider="openai/gpt-4",
@@ -128,20 +323,50 @@ class SmartExtractionTool(BaseTool):
                 instruction=extraction_prompt
             )
             
-            async with AsyncWebCrawler(verbose=True) as crawler:
-                result = await crawler.arun(
-                    url=url,
-                    extraction_strategy=extraction_strategy
-                )
-                
-                if result.success:
-                    return result.extracted_content
-                else:
-                    return f"Failed to extract from {url}: {result.error_message}"
+            # The extraction prompt is part of the cache key: same page, different question
+            result = await fetch_page(
+                url,
+                variant=f"extract:{extraction_prompt}",
+                extraction_strategy=extraction_strategy
+            )
+            
+            if result.success:
+                return result.extracted_content
+            else:
+                return f"Failed to extract from {url}: {result.error_message}"
                     
         except Exception as e:
             return f"Error in smart extraction: {str(e)}"
 
+class _BatchCrawler:
+    """Borrows a pooled crawler on a batch's first cache miss and returns it when the batch ends.
+
+    A batch answered entirely from the page cache never touches a browser.
+    If a page load is cancelled (per-URL timeout or batch deadline) the
+    crawler is closed on return rather than reused with a hung page.
+    """
+
+    def __init__(self):
+        self._stack = AsyncExitStack()
+        self._crawler: Optional["AsyncWebCrawler"] = None
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self) -> "_BatchCrawler":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._stack.aclose()
+
+    async def crawl(self, url: str) -> PageResult:
+        async with self._lock:
+            if self._crawler is None:
+                self._crawler = await self._stack.enter_async_context(get_crawler_pool().acquire())
+        try:
+            return await crawl_page(url, crawler=self._crawler)
+        except asyncio.CancelledError:
+            get_crawler_pool().invalidate(self._crawler)
+            raise
+
 # Batch processing tool
 class BatchCrawl4AITool(BaseTool):
     """Batch web scraper for multiple URLs."""
@@ -149,40 +374,46 @@ class BatchCrawl4AITool(BaseTool):
     name: str = "batch_crawl4ai"
     description: str = """
     Scrapes multiple URLs efficiently using Crawl4AI.
-    Returns structured data from all URLs.
+    Duplicate URLs are fetched once; pages are returned in the order they finish,
+    and URLs that could not be fetched in time are listed with an error.
     """
     
     class BatchInput(BaseModel):
         urls: list[str] = Field(description="List of URLs to scrape")
-        max_concurrent: int = Field(default=3, description="Maximum concurrent requests")
+        max_concurrent: Optional[int] = Field(default=None, description="Optional cap on concurrent requests (adapted automatically by default)")
         
     args_schema: Type[BaseModel] = BatchInput
     
-    def _run(self, urls: list[str], max_concurrent: int = 3) -> str:
-        return asyncio.run(self._arun(urls, max_concurrent))
+    def _run(self, urls: list[str], max_concurrent: Optional[int] = None) -> str:
+        return run_sync(self._arun(urls, max_concurrent), timeout=CRAWLER_TOOL_TIMEOUT)
     
-    async def _arun(self, urls: list[str], max_concurrent: int = 3) -> str:
+    async def _arun(self, urls: list[str], max_concurrent: Optional[int] = None) -> str:
         try:
-            async with AsyncWebCrawler(verbose=True) as crawler:
-                # Create semaphore for concurrency control
-                semaphore = asyncio.Semaphore(max_concurrent)
-                
-                async def scrape_url(url):
-                    async with semaphore:
-                        result = await crawler.arun(url=url)
-                        return {
-                            "url": url,
-                            "success": result.success,
-                            "title": result.title if result.success else None,
-                            "content": result.cleaned_html[:1000] if result.success else None,
-                            "error": result.error_message if not result.success else None
-                        }
-                
-                # Process all URLs
-                tasks = [scrape_url(url) for url in urls]
-                results = await asyncio.gather(*tasks)
-                
-                return json.dumps(results, indent=2)
+            # Return before the caller gives up on the whole batch, so finished pages are kept
+            deadline = CRAWLER_TOOL_TIMEOUT - CRAWL_BATCH_MARGIN
+            remaining = turn_time_remaining()
+            if remaining is not None:
+                deadline = min(deadline, remaining - CRAWL_BATCH_MARGIN)
+
+            results = []
+            # The scheduler sets the pace; one browser serves the batch's cache misses as separate pages
+            async with _BatchCrawler() as batch_crawler:
+                async for outcome in get_crawl_scheduler().crawl(
+                        urls, batch_crawler.crawl, lookup=cached_page,
+                        deadline=max(0.0, deadline), max_concurrent=max_concurrent):
+                    page = outcome.result
+                    results.append({
+                        "url": outcome.url,
+                        "success": outcome.ok,
+                        "title": page.title if outcome.ok else None,
+                        "content": page.cleaned_html if outcome.ok else None,
+                        "error": outcome.error,
+                    })
+
+            skipped = len(urls) - len(results)
+            if skipped:
+                print(f"batch_crawl4ai: skipped {skipped} duplicate URL(s)")
+            return json.dumps(results, indent=2)
                 
         except Exception as e:
             return f"Error in batch scraping: {str(e)}"
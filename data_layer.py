@@ -0,0 +1,101 @@
+"""Chainlit data layer with tuned SQLite (default) or Postgres (DATABASE_URL) storage.
+
+SQLite connections are put in WAL mode with synchronous=NORMAL, a busy
+timeout and memory-mapped I/O, so streamed step writes from concurrent
+sessions wait briefly for the writer lock instead of failing with
+"database is locked". Setting DATABASE_URL to a postgres:// URL switches to
+Postgres through asyncpg; create the schema there with Chainlit's
+documented SQL before first use.
+"""
+import os
+from typing import Optional
+
+from chainlit.data.sql_alchemy import SQLAlchemyDataLayer
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from tracing import span
+
+DATABASE_URL = os.getenv("DATABASE_URL", "")
+SQLITE_PATH = os.getenv("SQLITE_PATH", os.path.join("data", "chainlit_app.db"))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Recycle server connections before typical idle timeouts (Postgres only)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_BYTES = int(os.getenv("SQLITE_MMAP_BYTES", str(256 * 1024 * 1024)))
+SQLITE_CACHE_KB = int(os.getenv("SQLITE_CACHE_KB", "16384"))
+
+
+def database_url(url: Optional[str] = None) -> str:
+    """Resolve the async SQLAlchemy URL to use (DATABASE_URL, else the local SQLite file)."""
+    url = url or DATABASE_URL
+    if not url:
+        return f"sqlite+aiosqlite:///{SQLITE_PATH}"
+    if url.startswith(("postgres://", "postgresql://")):
+        return "postgresql+asyncpg://" + url.split("://", 1)[1]
+    return url
+
+def is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode = WAL")
+    cursor.execute("PRAGMA synchronous = NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_BYTES}")
+    cursor.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_KB}")
+    cursor.execute("PRAGMA temp_store = MEMORY")
+    cursor.execute("PRAGMA foreign_keys = ON")
+    cursor.close()
+
+def create_engine(url: str) -> AsyncEngine:
+    """Create a pooled async engine tuned for the backend."""
+    if is_sqlite(url):
+        engine = create_async_engine(
+            url,
+            # sqlite3's own lock wait, in seconds (busy_timeout covers the rest)
+            connect_args={"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+        event.listen(engine.sync_engine, "connect", _set_sqlite_pragmas)
+        return engine
+    return create_async_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+
+class TracedSQLAlchemyDataLayer(SQLAlchemyDataLayer):
+    """SQLAlchemyDataLayer that records every statement as a `db_query` span."""
+
+    async def execute_sql(self, query: str, parameters: dict):
+        with span("db_query", op=query.split(None, 1)[0].upper() if query.strip() else "?"):
+            return await super().execute_sql(query, parameters)
+
+
+def create_data_layer(url: Optional[str] = None) -> SQLAlchemyDataLayer:
+    """Build the Chainlit SQLAlchemy data layer on a tuned engine."""
+    url = database_url(url)
+    if is_sqlite(url):
+        # Create the schema, or apply pending migrations (a no-op when up to date)
+        from manual_sqlite_creator import migrate
+        db_path = url.split(":///", 1)[1]
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        migrate(db_path)
+
+    data_layer = TracedSQLAlchemyDataLayer(conninfo=url)
+    # SQLAlchemyDataLayer only takes connect_args; swap in the tuned engine and pool. Its
+    # default engine has not opened any connections yet, so its pool can be dropped synchronously
+    data_layer.engine.sync_engine.dispose()
+    data_layer.engine = create_engine(url)
+    data_layer.async_session = sessionmaker(bind=data_layer.engine, expire_on_commit=False, class_=AsyncSession)
+    return data_layer
@@ -0,0 +1,310 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple, Type
+
+from langchain_core.tools import BaseTool
+from pydantic import BaseModel, Field
+
+from bm25_index import BM25Index
+from code_executor import current_code_session
+
+# Parsed chunks are cached here by content hash, so re-uploads are not parsed again
+DOCUMENT_DIR = os.getenv("DOCUMENT_DIR", os.path.join("cache", "documents"))
+DOCUMENT_EXTENSIONS = (".pdf", ".docx", ".md", ".markdown", ".txt")
+DOC_CHUNK_CHARS = int(os.getenv("DOC_CHUNK_CHARS", "2500"))
+DOC_TOP_K = int(os.getenv("DOC_TOP_K", "5"))
+# Most text returned by a single tool call
+DOC_MAX_RETURN_CHARS = int(os.getenv("DOC_MAX_RETURN_CHARS", "12000"))
+
+_HEADING_RE = re.compile(r"^#{1,6}\s+(.*)")
+
+
+def is_document(file_name: str) -> bool:
+    return file_name.lower().endswith(DOCUMENT_EXTENSIONS)
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def iter_units(path: str, file_name: str) -> Iterator[Tuple[str, str]]:
+    """Yield (label, text) one page (PDF) or section (DOCX, Markdown) at a time."""
+    ext = os.path.splitext(file_name.lower())[1]
+    if ext == ".pdf":
+        from pypdf import PdfReader
+        reader = PdfReader(path)
+        # Pages are parsed on access, so only one page's text is held at a time
+        for number, page in enumerate(reader.pages, 1):
+            yield f"page {number}", page.extract_text() or ""
+    elif ext == ".docx":
+        from docx import Document
+        label, lines = "start", []
+        for paragraph in Document(path).paragraphs:
+            if paragraph.style is not None and paragraph.style.name.lower().startswith(("heading", "title")) \
+                    and paragraph.text.strip():
+                if any(line.strip() for line in lines):
+                    yield label, "\n".join(lines)
+                label, lines = paragraph.text.strip(), []
+            lines.append(paragraph.text)
+        if any(line.strip() for line in lines):
+            yield label, "\n".join(lines)
+    else:
+        label, lines = "start", []
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                match = _HEADING_RE.match(line)
+                if match:
+                    if any(l.strip() for l in lines):
+                        yield label, "".join(lines)
+                    label, lines = match.group(1).strip(), []
+                lines.append(line)
+        if any(l.strip() for l in lines):
+            yield label, "".join(lines)
+
+def split_text(text: str, max_chars: int = DOC_CHUNK_CHARS) -> List[str]:
+    """Pack paragraphs into chunks of at most max_chars (long paragraphs are cut)."""
+    chunks, current = [], ""
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        while len(paragraph) > max_chars:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(paragraph[:max_chars])
+            paragraph = paragraph[max_chars:]
+        if current and len(current) + len(paragraph) + 2 > max_chars:
+            chunks.append(current)
+            current = ""
+        if paragraph:
+            current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+@dataclass
+class UploadedDocument:
+    """A parsed upload: chunks on disk (JSONL) and their byte offsets in memory."""
+    source: str
+    path: str                                    # chunks.jsonl
+    offsets: List[int] = field(default_factory=list)
+    labels: List[str] = field(default_factory=list)  # page/section label of each chunk
+    unit_count: int = 0                               # pages/sections, including ones without text
+
+    @property
+    def units(self) -> List[str]:
+        """Distinct page/section labels in document order."""
+        return list(dict.fromkeys(self.labels))
+
+    def iter_chunks(self) -> Iterator[Tuple[int, dict]]:
+        with open(self.path, "r", encoding="utf-8") as f:
+            for i, line in enumerate(f):
+                yield i, json.loads(line)
+
+    def chunk(self, i: int) -> dict:
+        """Read one chunk from disk."""
+        with open(self.path, "rb") as f:
+            f.seek(self.offsets[i])
+            return json.loads(f.readline().decode("utf-8"))
+
+
+class DocumentStore:
+    """Parses uploaded documents page by page into chunk files cached by content hash."""
+
+    def __init__(self, root: str = DOCUMENT_DIR):
+        self.root = root
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _lock_for(self, digest: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(digest, threading.Lock())
+
+    def ingest(self, path: str, file_name: str) -> UploadedDocument:
+        """Parse an uploaded document (or reuse an earlier parse)."""
+        digest = _file_sha256(path)
+        directory = os.path.join(self.root, digest)
+        chunks_path = os.path.join(directory, "chunks.jsonl")
+        meta_path = os.path.join(directory, "meta.json")
+        with self._lock_for(digest):
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                os.makedirs(directory, exist_ok=True)
+                meta = {"offsets": [], "labels": [], "units": 0}
+                tmp_path = chunks_path + ".tmp"
+                # Binary mode so offsets are byte positions usable with seek()
+                with open(tmp_path, "wb") as f:
+                    for label, text in iter_units(path, file_name):
+                        meta["units"] += 1
+                        for text_chunk in split_text(text):
+                            meta["offsets"].append(f.tell())
+                            meta["labels"].append(label)
+                            f.write(json.dumps({"label": label, "text": text_chunk}).encode("utf-8") + b"\n")
+                os.replace(tmp_path, chunks_path)
+                with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+                    json.dump(meta, f)
+                os.replace(meta_path + ".tmp", meta_path)
+                print(f"Parsed document {file_name} ({len(meta['offsets'])} chunks)")
+        return UploadedDocument(source=file_name, path=os.path.abspath(chunks_path),
+                                offsets=meta["offsets"], labels=meta["labels"], unit_count=meta["units"])
+
+
+_store: Optional[DocumentStore] = None
+_store_lock = threading.Lock()
+
+def get_document_store() -> DocumentStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = DocumentStore()
+        return _store
+
+
+class SessionDocuments:
+    """The documents uploaded in one chat and an ephemeral BM25 index over their chunks.
+
+    Only term frequencies live in memory; chunk text is read back from disk
+    when a search hit or a page is requested.
+    """
+
+    def __init__(self):
+        self.documents: Dict[str, UploadedDocument] = {}
+        self.index = BM25Index()
+        self._lock = threading.Lock()
+
+    def add(self, document: UploadedDocument):
+        with self._lock:
+            old = self.documents.get(document.source)
+            if old is not None:
+                # A re-upload under the same name replaces every chunk of the old version
+                self.index.remove_many(f"{old.source}#{i}" for i in range(len(old.offsets)))
+            self.documents[document.source] = document
+            for i, chunk in document.iter_chunks():
+                self.index.add(f"{document.source}#{i}", f"{chunk['label']}\n{chunk['text']}")
+
+    def find(self, name: str) -> Optional[UploadedDocument]:
+        if name in self.documents:
+            return self.documents[name]
+        matches = [doc for source, doc in self.documents.items() if name.lower() in source.lower()]
+        return matches[0] if len(matches) == 1 else None
+
+    def search(self, query: str, top_k: int = DOC_TOP_K, document: Optional[str] = None) -> List[dict]:
+        with self._lock:
+            # Over-fetch when filtering to one document
+            hits = self.index.search(query, top_k * 4 if document else top_k)
+        results = []
+        for doc_id, score in hits:
+            source, i = doc_id.rsplit("#", 1)
+            if document and source != document:
+                continue
+            uploaded = self.documents.get(source)
+            # Skip hits from a version replaced since the index was searched
+            if uploaded is None or int(i) >= len(uploaded.offsets):
+                continue
+            results.append({"source": source, "score": score, **uploaded.chunk(int(i))})
+            if len(results) >= top_k:
+                break
+        return results
+
+
+_sessions: Dict[str, SessionDocuments] = {}
+_sessions_lock = threading.Lock()
+
+def session_documents(session_id: str) -> SessionDocuments:
+    with _sessions_lock:
+        return _sessions.setdefault(session_id, SessionDocuments())
+
+def forget_session_documents(session_id: str):
+    with _sessions_lock:
+        _sessions.pop(session_id, None)
+
+
+def parse_page_range(pages: str) -> List[int]:
+    """'3', '3-5' or '1,4-6' -> [3], [3, 4, 5], [1, 4, 5, 6]."""
+    numbers = []
+    for part in pages.replace(" ", "").split(","):
+        if "-" in part:
+            start, end = part.split("-", 1)
+            numbers.extend(range(int(start), int(end) + 1))
+        elif part:
+            numbers.append(int(part))
+    return numbers
+
+def _clip(parts: List[str]) -> str:
+    text = "\n\n".join(parts)
+    if len(text) > DOC_MAX_RETURN_CHARS:
+        text = text[:DOC_MAX_RETURN_CHARS] + "\n... [truncated; request fewer pages]"
+    return text
+
+
+class DocumentInput(BaseModel):
+    """Input for the uploaded document tool."""
+    query: Optional[str] = Field(default=None, description="What to look for in the uploaded documents")
+    document: Optional[str] = Field(default=None, description="Restrict to this uploaded file name")
+    pages: Optional[str] = Field(default=None, description="Pages or section numbers to read in full, e.g. '3' or '3-5'")
+
+class UploadedDocumentTool(BaseTool):
+    """Searches or pages through documents the user uploaded in this chat."""
+
+    name: str = "read_uploaded_document"
+    description: str = """
+    Read documents (PDF, DOCX, Markdown, text) the user has uploaded in this chat, such as
+    their dissertation draft. Give a `query` to get the most relevant passages with their
+    page or section, or give `document` and `pages` (e.g. '12-14') to read specific pages
+    or sections in full. With no arguments, lists the uploaded documents.
+    """
+    args_schema: Type[BaseModel] = DocumentInput
+
+    def _run(self, query: Optional[str] = None, document: Optional[str] = None,
+             pages: Optional[str] = None) -> str:
+        try:
+            docs = session_documents(current_code_session())
+            if not docs.documents:
+                return "No documents have been uploaded in this chat."
+            doc = None
+            if document:
+                doc = docs.find(document)
+                if doc is None:
+                    return f"No uploaded document called {document}. Available: {', '.join(docs.documents)}"
+
+            if pages:
+                if doc is None:
+                    if len(docs.documents) > 1:
+                        return "Specify which document to read pages from."
+                    doc = next(iter(docs.documents.values()))
+                numbers = parse_page_range(pages)
+                units = doc.units
+                if units and all(label.startswith("page ") for label in units):
+                    # PDF pages keep their real numbers even when some pages have no text
+                    wanted = {f"page {n}" for n in numbers}
+                else:
+                    wanted = {units[n - 1] for n in numbers if 1 <= n <= len(units)}
+                parts = [f"[{doc.source}, {label}]\n{doc.chunk(i)['text']}"
+                         for i, label in enumerate(doc.labels) if label in wanted]
+                if not parts:
+                    return f"No text on those pages; {doc.source} has {doc.unit_count} pages/sections."
+                return _clip(parts)
+
+            if query:
+                hits = docs.search(query, DOC_TOP_K, doc.source if doc else None)
+                if not hits:
+                    return "No relevant passages found in the uploaded documents."
+                return _clip([f"[{hit['source']}, {hit['label']}]\n{hit['text']}" for hit in hits])
+
+            return "\n".join(f"- {d.source}: {d.unit_count} pages/sections, {len(d.offsets)} chunks"
+                             for d in docs.documents.values())
+        except Exception as e:
+            return f"Error reading uploaded document: {str(e)}"
+
+    async def _arun(self, query: Optional[str] = None, document: Optional[str] = None,
+                    pages: Optional[str] = None) -> str:
+        return await asyncio.to_thread(self._run, query, document, pages)
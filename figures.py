@@ -0,0 +1,241 @@
+import asyncio
+import base64
+import json
+import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Optional
+
+import numpy as np
+
+# Figures buffered per turn before producers have to wait
+FIGURE_QUEUE_SIZE = int(os.getenv("FIGURE_QUEUE_SIZE", "8"))
+# How long (seconds) a producer waits for space before the figure is dropped
+FIGURE_PUT_TIMEOUT = float(os.getenv("FIGURE_PUT_TIMEOUT", "30"))
+# Traces with more points than this are downsampled server-side (0 disables)
+FIGURE_MAX_POINTS = int(os.getenv("FIGURE_MAX_POINTS", "20000"))
+# Only point traces are thinned; histograms, box plots, pies, heatmaps etc. are computed
+# from every value (by plotly.js) and would show different statistics if sampled
+DOWNSAMPLE_TRACE_TYPES = ("scatter", "scattergl")
+# Numeric lists at least this long are sent as typed binary buffers
+BINARY_MIN_LENGTH = 64
+
+# dtypes plotly.js can decode from a "bdata" buffer
+_BDATA_DTYPES = {"int8": "i1", "uint8": "u1", "int16": "i2", "uint16": "u2",
+                 "int32": "i4", "uint32": "u4", "float32": "f4", "float64": "f8"}
+
+_CLOSED = object()
+
+
+class FigureStore:
+    """Bounded queue of figures captured during one agent run.
+
+    Each turn gets its own store, so sessions never see or clear each other's
+    plots. Producers (code running in worker threads) block while the queue is
+    full, which applies backpressure until the consumer has sent earlier
+    figures to the client.
+    """
+
+    def __init__(self, maxsize: int = FIGURE_QUEUE_SIZE):
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.captured = 0
+        self.dropped = 0
+
+    def put(self, figure_json: str) -> bool:
+        """Add a figure from any thread; returns False if it had to be dropped."""
+        if self._on_loop_thread():
+            # Can't block the event loop; drop instead of waiting
+            try:
+                self.queue.put_nowait(figure_json)
+            except asyncio.QueueFull:
+                self.dropped += 1
+                print("Figure queue full, dropping figure")
+                return False
+        else:
+            future = asyncio.run_coroutine_threadsafe(self.queue.put(figure_json), self.loop)
+            try:
+                future.result(timeout=FIGURE_PUT_TIMEOUT)
+            except Exception:
+                future.cancel()
+                self.dropped += 1
+                print("Timed out waiting for figure queue, dropping figure")
+                return False
+        self.captured += 1
+        return True
+
+    def _on_loop_thread(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    async def close(self):
+        """Signal the consumer that no more figures will arrive."""
+        await self.queue.put(_CLOSED)
+
+    async def __aiter__(self):
+        while True:
+            figure_json = await self.queue.get()
+            if figure_json is _CLOSED:
+                return
+            yield figure_json
+
+
+def _as_array(value: Any) -> Optional[np.ndarray]:
+    """Return value as a 1-D numeric array if it is (or can cheaply become) one."""
+    if isinstance(value, np.ndarray):
+        array = value
+    elif isinstance(value, (list, tuple)) and len(value) >= BINARY_MIN_LENGTH \
+            and isinstance(value[0], (int, float)) and not isinstance(value[0], bool):
+        try:
+            array = np.asarray(value)
+        except (ValueError, TypeError):
+            return None
+    else:
+        return None
+    if array.ndim != 1 or array.dtype.kind not in "biuf":
+        return None
+    return array
+
+def _encode_array(array: np.ndarray) -> dict:
+    """Encode a numeric array in plotly's typed-array form ({"dtype", "bdata"})."""
+    if array.dtype.kind == "b":
+        array = array.astype(np.uint8)
+    elif array.dtype.kind in "iu" and array.dtype.name not in _BDATA_DTYPES:
+        info = np.iinfo(np.int32)
+        array = array.astype(np.int32 if array.min() >= info.min and array.max() <= info.max else np.float64)
+    elif array.dtype.name not in _BDATA_DTYPES:
+        array = array.astype(np.float64)
+    array = np.ascontiguousarray(array)
+    return {"dtype": _BDATA_DTYPES[array.dtype.name],
+            "bdata": base64.b64encode(array.tobytes()).decode("ascii")}
+
+def _decode_typed(value: Any) -> Any:
+    """Turn typed-array dicts (as produced by newer Plotly versions) back into NumPy arrays."""
+    if isinstance(value, dict):
+        if "bdata" in value and "dtype" in value and "," not in str(value.get("shape", "")):
+            inverse = {code: name for name, code in _BDATA_DTYPES.items()}
+            dtype = inverse.get(value["dtype"])
+            if dtype is not None:
+                return np.frombuffer(base64.b64decode(value["bdata"]), dtype=dtype)
+        return {k: _decode_typed(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_decode_typed(v) for v in value]
+    return value
+
+def _point_count(trace: dict) -> int:
+    for key in ("y", "x", "z", "values"):
+        value = trace.get(key)
+        if value is not None and hasattr(value, "__len__") and not isinstance(value, (str, dict)):
+            return len(value)
+    return 0
+
+def _downsample_indices(trace: dict, n: int, budget: int) -> np.ndarray:
+    """Pick which points to keep: min/max per bucket for lines, an even stride otherwise."""
+    x, y = _as_array(trace.get("x")), _as_array(trace.get("y"))
+    is_line = "lines" in str(trace.get("mode", "")) or trace.get("type") in ("scattergl", None)
+    if is_line and y is not None and len(y) == n and (x is None or (len(x) == n and np.all(np.diff(x) >= 0))):
+        # Keep each bucket's extremes so peaks and troughs survive
+        buckets = np.array_split(np.arange(n), max(1, budget // 2))
+        keep = set()
+        for bucket in buckets:
+            values = y[bucket]
+            keep.add(int(bucket[np.nanargmin(values)]) if not np.all(np.isnan(values)) else int(bucket[0]))
+            keep.add(int(bucket[np.nanargmax(values)]) if not np.all(np.isnan(values)) else int(bucket[-1]))
+        return np.array(sorted(keep))
+    return np.linspace(0, n - 1, budget).astype(np.int64)
+
+def _take(value: Any, indices: np.ndarray, n: int) -> Any:
+    """Subsample any per-point array (recursing into dicts such as `marker`)."""
+    if isinstance(value, dict):
+        return {k: _take(v, indices, n) for k, v in value.items()}
+    if isinstance(value, np.ndarray) and value.ndim >= 1 and len(value) == n:
+        return value[indices]
+    if isinstance(value, (list, tuple)) and len(value) == n:
+        return [value[i] for i in indices]
+    return value
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _encode_value(v) for k, v in value.items()}
+    array = _as_array(value)
+    if array is not None and len(array) >= BINARY_MIN_LENGTH:
+        return _encode_array(array)
+    if isinstance(value, np.ndarray):
+        if value.dtype.kind == "M":
+            return np.datetime_as_string(value).tolist()
+        return value.tolist()
+    if isinstance(value, (list, tuple)):
+        return [_encode_value(v) for v in value]
+    return value
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return _encode_value(value)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+def encode_figure(fig: Any, max_points: int = FIGURE_MAX_POINTS) -> str:
+    """Serialise a Plotly figure to compact JSON for the client.
+
+    Numeric arrays are sent as base64 typed buffers (plotly.js `bdata`)
+    instead of decimal text, scatter/line traces longer than `max_points` are
+    downsampled (other trace types are sent whole), and validation is skipped because the figure was already built by Plotly.
+    """
+    fig_dict = fig.to_plotly_json()
+    traces = []
+    for trace in fig_dict.get("data", []):
+        trace = _decode_typed(dict(trace))
+        n = _point_count(trace)
+        if max_points and n > max_points and trace.get("type", "scatter") in DOWNSAMPLE_TRACE_TYPES:
+            trace = _take(trace, _downsample_indices(trace, n, max_points), n)
+        traces.append(_encode_value(trace))
+    layout = dict(fig_dict.get("layout", {}))
+    # Let the chat element size the figure (as cl.Plotly does)
+    layout["autosize"] = True
+    layout.pop("width", None)
+    return json.dumps({"data": traces, "layout": layout}, default=_json_default, separators=(",", ":"))
+
+
+_current_store: ContextVar[Optional[FigureStore]] = ContextVar("current_figure_store", default=None)
+
+@contextmanager
+def capture_figures(store: FigureStore):
+    """Route figures shown within this context (and tasks/threads spawned from it) to `store`."""
+    token = _current_store.set(store)
+    try:
+        yield store
+    finally:
+        _current_store.reset(token)
+
+def capture_figure(figure_json: str) -> bool:
+    """Send a figure to the current run's store; returns False if no run is capturing."""
+    store = _current_store.get()
+    if store is None:
+        return False
+    return store.put(figure_json)
+
+
+_install_lock = threading.Lock()
+_installed = False
+
+def install_plotly_capture():
+    """Make `fig.show()` hand figures to the current run instead of opening a browser."""
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        from plotly.basedatatypes import BaseFigure
+        original_show = BaseFigure.show
+
+        def show(self, *args, **kwargs):
+            if not capture_figure(encode_figure(self)):
+                return original_show(self, *args, **kwargs)
+
+        BaseFigure.show = show
+        _installed = True
@@ -0,0 +1,177 @@
+import asyncio
+import os
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+# Prompt budget (tokens) for conversation history; "model prefix=tokens" pairs override the default
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "16000"))
+HISTORY_MODEL_BUDGETS = os.getenv(
+    "HISTORY_MODEL_BUDGETS",
+    "gemini=32000,moonshotai=24000,deepseek=16000,mistralai=12000"
+)
+# Summarise once the unsummarised history passes this fraction of the budget
+HISTORY_SUMMARY_TRIGGER = float(os.getenv("HISTORY_SUMMARY_TRIGGER", "0.6"))
+# Most recent user turns that are always kept verbatim
+HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "4"))
+# Chat histories kept in memory by thread id, so a resumed thread need not be rebuilt
+HISTORY_CACHE_SIZE = int(os.getenv("HISTORY_CACHE_SIZE", "64"))
+# Characters kept from a tool output the model has already responded to, when over budget
+TOOL_OUTPUT_KEEP_CHARS = int(os.getenv("TOOL_OUTPUT_KEEP_CHARS", "600"))
+
+SUMMARY_PROMPT = """You maintain a running summary of a dissertation supervision chat between a student and ESI, their AI supervisor.
+Update the summary with the new exchanges below. Keep the student's topic, research question, hypotheses,
+design and data details, decisions made, references already given (with DOIs), and open questions.
+Be factual and concise (at most about 300 words). Reply with the updated summary only.
+
+Current summary:
+{summary}
+
+New exchanges:
+{exchanges}"""
+
+
+def _parse_model_budgets(spec: str) -> Dict[str, int]:
+    budgets = {}
+    for item in spec.split(","):
+        if "=" in item:
+            prefix, tokens = item.split("=", 1)
+            budgets[prefix.strip()] = int(tokens)
+    return budgets
+
+_model_budgets = _parse_model_budgets(HISTORY_MODEL_BUDGETS)
+
+def history_budget(model: str) -> int:
+    """Token budget for the history sent to `model` (longest matching prefix wins)."""
+    matches = [prefix for prefix in _model_budgets if model.startswith(prefix)]
+    return _model_budgets[max(matches, key=len)] if matches else HISTORY_TOKEN_BUDGET
+
+def message_text(message: BaseMessage) -> str:
+    """Plain text of a message (content may be a list of parts)."""
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return "".join(part if isinstance(part, str) else str(part.get("text", "")) for part in content)
+
+def estimate_tokens(messages: List[BaseMessage]) -> int:
+    """Cheap token estimate (~4 characters per token plus per-message overhead)."""
+    total = 0
+    for message in messages:
+        total += len(message_text(message)) // 4 + 4
+        for call in getattr(message, "tool_calls", None) or []:
+            total += len(str(call.get("args", ""))) // 4 + 8
+    return total
+
+
+def compact_tool_outputs(messages: List[BaseMessage], budget: int,
+                         keep_chars: int = TOOL_OUTPUT_KEEP_CHARS) -> List[BaseMessage]:
+    """Shorten tool outputs the model has already seen, oldest first, until under budget.
+
+    A tool output counts as used once a later AI message exists (the model
+    has read it and moved on). The newest outputs are never shortened.
+    """
+    tokens = estimate_tokens(messages)
+    if tokens <= budget:
+        return messages
+    last_ai = max((i for i, m in enumerate(messages) if isinstance(m, AIMessage)), default=-1)
+    compacted = list(messages)
+    for i, message in enumerate(messages[:last_ai]):
+        if tokens <= budget:
+            break
+        if isinstance(message, ToolMessage):
+            text = message_text(message)
+            if len(text) > keep_chars:
+                note = f"\n... [{len(text) - keep_chars} more characters of this tool output omitted]"
+                compacted[i] = message.model_copy(update={"content": text[:keep_chars] + note})
+                tokens -= (len(text) - keep_chars - len(note)) // 4
+    return compacted
+
+def make_pre_model_hook(model: str) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    """Pre-model hook for create_react_agent that keeps each LLM call within the history budget."""
+    budget = history_budget(model)
+
+    def pre_model_hook(state: Dict[str, Any]) -> Dict[str, Any]:
+        return {"llm_input_messages": compact_tool_outputs(state["messages"], budget)}
+
+    return pre_model_hook
+
+
+class ChatHistory:
+    """One chat's conversation, kept within a per-model token budget.
+
+    Older turns are folded into a running summary by a background task,
+    incrementally (only the turns not yet summarised are sent). The summary
+    and the position it covers are kept on this object, which lives in the
+    user session, so each turn is summarised once.
+    """
+
+    def __init__(self, messages: Optional[List[BaseMessage]] = None, summary: str = ""):
+        self.messages: List[BaseMessage] = list(messages or [])
+        self.summary = summary
+        self.summarized = 0   # messages[:summarized] are covered by the summary
+        self._task: Optional[asyncio.Task] = None
+
+    def append(self, message: BaseMessage):
+        self.messages.append(message)
+
+    def _turn_starts(self, start: int = 0) -> List[int]:
+        return [i for i in range(start, len(self.messages)) if isinstance(self.messages[i], HumanMessage)]
+
+    def prompt_messages(self, model: str) -> List[BaseMessage]:
+        """Summary plus the unsummarised turns that fit the model's budget."""
+        budget = history_budget(model)
+        prefix = []
+        if self.summary:
+            prefix = [HumanMessage(content=f"[Summary of our earlier conversation]\n{self.summary}")]
+        recent = self.messages[self.summarized:]
+        # Hard cap while a summary is still catching up: drop whole turns, oldest first
+        starts = self._turn_starts(self.summarized)
+        while len(starts) > 1 and estimate_tokens(prefix + recent) > budget:
+            starts.pop(0)
+            recent = self.messages[starts[0]:]
+        return prefix + recent
+
+    def maybe_summarize(self, llm, model: str):
+        """Start summarising older turns in the background if the history is getting long."""
+        if self._task is not None and not self._task.done():
+            return
+        pending = self.messages[self.summarized:]
+        if estimate_tokens(pending) < history_budget(model) * HISTORY_SUMMARY_TRIGGER:
+            return
+        starts = self._turn_starts(self.summarized)
+        if len(starts) <= HISTORY_KEEP_TURNS:
+            return
+        cut = starts[-HISTORY_KEEP_TURNS] if HISTORY_KEEP_TURNS else len(self.messages)
+        self._task = asyncio.create_task(self._summarize(llm, cut))
+
+    async def _summarize(self, llm, cut: int):
+        exchanges = "\n\n".join(
+            f"{'Student' if isinstance(m, HumanMessage) else 'ESI'}: {message_text(m)}"
+            for m in self.messages[self.summarized:cut]
+            if isinstance(m, (HumanMessage, AIMessage)) and message_text(m)
+        )
+        try:
+            response = await llm.ainvoke([HumanMessage(content=SUMMARY_PROMPT.format(
+                summary=self.summary or "(none yet)", exchanges=exchanges))])
+            self.summary = message_text(response).strip()
+            self.summarized = cut
+            print(f"History summarised up to message {cut}")
+        except Exception as e:
+            print(f"Error summarising history: {e}")
+
+
+_history_cache: "OrderedDict[str, ChatHistory]" = OrderedDict()
+
+def cache_history(thread_id: str, history: ChatHistory):
+    """Remember a thread's live history (least recently used entries are dropped)."""
+    _history_cache[thread_id] = history
+    _history_cache.move_to_end(thread_id)
+    while len(_history_cache) > HISTORY_CACHE_SIZE:
+        _history_cache.popitem(last=False)
+
+def cached_history(thread_id: str) -> Optional[ChatHistory]:
+    history = _history_cache.get(thread_id)
+    if history is not None:
+        _history_cache.move_to_end(thread_id)
+    return history
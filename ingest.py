@@ -1,39 +1,268 @@
-
+import argparse
+import hashlib
+import json
 import os
-import chromadb
-from llama_index.core import VectorStoreIndex, SimpleDirectoryReader
-from llama_index.vector_stores.chromadb import ChromaDB
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import TYPE_CHECKING, Dict, List, Tuple
+
+from bm25_index import BM25Index
+
+# chromadb and llama_index are imported where used: knowledge_base imports this
+# module for its paths, and the chat server should not pay for them at start-up
+if TYPE_CHECKING:
+    from llama_index.core.schema import BaseNode
+
+DATA_DIR = "data"
+DB_DIR = "chroma_db"
+COLLECTION_NAME = "esi_collection"
+# Cosine distance, so a vector hit's score (1 - distance) is its cosine similarity
+COLLECTION_METADATA = {"hnsw:space": "cosine"}
+# Per-file content hashes, mtimes and vector ids from previous runs
+MANIFEST_PATH = os.path.join(DB_DIR, "ingest_manifest.json")
+# Lexical index kept in step with the Chroma collection (for hybrid search)
+BM25_PATH = os.path.join(DB_DIR, "bm25_index.json")
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# Save the manifest and BM25 index after this many ingested files or seconds, and at the end
+INGEST_CHECKPOINT_FILES = int(os.getenv("INGEST_CHECKPOINT_FILES", "50"))
+INGEST_CHECKPOINT_SECONDS = float(os.getenv("INGEST_CHECKPOINT_SECONDS", "30"))
+# Files in data/ that are not documents (e.g. the Chainlit database)
+IGNORED_SUFFIXES = (".db", ".sqlite", ".sqlite3", ".db-wal", ".db-shm", ".db-journal")
+
 
-def ingest_documents():
+def file_sha256(path: str) -> str:
+    """Hash a file's contents in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def scan_data_dir(data_dir: str = DATA_DIR) -> Dict[str, os.stat_result]:
+    """Return {relative path: stat} for every ingestible file under data_dir."""
+    files = {}
+    for root, dirs, names in os.walk(data_dir):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for name in names:
+            if name.startswith(".") or name.lower().endswith(IGNORED_SUFFIXES):
+                continue
+            path = os.path.join(root, name)
+            files[os.path.relpath(path, data_dir)] = os.stat(path)
+    return files
+
+def load_manifest(path: str = MANIFEST_PATH) -> Dict[str, dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_manifest(manifest: Dict[str, dict], path: str = MANIFEST_PATH):
+    """Write the manifest atomically so an interrupted run can resume."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def open_collection(client):
+    """Open the knowledge base collection, migrating one created with Chroma's default L2 space.
+
+    The distance space is fixed when a collection is created, so an L2
+    collection is copied (embeddings included, nothing is re-embedded) into a
+    cosine one that then takes its name. An interrupted migration is redone.
     """
-    Ingests documents from the 'data' directory into a ChromaDB vector store.
+    staging_name = f"{COLLECTION_NAME}_cosine"
+    try:
+        collection = client.get_collection(COLLECTION_NAME)
+    except Exception:
+        # Not created yet, or a migration stopped after dropping the old collection
+        try:
+            staging = client.get_collection(staging_name)
+        except Exception:
+            return client.get_or_create_collection(COLLECTION_NAME, metadata=COLLECTION_METADATA)
+        staging.modify(name=COLLECTION_NAME)
+        return staging
+    if (collection.metadata or {}).get("hnsw:space") == COLLECTION_METADATA["hnsw:space"]:
+        return collection
+
+    print(f"Migrating '{COLLECTION_NAME}' ({collection.count()} chunks) to cosine distance")
+    try:
+        client.delete_collection(staging_name)  # partial copy from an interrupted migration
+    except Exception:
+        pass
+    staging = client.create_collection(staging_name, metadata=COLLECTION_METADATA)
+    offset = 0
+    while True:
+        batch = collection.get(include=["embeddings", "documents", "metadatas"], limit=500, offset=offset)
+        if not len(batch["ids"]):
+            break
+        staging.add(ids=batch["ids"], embeddings=batch["embeddings"],
+                    documents=batch["documents"], metadatas=batch["metadatas"])
+        offset += len(batch["ids"])
+    client.delete_collection(COLLECTION_NAME)
+    staging.modify(name=COLLECTION_NAME)
+    return staging
+
+def parse_and_embed(path: str) -> Tuple[str, List["BaseNode"]]:
+    """Load, chunk and embed one file (runs in a worker process)."""
+    from llama_index.core import Settings, SimpleDirectoryReader
+    from llama_index.core.node_parser import SentenceSplitter
+    from llama_index.core.schema import MetadataMode
+    Settings.embed_model.embed_batch_size = EMBED_BATCH_SIZE
+    documents = SimpleDirectoryReader(input_files=[path], filename_as_id=True).load_data()
+    for document in documents:
+        # Lets a resumed run find vectors stored after the last checkpoint; kept out of the embedded text
+        document.metadata["ingest_path"] = path
+        document.excluded_embed_metadata_keys.append("ingest_path")
+        document.excluded_llm_metadata_keys.append("ingest_path")
+    nodes = SentenceSplitter().get_nodes_from_documents(documents)
+    texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+    embeddings = Settings.embed_model.get_text_embedding_batch(texts) if texts else []
+    for node, embedding in zip(nodes, embeddings):
+        node.embedding = embedding
+    return path, nodes
+
+def plan_changes(files: Dict[str, os.stat_result], manifest: Dict[str, dict],
+                 data_dir: str = DATA_DIR) -> Tuple[Dict[str, str], List[str]]:
+    """Return ({changed or new file: sha256}, [removed files]), hashing only when mtime/size moved."""
+    changed = {}
+    for rel_path, stat in files.items():
+        entry = manifest.get(rel_path)
+        if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+            continue
+        digest = file_sha256(os.path.join(data_dir, rel_path))
+        if entry and entry["sha256"] == digest:
+            # Touched but identical: just record the new mtime
+            entry["mtime"], entry["size"] = stat.st_mtime, stat.st_size
+            continue
+        changed[rel_path] = digest
+    removed = [rel_path for rel_path in manifest if rel_path not in files]
+    return changed, removed
+
+def ingest_documents(data_dir: str = DATA_DIR, db_dir: str = DB_DIR,
+                     workers: int = INGEST_WORKERS, full: bool = False):
     """
-    data_dir = "data"
-    db_dir = "chroma_db"
+    Incrementally ingests documents from the 'data' directory into a ChromaDB vector store.
 
+    Only new or changed files are parsed and embedded (in parallel worker
+    processes); vectors belonging to removed or changed files are deleted.
+    The BM25 index is updated with the same additions and deletions.
+    """
     if not os.path.exists(data_dir):
         os.makedirs(data_dir)
         print(f"Created '{data_dir}' directory. Please add your documents here and run the script again.")
         return
 
+    import chromadb
+    from llama_index.core.schema import MetadataMode
+    from llama_index.vector_stores.chroma import ChromaVectorStore
+
     # initialize client, setting path to where Chroma is stored
     db = chromadb.PersistentClient(path=db_dir)
+    chroma_collection = open_collection(db)
+    vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
+
+    manifest_path = os.path.join(db_dir, os.path.basename(MANIFEST_PATH))
+    manifest = {} if full else load_manifest(manifest_path)
+    if full and chroma_collection.count():
+        db.delete_collection(COLLECTION_NAME)
+        chroma_collection = db.get_or_create_collection(COLLECTION_NAME, metadata=COLLECTION_METADATA)
+        vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
+
+    bm25_path = os.path.join(db_dir, os.path.basename(BM25_PATH))
+    if full:
+        bm25 = BM25Index()
+    elif os.path.exists(bm25_path):
+        bm25 = BM25Index.load(bm25_path)
+    else:
+        # First run with hybrid search: index what is already in the collection
+        bm25 = BM25Index.from_collection(chroma_collection)
+        print(f"Built BM25 index from {len(bm25)} existing chunks")
+
+    files = scan_data_dir(data_dir)
+    changed, removed = plan_changes(files, manifest, data_dir)
+    print(f"{len(files)} files: {len(changed)} new/changed, {len(removed)} removed, "
+          f"{len(files) - len(changed)} unchanged")
+
+    # Drop vectors for removed files and for old versions of changed files
+    for rel_path in removed + list(changed):
+        entry = manifest.pop(rel_path, None)
+        if entry and entry.get("node_ids"):
+            chroma_collection.delete(ids=entry["node_ids"])
+            bm25.remove_many(entry["node_ids"])
+        elif entry is None and rel_path in changed:
+            # An interrupted run may have stored vectors for this file after its last checkpoint
+            chroma_collection.delete(where={"ingest_path": os.path.join(data_dir, rel_path)})
+    save_manifest(manifest, manifest_path)
+    bm25.save(bm25_path)
+
+    if not changed:
+        print("Knowledge base is up to date.")
+        return
+
+    start = time.perf_counter()
+    total_chunks = 0
+    paths = {os.path.join(data_dir, rel_path): rel_path for rel_path in changed}
 
-    # create collection
-    chroma_collection = db.get_or_create_collection("esi_collection")
+    unsaved, last_saved = 0, time.monotonic()
 
-    # load documents
-    documents = SimpleDirectoryReader(data_dir).load_data()
+    def checkpoint():
+        """Persist progress; the manifest lists only files whose vectors are stored."""
+        nonlocal unsaved, last_saved
+        save_manifest(manifest, manifest_path)
+        bm25.save(bm25_path)
+        unsaved, last_saved = 0, time.monotonic()
 
-    # set up the vector store
-    vector_store = ChromaDB(chroma_collection=chroma_collection)
+    def record(path: str, nodes: List["BaseNode"], done: int):
+        nonlocal total_chunks, unsaved
+        rel_path = paths[path]
+        if nodes:
+            vector_store.add(nodes)
+            for node in nodes:
+                bm25.add(node.node_id, node.get_content(metadata_mode=MetadataMode.NONE))
+        stat = files[rel_path]
+        manifest[rel_path] = {
+            "sha256": changed[rel_path],
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "node_ids": [node.node_id for node in nodes],
+        }
+        unsaved += 1
+        if unsaved >= INGEST_CHECKPOINT_FILES or time.monotonic() - last_saved >= INGEST_CHECKPOINT_SECONDS:
+            checkpoint()
+        total_chunks += len(nodes)
+        elapsed = time.perf_counter() - start
+        print(f"[{done}/{len(changed)}] {rel_path}: {len(nodes)} chunks "
+              f"({done / elapsed:.2f} files/s, {total_chunks / elapsed:.1f} chunks/s)")
 
-    # create the index
-    index = VectorStoreIndex.from_documents(
-        documents, vector_store=vector_store
-    )
+    try:
+        if workers <= 1:
+            for done, path in enumerate(paths, 1):
+                try:
+                    record(*parse_and_embed(path), done)
+                except Exception as e:
+                    print(f"[{done}/{len(changed)}] Failed to ingest {paths[path]}: {e}")
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(parse_and_embed, path): path for path in paths}
+                for done, future in enumerate(as_completed(futures), 1):
+                    try:
+                        record(*future.result(), done)
+                    except Exception as e:
+                        print(f"[{done}/{len(changed)}] Failed to ingest {paths[futures[future]]}: {e}")
+    finally:
+        # Also on Ctrl+C, so the next run resumes from here
+        checkpoint()
 
-    print(f"Successfully ingested {len(documents)} documents into ChromaDB.")
+    elapsed = time.perf_counter() - start
+    print(f"Successfully ingested {len(changed)} documents ({total_chunks} chunks) "
+          f"into ChromaDB in {elapsed:.1f}s.")
 
 if __name__ == "__main__":
-    ingest_documents()
+    parser = argparse.ArgumentParser(description="Ingest documents from data/ into the ESI knowledge base.")
+    parser.add_argument("--full", action="store_true", help="Rebuild the collection from scratch")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="Parallel parse/embed processes")
+    args = parser.parse_args()
+    ingest_documents(workers=args.workers, full=args.full)
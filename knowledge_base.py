@@ -0,0 +1,166 @@
+import asyncio
+import os
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Type
+
+from langchain_core.tools import BaseTool
+from pydantic import BaseModel, Field
+
+from bm25_index import BM25Index
+from ingest import BM25_PATH, COLLECTION_NAME, DB_DIR, open_collection
+
+KB_TOP_K = int(os.getenv("KB_TOP_K", "5"))
+KB_MAX_TOP_K = int(os.getenv("KB_MAX_TOP_K", "20"))
+KB_EMBED_CACHE_SIZE = int(os.getenv("KB_EMBED_CACHE_SIZE", "1024"))
+# Candidates taken from each retriever before fusion, and the RRF damping constant
+KB_CANDIDATE_DEPTH = int(os.getenv("KB_CANDIDATE_DEPTH", "20"))
+KB_RRF_K = int(os.getenv("KB_RRF_K", "60"))
+
+_collection = None
+_collection_lock = threading.Lock()
+
+def get_collection():
+    """Return the knowledge base collection, opening the persistent client once."""
+    global _collection
+    with _collection_lock:
+        if _collection is None:
+            import chromadb
+            client = chromadb.PersistentClient(path=DB_DIR)
+            _collection = open_collection(client)
+            print(f"Knowledge base opened: {_collection.count()} chunks in '{COLLECTION_NAME}'")
+        return _collection
+
+@lru_cache(maxsize=KB_EMBED_CACHE_SIZE)
+def embed_query(query: str) -> tuple:
+    """Embed a query with the same model used at ingestion (cached per query text)."""
+    from llama_index.core import Settings
+    return tuple(Settings.embed_model.get_query_embedding(query))
+
+_bm25: Optional[BM25Index] = None
+_bm25_mtime: Optional[float] = None
+_bm25_lock = threading.Lock()
+
+def get_bm25_index() -> BM25Index:
+    """Return the BM25 index, reloading it if ingest.py has rewritten the file."""
+    global _bm25, _bm25_mtime
+    try:
+        mtime = os.path.getmtime(BM25_PATH)
+    except OSError:
+        mtime = None
+    with _bm25_lock:
+        if _bm25 is None or mtime != _bm25_mtime:
+            _bm25 = BM25Index.load(BM25_PATH)
+            _bm25_mtime = mtime
+        return _bm25
+
+def warm_knowledge_base():
+    """Open the collection and indexes, and load the embedding model ahead of the first query."""
+    get_collection()
+    get_bm25_index()
+    from llama_index.core import Settings
+    Settings.embed_model  # resolving the property loads and caches the default model
+
+def search_knowledge_base(query: str, top_k: int = KB_TOP_K,
+                          where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Return the top_k chunks for a query as dicts with text, source, score and metadata.
+
+    The score is the cosine similarity of the chunk to the query.
+    """
+    collection = get_collection()
+    if collection.count() == 0:
+        return []
+    result = collection.query(
+        query_embeddings=[list(embed_query(query.strip()))],
+        n_results=max(1, min(top_k, KB_MAX_TOP_K)),
+        where=where or None,
+        include=["documents", "metadatas", "distances"],
+    )
+    hits = []
+    for chunk_id, text, metadata, distance in zip(
+            result["ids"][0], result["documents"][0], result["metadatas"][0], result["distances"][0]):
+        metadata = metadata or {}
+        hits.append({
+            "id": chunk_id,
+            "text": text,
+            "source": metadata.get("file_path") or metadata.get("file_name") or "unknown",
+            "score": 1.0 - distance,
+            "metadata": {k: v for k, v in metadata.items() if not k.startswith("_")},
+        })
+    return hits
+
+def hybrid_search(query: str, top_k: int = KB_TOP_K, where: Optional[Dict[str, Any]] = None,
+                  candidate_depth: int = KB_CANDIDATE_DEPTH) -> List[Dict[str, Any]]:
+    """Fuse vector and BM25 results with reciprocal rank fusion.
+
+    Each retriever contributes `candidate_depth` candidates; a chunk's fused
+    score is the sum of 1 / (KB_RRF_K + rank) over the lists it appears in.
+    Lexical matches make exact terms (module codes, form and staff names)
+    reliable where embeddings blur them.
+    """
+    candidate_depth = max(candidate_depth, top_k)
+    vector_hits = search_knowledge_base(query, candidate_depth, where)
+    lexical_hits = get_bm25_index().search(query, candidate_depth)
+
+    hits = {hit["id"]: hit for hit in vector_hits}
+    fused: Dict[str, float] = {}
+    for rank, hit in enumerate(vector_hits, 1):
+        fused[hit["id"]] = fused.get(hit["id"], 0.0) + 1.0 / (KB_RRF_K + rank)
+    for rank, (chunk_id, _) in enumerate(lexical_hits, 1):
+        fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (KB_RRF_K + rank)
+
+    # Fetch text for lexical-only candidates (the metadata filter is applied here too)
+    missing = [chunk_id for chunk_id in fused if chunk_id not in hits]
+    if missing:
+        result = get_collection().get(ids=missing, where=where or None, include=["documents", "metadatas"])
+        for chunk_id, text, metadata in zip(result["ids"], result["documents"], result["metadatas"]):
+            metadata = metadata or {}
+            hits[chunk_id] = {
+                "id": chunk_id,
+                "text": text,
+                "source": metadata.get("file_path") or metadata.get("file_name") or "unknown",
+                "metadata": {k: v for k, v in metadata.items() if not k.startswith("_")},
+            }
+
+    ranked = sorted((chunk_id for chunk_id in fused if chunk_id in hits),
+                    key=lambda chunk_id: fused[chunk_id], reverse=True)
+    return [{**hits[chunk_id], "score": fused[chunk_id]} for chunk_id in ranked[:top_k]]
+
+def format_hits(hits: List[Dict[str, Any]]) -> str:
+    """Render retrieved chunks with their source paths for the LLM."""
+    if not hits:
+        return "No relevant passages found in the knowledge base."
+    return "\n\n".join(
+        f"[{i}] Source: {hit['source']} (score {hit['score']:.3f})\n{hit['text']}"
+        for i, hit in enumerate(hits, 1)
+    )
+
+
+class KnowledgeBaseInput(BaseModel):
+    """Input for the knowledge base tool."""
+    query: str = Field(description="What to look up in the module knowledge base")
+    top_k: int = Field(default=KB_TOP_K, description="Number of passages to return")
+    file_name: Optional[str] = Field(default=None, description="Only search this source file (exact file name)")
+
+class KnowledgeBaseTool(BaseTool):
+    """Retrieval over the local Chroma knowledge base built by ingest.py."""
+
+    name: str = "rag_search"
+    description: str = """
+    Search the internal knowledge base about the MSc dissertation module (NBS-7095x at UEA).
+    Use this FIRST for module specifics: deadlines, procedures, milestones, handbook content,
+    marking criteria, forms, staff, ethics guidelines and reading lists.
+    Returns passages with their source files.
+    """
+    args_schema: Type[BaseModel] = KnowledgeBaseInput
+
+    def _run(self, query: str, top_k: int = KB_TOP_K, file_name: Optional[str] = None) -> str:
+        try:
+            where = {"file_name": file_name} if file_name else None
+            return format_hits(hybrid_search(query, top_k, where))
+        except Exception as e:
+            return f"Error searching knowledge base: {str(e)}"
+
+    async def _arun(self, query: str, top_k: int = KB_TOP_K, file_name: Optional[str] = None) -> str:
+        # Chroma and the embedding client are sync; keep them off the event loop
+        return await asyncio.to_thread(self._run, query, top_k, file_name)
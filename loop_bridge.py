@@ -0,0 +1,114 @@
+import asyncio
+import concurrent.futures
+import os
+import threading
+from typing import Any, Awaitable, Callable, Coroutine, List, Optional
+
+# Default timeout (seconds) for sync callers waiting on a coroutine
+BRIDGE_DEFAULT_TIMEOUT = float(os.getenv("BRIDGE_DEFAULT_TIMEOUT", "120"))
+
+
+class BackgroundLoop:
+    """A dedicated event loop running in a daemon thread.
+
+    Sync code (e.g. a tool's `_run` called by LangGraph from a worker thread)
+    submits coroutines here instead of calling `asyncio.run`, which would fail
+    inside a running loop and spin up a new loop per call. Loop-bound resources
+    such as the crawler pool stay warm between calls.
+    """
+
+    def __init__(self, name: str = "esi-background-loop"):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._shutdown_callbacks: List[Callable[[], Awaitable[Any]]] = []
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """Return the background loop, starting its thread on first use."""
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                ready = threading.Event()
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._serve, args=(self._loop, ready), name=self.name, daemon=True
+                )
+                self._thread.start()
+                ready.wait()
+            return self._loop
+
+    @staticmethod
+    def _serve(loop: asyncio.AbstractEventLoop, ready: threading.Event):
+        asyncio.set_event_loop(loop)
+        loop.call_soon(ready.set)
+        loop.run_forever()
+
+    def in_loop_thread(self) -> bool:
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, coro: Coroutine) -> concurrent.futures.Future:
+        """Schedule a coroutine on the background loop and return a thread-safe future."""
+        if self.in_loop_thread():
+            coro.close()
+            raise RuntimeError("Cannot block on the background loop from its own thread")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Coroutine, timeout: Optional[float] = BRIDGE_DEFAULT_TIMEOUT) -> Any:
+        """Run a coroutine on the background loop and wait for its result.
+
+        On timeout the coroutine is cancelled and TimeoutError is raised.
+        """
+        future = self.submit(coro)
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise TimeoutError(f"Background task timed out after {timeout}s")
+        except BaseException:
+            future.cancel()
+            raise
+
+    def on_shutdown(self, callback: Callable[[], Awaitable[Any]]):
+        """Register an async callback to run on the background loop before it stops."""
+        self._shutdown_callbacks.append(callback)
+
+    def stop(self, timeout: float = 10):
+        """Run shutdown callbacks, then stop and close the loop."""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop, self._thread = None, None
+        if loop is None or loop.is_closed():
+            return
+
+        async def _shutdown():
+            for callback in self._shutdown_callbacks:
+                try:
+                    await callback()
+                except Exception as e:
+                    print(f"Error in background loop shutdown callback: {e}")
+
+        try:
+            asyncio.run_coroutine_threadsafe(_shutdown(), loop).result(timeout=timeout)
+        except Exception as e:
+            print(f"Error shutting down background loop: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        if thread is not None:
+            thread.join(timeout=timeout)
+        if not loop.is_running():
+            loop.close()
+
+
+_background_loop = BackgroundLoop()
+
+def run_sync(coro: Coroutine, timeout: Optional[float] = BRIDGE_DEFAULT_TIMEOUT) -> Any:
+    """Run a coroutine from sync code on the shared background loop."""
+    return _background_loop.run(coro, timeout=timeout)
+
+def on_background_shutdown(callback: Callable[[], Awaitable[Any]]):
+    """Register cleanup to run on the background loop when it is stopped."""
+    _background_loop.on_shutdown(callback)
+
+def stop_background_loop():
+    """Stop the shared background loop (call on app shutdown)."""
+    _background_loop.stop()
@@ -1,121 +1,235 @@
 #!/usr/bin/env python3
 """
 Manual Database Creator for Chainlit SQLite
-Run this script to manually create the database schema.
+Run this script to create the database schema or migrate an existing
+database to the latest version, then report on it.
+
+    python manual_sqlite_creator.py data/chainlit_app.db             # migrate + inspect
+    python manual_sqlite_creator.py data/chainlit_app.db --explain   # query plans of the hot queries
+    python manual_sqlite_creator.py data/chainlit_app.db --optimize  # ANALYZE + VACUUM
 """
 
+import argparse
 import sqlite3
 import os
 import sys
+from datetime import datetime, timezone
+
+# Version 1: the original schema. Timestamps stay TEXT: Chainlit writes
+# ISO-8601 strings, which sort correctly as text, and it expects them back.
+BASE_SCHEMA = """
+
+-- Users table
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    identifier TEXT NOT NULL UNIQUE,
+    metadata TEXT NOT NULL,
+    createdAt TEXT
+);
+
+-- Threads table
+CREATE TABLE IF NOT EXISTS threads (
+    id TEXT PRIMARY KEY,
+    createdAt TEXT,
+    name TEXT,
+    userId TEXT,
+    userIdentifier TEXT,
+    tags TEXT,
+    metadata TEXT,
+    FOREIGN KEY (userId) REFERENCES users(id) ON DELETE CASCADE
+);
+
+-- Steps table
+CREATE TABLE IF NOT EXISTS steps (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    type TEXT NOT NULL,
+    threadId TEXT NOT NULL,
+    parentId TEXT,
+    streaming INTEGER NOT NULL,
+    waitForAnswer INTEGER,
+    isError INTEGER,
+    metadata TEXT,
+    tags TEXT,
+    input TEXT,
+    output TEXT,
+    createdAt TEXT,
+    command TEXT,
+    start TEXT,
+    end TEXT,
+    generation TEXT,
+    showInput TEXT,
+    language TEXT,
+    indent INTEGER,
+    defaultOpen INTEGER,
+    FOREIGN KEY (threadId) REFERENCES threads(id) ON DELETE CASCADE
+);
+
+-- Elements table
+CREATE TABLE IF NOT EXISTS elements (
+    id TEXT PRIMARY KEY,
+    threadId TEXT,
+    type TEXT,
+    url TEXT,
+    chainlitKey TEXT,
+    name TEXT NOT NULL,
+    display TEXT,
+    objectKey TEXT,
+    size TEXT,
+    page INTEGER,
+    language TEXT,
+    forId TEXT,
+    mime TEXT,
+    props TEXT,
+    FOREIGN KEY (threadId) REFERENCES threads(id) ON DELETE CASCADE
+);
+
+-- Feedbacks table
+CREATE TABLE IF NOT EXISTS feedbacks (
+    id TEXT PRIMARY KEY,
+    forId TEXT NOT NULL,
+    threadId TEXT NOT NULL,
+    value INTEGER NOT NULL,
+    comment TEXT,
+    FOREIGN KEY (threadId) REFERENCES threads(id) ON DELETE CASCADE
+);
+
+-- Create indexes for better performance
+CREATE INDEX IF NOT EXISTS idx_users_identifier ON users(identifier);
+CREATE INDEX IF NOT EXISTS idx_threads_userId ON threads(userId);
+CREATE INDEX IF NOT EXISTS idx_threads_userIdentifier ON threads(userIdentifier);
+CREATE INDEX IF NOT EXISTS idx_steps_threadId ON steps(threadId);
+CREATE INDEX IF NOT EXISTS idx_steps_parentId ON steps(parentId);
+CREATE INDEX IF NOT EXISTS idx_elements_threadId ON elements(threadId);
+CREATE INDEX IF NOT EXISTS idx_elements_forId ON elements(forId);
+CREATE INDEX IF NOT EXISTS idx_feedbacks_threadId ON feedbacks(threadId);
+CREATE INDEX IF NOT EXISTS idx_feedbacks_forId ON feedbacks(forId);
+"""
+
+# Version 2: composite indexes for the queries Chainlit and app.py run on
+# every page load and resume (see HOT_QUERIES and --explain):
+# - steps(threadId, createdAt) serves "a thread's steps ordered by createdAt"
+#   and MAX(createdAt) per thread in the thread list without a sort. It makes
+#   idx_steps_threadId (its prefix) redundant.
+# - a partial index on root steps serves the resume query in app.py, which
+#   reads only the newest top-level messages of a thread.
+# idx_users_identifier duplicated the UNIQUE constraint's own index.
+COMPOSITE_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_steps_thread_created ON steps(threadId, createdAt);
+CREATE INDEX IF NOT EXISTS idx_steps_root_thread_created ON steps(threadId, createdAt) WHERE parentId IS NULL;
+DROP INDEX IF EXISTS idx_steps_threadId;
+DROP INDEX IF EXISTS idx_users_identifier;
+"""
+
+MIGRATIONS = [
+    (1, "Base Chainlit schema", BASE_SCHEMA),
+    (2, "Composite indexes for thread listing, thread steps and resume", COMPOSITE_INDEXES),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# The queries that run on every thread list, thread open and chat resume
+HOT_QUERIES = {
+    "list user threads": """
+        SELECT t."id", MAX(s."createdAt") AS updatedAt
+        FROM threads t LEFT JOIN steps s ON t."id" = s."threadId"
+        WHERE t."userId" = :user_id OR t."id" = :thread_id
+        GROUP BY t."id" ORDER BY updatedAt DESC LIMIT 1000""",
+    "thread steps by createdAt": """
+        SELECT s."id", f."value" FROM steps s LEFT JOIN feedbacks f ON s."id" = f."forId"
+        WHERE s."threadId" IN (:thread_id) ORDER BY s."createdAt" ASC""",
+    "resume root messages": """
+        SELECT "type", "output" FROM steps
+        WHERE "threadId" = :thread_id AND "parentId" IS NULL
+          AND "type" IN ('user_message', 'assistant_message')
+        ORDER BY "createdAt" DESC LIMIT 40""",
+    "thread elements": """SELECT "id" FROM elements WHERE "threadId" IN (:thread_id)""",
+    "user by identifier": """SELECT * FROM users WHERE identifier = :identifier""",
+}
+_SAMPLE_PARAMS = {"user_id": "u", "thread_id": "t", "identifier": "i"}
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    """Schema version of a database (0 if it has never been migrated). Read-only."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'"
+    ).fetchone()
+    if not exists:
+        return 0
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+def migrate(db_path: str) -> list:
+    """Apply pending migrations in order, each in its own transaction; returns the versions applied."""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    applied = []
+    try:
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                appliedAt TEXT NOT NULL
+            )""")
+        version = current_version(conn)
+        for number, description, sql in MIGRATIONS:
+            if number <= version:
+                continue
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for statement in sql.split(";"):
+                    if statement.strip():
+                        conn.execute(statement)
+                conn.execute(
+                    "INSERT INTO schema_version (version, description, appliedAt) VALUES (?, ?, ?)",
+                    (number, description, datetime.now(timezone.utc).isoformat()),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            applied.append(number)
+            print(f"⬆️  Applied migration {number}: {description}")
+        if applied:
+            # Refresh planner statistics for the new indexes
+            conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    return applied
+
+def optimize(db_path: str, vacuum: bool = True):
+    """Refresh planner statistics and (optionally) rebuild the file to reclaim space."""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        before = os.path.getsize(db_path)
+        conn.execute("ANALYZE")
+        conn.execute("PRAGMA optimize")
+        if vacuum:
+            conn.execute("VACUUM")
+        print(f"🧹 Optimized {db_path}: {before / 1024:.0f} KB -> {os.path.getsize(db_path) / 1024:.0f} KB")
+    finally:
+        conn.close()
+
+def explain_hot_queries(conn: sqlite3.Connection) -> dict:
+    """EXPLAIN QUERY PLAN for each hot query: {name: [plan lines]}."""
+    plans = {}
+    for name, sql in HOT_QUERIES.items():
+        rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", _SAMPLE_PARAMS).fetchall()
+        plans[name] = [row[-1] for row in rows]
+    return plans
 
 def create_database_sync(db_path: str = "chainlit_app.db"):
-    """Create the database schema using synchronous SQLite."""
-    
-    # SQLite-compatible schema
-    schema_sql = """
-    -- Enable foreign keys
-    PRAGMA foreign_keys = ON;
-    
-    -- Users table
-    CREATE TABLE IF NOT EXISTS users (
-        id TEXT PRIMARY KEY,
-        identifier TEXT NOT NULL UNIQUE,
-        metadata TEXT NOT NULL,
-        createdAt TEXT
-    );
-    
-    -- Threads table
-    CREATE TABLE IF NOT EXISTS threads (
-        id TEXT PRIMARY KEY,
-        createdAt TEXT,
-        name TEXT,
-        userId TEXT,
-        userIdentifier TEXT,
-        tags TEXT,
-        metadata TEXT,
-        FOREIGN KEY (userId) REFERENCES users(id) ON DELETE CASCADE
-    );
-    
-    -- Steps table
-    CREATE TABLE IF NOT EXISTS steps (
-        id TEXT PRIMARY KEY,
-        name TEXT NOT NULL,
-        type TEXT NOT NULL,
-        threadId TEXT NOT NULL,
-        parentId TEXT,
-        streaming INTEGER NOT NULL,
-        waitForAnswer INTEGER,
-        isError INTEGER,
-        metadata TEXT,
-        tags TEXT,
-        input TEXT,
-        output TEXT,
-        createdAt TEXT,
-        command TEXT,
-        start TEXT,
-        end TEXT,
-        generation TEXT,
-        showInput TEXT,
-        language TEXT,
-        indent INTEGER,
-        defaultOpen INTEGER,
-        FOREIGN KEY (threadId) REFERENCES threads(id) ON DELETE CASCADE
-    );
-    
-    -- Elements table
-    CREATE TABLE IF NOT EXISTS elements (
-        id TEXT PRIMARY KEY,
-        threadId TEXT,
-        type TEXT,
-        url TEXT,
-        chainlitKey TEXT,
-        name TEXT NOT NULL,
-        display TEXT,
-        objectKey TEXT,
-        size TEXT,
-        page INTEGER,
-        language TEXT,
-        forId TEXT,
-        mime TEXT,
-        props TEXT,
-        FOREIGN KEY (threadId) REFERENCES threads(id) ON DELETE CASCADE
-    );
-    
-    -- Feedbacks table
-    CREATE TABLE IF NOT EXISTS feedbacks (
-        id TEXT PRIMARY KEY,
-        forId TEXT NOT NULL,
-        threadId TEXT NOT NULL,
-        value INTEGER NOT NULL,
-        comment TEXT,
-        FOREIGN KEY (threadId) REFERENCES threads(id) ON DELETE CASCADE
-    );
-    
-    -- Create indexes for better performance
-    CREATE INDEX IF NOT EXISTS idx_users_identifier ON users(identifier);
-    CREATE INDEX IF NOT EXISTS idx_threads_userId ON threads(userId);
-    CREATE INDEX IF NOT EXISTS idx_threads_userIdentifier ON threads(userIdentifier);
-    CREATE INDEX IF NOT EXISTS idx_steps_threadId ON steps(threadId);
-    CREATE INDEX IF NOT EXISTS idx_steps_parentId ON steps(parentId);
-    CREATE INDEX IF NOT EXISTS idx_elements_threadId ON elements(threadId);
-    CREATE INDEX IF NOT EXISTS idx_elements_forId ON elements(forId);
-    CREATE INDEX IF NOT EXISTS idx_feedbacks_threadId ON feedbacks(threadId);
-    CREATE INDEX IF NOT EXISTS idx_feedbacks_forId ON feedbacks(forId);
-    """
+    """Create the database schema (or bring an existing one up to date)."""
     
     try:
-        # Connect to database (creates file if it doesn't exist)
-        conn = sqlite3.connect(db_path)
-        
-        # Execute the schema
-        conn.executescript(schema_sql)
+        migrate(db_path)
         
         # Verify tables were created
+        conn = sqlite3.connect(db_path)
         cursor = conn.cursor()
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
         tables = cursor.fetchall()
         
-        print(f"✅ Database created successfully: {db_path}")
+        print(f"✅ Database ready (schema version {current_version(conn)}): {db_path}")
         print(f"📊 Tables created: {[table[0] for table in tables]}")
         
         # Check if tables have expected structure
@@ -131,8 +245,16 @@ def create_database_sync(db_path: str = "chainlit_app.db"):
         print(f"❌ Error creating database: {e}")
         return False
 
+def _object_sizes(conn: sqlite3.Connection) -> dict:
+    """Bytes used per table/index (needs the dbstat virtual table; empty if unavailable)."""
+    try:
+        rows = conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name").fetchall()
+    except sqlite3.OperationalError:
+        return {}
+    return dict(rows)
+
 def inspect_database(db_path: str = "chainlit_app.db"):
-    """Inspect the database contents."""
+    """Inspect the database contents, sizes and index usage."""
     if not os.path.exists(db_path):
         print(f"❌ Database file {db_path} does not exist")
         return
@@ -140,31 +262,69 @@ def inspect_database(db_path: str = "chainlit_app.db"):
     try:
         conn = sqlite3.connect(db_path)
         cursor = conn.cursor()
+        sizes = _object_sizes(conn)
+        page_size = cursor.execute("PRAGMA page_size").fetchone()[0]
+        page_count = cursor.execute("PRAGMA page_count").fetchone()[0]
+        free_pages = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+        print(f"💾 File: {page_size * page_count / 1024:.0f} KB "
+              f"({free_pages * page_size / 1024:.0f} KB free), schema version {current_version(conn)}")
         
-        # Check table counts
+        # Check table counts and sizes
         tables = ['users', 'threads', 'steps', 'elements', 'feedbacks']
         for table in tables:
             cursor.execute(f"SELECT COUNT(*) FROM {table}")
             count = cursor.fetchone()[0]
-            print(f"📊 {table}: {count} rows")
+            size = f", {sizes[table] / 1024:.0f} KB" if table in sizes else ""
+            print(f"📊 {table}: {count} rows{size}")
+        
+        # Indexes, their sizes, and which hot queries use them
+        plans = explain_hot_queries(conn)
+        indexes = cursor.execute(
+            "SELECT name, tbl_name FROM sqlite_master WHERE type = 'index' ORDER BY tbl_name, name"
+        ).fetchall()
+        stats = dict(cursor.execute("SELECT idx, stat FROM sqlite_stat1").fetchall()) \
+            if cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone() else {}
+        print("🗂️  Indexes:")
+        for name, table in indexes:
+            used_by = [query for query, plan in plans.items() if any(f"INDEX {name} " in line + " " for line in plan)]
+            size = f"{sizes[name] / 1024:.0f} KB" if name in sizes else "size n/a"
+            stat = f", stat1 {stats[name]}" if name in stats else ""
+            print(f"   {table}.{name} ({size}{stat}) used by: {', '.join(used_by) or '-'}")
         
         conn.close()
         
     except Exception as e:
         print(f"❌ Error inspecting database: {e}")
 
+def print_query_plans(db_path: str):
+    conn = sqlite3.connect(db_path)
+    try:
+        for name, plan in explain_hot_queries(conn).items():
+            print(f"🔎 {name}:")
+            for line in plan:
+                print(f"   {line}")
+    finally:
+        conn.close()
+
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        db_path = sys.argv[1]
-    else:
-        db_path = "chainlit_app.db"
+    parser = argparse.ArgumentParser(description="Create, migrate and inspect the Chainlit SQLite database.")
+    parser.add_argument("db_path", nargs="?", default="chainlit_app.db")
+    parser.add_argument("--explain", action="store_true", help="show EXPLAIN QUERY PLAN for the hot queries")
+    parser.add_argument("--optimize", action="store_true", help="run ANALYZE and VACUUM after migrating")
+    args = parser.parse_args()
+    db_path = args.db_path
     
     print(f"🔧 Creating Chainlit SQLite database: {db_path}")
     
     if create_database_sync(db_path):
+        if args.optimize:
+            optimize(db_path)
         print(f"\n🔍 Database inspection:")
         inspect_database(db_path)
+        if args.explain:
+            print()
+            print_query_plans(db_path)
         print(f"\n✅ Ready to use! Run your Chainlit app with: chainlit run app.py")
     else:
         print("❌ Failed to create database")
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
@@ -0,0 +1,261 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Cache location and limits (override via environment variables)
+PAGE_CACHE_PATH = os.getenv("PAGE_CACHE_PATH", os.path.join("cache", "page_cache.sqlite"))
+PAGE_CACHE_MAX_MB = float(os.getenv("PAGE_CACHE_MAX_MB", "256"))
+PAGE_CACHE_DEFAULT_TTL = int(os.getenv("PAGE_CACHE_DEFAULT_TTL", str(24 * 3600)))
+# Comma separated "domain=seconds" pairs, matched on domain suffix
+PAGE_CACHE_DOMAIN_TTLS = os.getenv(
+    "PAGE_CACHE_DOMAIN_TTLS",
+    "wikipedia.org=604800,doi.org=2592000,uea.ac.uk=86400"
+)
+REVALIDATE_TIMEOUT = float(os.getenv("PAGE_CACHE_REVALIDATE_TIMEOUT", "5"))
+
+# Query parameters that never change page content
+_TRACKING_PARAMS = ("utm_", "fbclid", "gclid", "mc_cid", "mc_eid")
+
+
+def normalize_url(url: str) -> str:
+    """Normalise a URL so trivially different spellings share a cache entry."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower() or "http"
+    host = (parts.hostname or "").lower()
+    port = parts.port
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+    path = parts.path or "/"
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith(_TRACKING_PARAMS)
+    )
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+
+def _parse_domain_ttls(spec: str) -> Dict[str, int]:
+    ttls = {}
+    for item in spec.split(","):
+        if "=" in item:
+            domain, seconds = item.split("=", 1)
+            ttls[domain.strip().lower()] = int(seconds)
+    return ttls
+
+
+class PageCache:
+    """Content-addressed SQLite cache for scraped pages.
+
+    Entries are keyed by a hash of the normalised URL, CSS selector and an
+    optional variant (e.g. an extraction prompt). Fresh entries are served
+    directly; stale entries that carry an ETag or Last-Modified header are
+    revalidated with a conditional request before being reused. Total payload
+    size is capped and the least recently used entries are evicted first.
+    """
+
+    def __init__(self, path: str = PAGE_CACHE_PATH, max_bytes: Optional[int] = None,
+                 default_ttl: int = PAGE_CACHE_DEFAULT_TTL,
+                 domain_ttls: Optional[Dict[str, int]] = None):
+        self.path = path
+        self.max_bytes = int(max_bytes if max_bytes is not None else PAGE_CACHE_MAX_MB * 1024 * 1024)
+        self.default_ttl = default_ttl
+        self.domain_ttls = domain_ttls if domain_ttls is not None else _parse_domain_ttls(PAGE_CACHE_DOMAIN_TTLS)
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS pages (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                domain TEXT NOT NULL,
+                payload BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_pages_last_access ON pages(last_access);
+        """)
+
+    @staticmethod
+    def make_key(url: str, css_selector: Optional[str] = None, variant: Optional[str] = None) -> str:
+        raw = "\x1f".join([normalize_url(url), css_selector or "", variant or ""])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def ttl_for(self, url: str) -> int:
+        """Return the TTL for a URL, using the most specific matching domain rule."""
+        host = (urlsplit(url).hostname or "").lower()
+        best, best_len = self.default_ttl, -1
+        for domain, ttl in self.domain_ttls.items():
+            if (host == domain or host.endswith("." + domain)) and len(domain) > best_len:
+                best, best_len = ttl, len(domain)
+        return best
+
+    def _lookup(self, key: str):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT url, payload, etag, last_modified, expires_at FROM pages WHERE key = ?",
+                (key,)
+            ).fetchone()
+
+    def _touch(self, key: str, expires_at: Optional[float] = None):
+        now = time.time()
+        with self._lock:
+            if expires_at is None:
+                self._conn.execute("UPDATE pages SET last_access = ? WHERE key = ?", (now, key))
+            else:
+                self._conn.execute(
+                    "UPDATE pages SET last_access = ?, expires_at = ? WHERE key = ?",
+                    (now, expires_at, key)
+                )
+            self._conn.commit()
+
+    def get(self, url: str, css_selector: Optional[str] = None,
+            variant: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Return a fresh cached payload without any network revalidation."""
+        key = self.make_key(url, css_selector, variant)
+        row = self._lookup(key)
+        if row is None or row[4] < time.time():
+            self.misses += 1
+            return None
+        self._touch(key)
+        self.hits += 1
+        return json.loads(row[1])
+
+    def _hit(self, key: str, payload: bytes, expires_at: Optional[float] = None) -> Dict[str, Any]:
+        self._touch(key, expires_at)
+        self.hits += 1
+        return json.loads(payload)
+
+    async def aget(self, url: str, css_selector: Optional[str] = None,
+                   variant: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Return a cached payload, revalidating stale entries with ETag/Last-Modified.
+
+        SQLite access and decoding of (possibly multi-MB) payloads run in a
+        worker thread so a lookup never stalls the event loop.
+        """
+        key = self.make_key(url, css_selector, variant)
+        row = await asyncio.to_thread(self._lookup, key)
+        if row is None:
+            self.misses += 1
+            return None
+
+        cached_url, payload, etag, last_modified, expires_at = row
+        if expires_at >= time.time():
+            return await asyncio.to_thread(self._hit, key, payload)
+
+        if (etag or last_modified) and await asyncio.to_thread(
+                self._not_modified, cached_url, etag, last_modified):
+            self.revalidated += 1
+            return await asyncio.to_thread(self._hit, key, payload, time.time() + self.ttl_for(cached_url))
+
+        self.misses += 1
+        return None
+
+    def _not_modified(self, url: str, etag: Optional[str], last_modified: Optional[str]) -> bool:
+        """Send a conditional GET and report whether the server answered 304."""
+        headers = {"User-Agent": "ESI-PageCache/1.0"}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        request = urllib.request.Request(url, headers=headers, method="GET")
+        try:
+            with urllib.request.urlopen(request, timeout=REVALIDATE_TIMEOUT) as response:
+                return response.status == 304
+        except urllib.error.HTTPError as e:
+            return e.code == 304
+        except Exception as e:
+            print(f"Page cache revalidation failed for {url}: {e}")
+            return False
+
+    def put(self, url: str, payload: Dict[str, Any], css_selector: Optional[str] = None,
+            variant: Optional[str] = None, headers: Optional[Dict[str, str]] = None):
+        """Store a payload, recording validators from the response headers if present."""
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        data = json.dumps(payload, default=str).encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+        key = self.make_key(url, css_selector, variant)
+        normalized = normalize_url(url)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages "
+                "(key, url, domain, payload, size, etag, last_modified, fetched_at, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, normalized, urlsplit(normalized).hostname or "", data, len(data),
+                 headers.get("etag"), headers.get("last-modified"),
+                 now, now + self.ttl_for(normalized), now)
+            )
+            self._evict_locked()
+            self._conn.commit()
+
+    async def aput(self, url: str, payload: Dict[str, Any], css_selector: Optional[str] = None,
+                   variant: Optional[str] = None, headers: Optional[Dict[str, str]] = None):
+        """`put` in a worker thread: encoding, the write and eviction stay off the event loop."""
+        await asyncio.to_thread(self.put, url, payload, css_selector, variant, headers)
+
+    def _evict_locked(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute(
+                "SELECT key, size FROM pages ORDER BY last_access ASC").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM pages WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+
+    def clear(self):
+        """Remove every cached page."""
+        with self._lock:
+            self._conn.execute("DELETE FROM pages")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and current cache size."""
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pages").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
+
+
+_page_cache: Optional[PageCache] = None
+_page_cache_lock = threading.Lock()
+
+def get_page_cache() -> PageCache:
+    """Return the process-wide page cache, opening it on first use."""
+    global _page_cache
+    with _page_cache_lock:
+        if _page_cache is None:
+            _page_cache = PageCache()
+        return _page_cache
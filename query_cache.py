@@ -0,0 +1,211 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+from tracing import annotate
+
+# Size cap and default TTL for cached search results
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "2000"))
+SEARCH_CACHE_DEFAULT_TTL = int(os.getenv("SEARCH_CACHE_DEFAULT_TTL", "3600"))
+# Comma separated "tool=seconds" pairs
+SEARCH_CACHE_TTLS = os.getenv("SEARCH_CACHE_TTLS", "tavily_search=3600,semanticscholar=86400,wikipedia=604800")
+# Near-duplicate matching by embedding similarity (off unless enabled)
+SEARCH_CACHE_SEMANTIC = os.getenv("SEARCH_CACHE_SEMANTIC", "false").lower() in ("1", "true", "yes")
+SEARCH_CACHE_SIMILARITY = float(os.getenv("SEARCH_CACHE_SIMILARITY", "0.92"))
+SEARCH_CACHE_EMBED_MODEL = os.getenv("SEARCH_CACHE_EMBED_MODEL", "models/text-embedding-004")
+# Recent query embeddings kept so a miss is embedded once for both the lookup and the store
+SEARCH_CACHE_EMBED_MEMO = int(os.getenv("SEARCH_CACHE_EMBED_MEMO", "256"))
+
+EmbedFn = Callable[[str], Awaitable[List[float]]]
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace."""
+    query = re.sub(r"[^\w\s-]", " ", query.lower())
+    return " ".join(query.split())
+
+
+@dataclass
+class _Entry:
+    value: str
+    expires_at: float
+    embedding: Optional[np.ndarray] = None
+
+
+class QueryCache:
+    """LRU cache of search tool results with optional near-duplicate matching.
+
+    Lookups first try the exact normalised query. If semantic matching is
+    enabled, a miss falls back to the most similar cached query in the same
+    namespace whose cosine similarity is above the threshold.
+    """
+
+    def __init__(self, max_entries: int = SEARCH_CACHE_MAX_ENTRIES,
+                 ttls: Optional[Dict[str, int]] = None,
+                 default_ttl: int = SEARCH_CACHE_DEFAULT_TTL,
+                 embed_fn: Optional[EmbedFn] = None,
+                 similarity_threshold: float = SEARCH_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttls = ttls if ttls is not None else _parse_ttls(SEARCH_CACHE_TTLS)
+        self.default_ttl = default_ttl
+        self.embed_fn = embed_fn
+        self.similarity_threshold = similarity_threshold
+        self._entries: "OrderedDict[tuple, _Entry]" = OrderedDict()
+        self._embeddings: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _ttl(self, namespace: str) -> int:
+        return self.ttls.get(namespace.split(":", 1)[0], self.default_ttl)
+
+    async def _embed(self, text: str) -> Optional[np.ndarray]:
+        """Unit-length embedding of a normalised query, memoised per query text."""
+        if self.embed_fn is None:
+            return None
+        with self._lock:
+            vector = self._embeddings.get(text)
+            if vector is not None:
+                self._embeddings.move_to_end(text)
+                return vector
+        try:
+            vector = np.asarray(await self.embed_fn(text), dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            if not norm:
+                return None
+            vector = vector / norm
+        except Exception as e:
+            print(f"Query cache embedding failed: {e}")
+            return None
+        with self._lock:
+            self._embeddings[text] = vector
+            while len(self._embeddings) > SEARCH_CACHE_EMBED_MEMO:
+                self._embeddings.popitem(last=False)
+        return vector
+
+    def _get_exact(self, key: tuple) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry.value
+
+    def _get_similar(self, namespace: str, embedding: np.ndarray) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            candidates = [
+                (key, entry) for key, entry in self._entries.items()
+                if key[0] == namespace and entry.embedding is not None and entry.expires_at >= now
+            ]
+        if not candidates:
+            return None
+        # Score outside the lock so concurrent lookups and stores are not held up
+        scores = np.stack([entry.embedding for _, entry in candidates]) @ embedding
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            return None
+        key, entry = candidates[best]
+        with self._lock:
+            if self._entries.get(key) is entry:
+                self._entries.move_to_end(key)
+        return entry.value
+
+    async def aget(self, namespace: str, query: str) -> Optional[str]:
+        """Return a cached result for the query, or None on a miss."""
+        key = (namespace, normalize_query(query))
+        value = self._get_exact(key)
+        if value is not None:
+            self.exact_hits += 1
+            return value
+        if self.embed_fn is not None:
+            embedding = await self._embed(key[1])
+            if embedding is not None:
+                value = self._get_similar(namespace, embedding)
+                if value is not None:
+                    self.semantic_hits += 1
+                    return value
+        self.misses += 1
+        return None
+
+    async def aput(self, namespace: str, query: str, value: str):
+        """Store a result, evicting the least recently used entries over the cap."""
+        key = (namespace, normalize_query(query))
+        embedding = await self._embed(key[1])
+        with self._lock:
+            self._entries[key] = _Entry(value, time.time() + self._ttl(namespace), embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    async def cached(self, namespace: str, query: str,
+                     fetch: Callable[[], Awaitable[str]],
+                     cacheable: Callable[[str], bool] = lambda result: True) -> str:
+        """Return the cached result for a query, calling `fetch` on a miss."""
+        value = await self.aget(namespace, query)
+        annotate(cache="hit" if value is not None else "miss")
+        if value is not None:
+            return value
+        value = await fetch()
+        if cacheable(value):
+            await self.aput(namespace, query, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._embeddings.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and hit rate."""
+        hits = self.exact_hits + self.semantic_hits
+        lookups = hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+        }
+
+
+def _parse_ttls(spec: str) -> Dict[str, int]:
+    ttls = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, seconds = item.split("=", 1)
+            ttls[name.strip()] = int(seconds)
+    return ttls
+
+def _default_embed_fn() -> Optional[EmbedFn]:
+    """Google embeddings for near-duplicate matching, if enabled and configured."""
+    if not SEARCH_CACHE_SEMANTIC or not os.getenv("GOOGLE_API_KEY"):
+        return None
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    embeddings = GoogleGenerativeAIEmbeddings(model=SEARCH_CACHE_EMBED_MODEL)
+    return embeddings.aembed_query
+
+
+_query_cache: Optional[QueryCache] = None
+_query_cache_lock = threading.Lock()
+
+def get_query_cache() -> QueryCache:
+    """Return the process-wide search result cache."""
+    global _query_cache
+    with _query_cache_lock:
+        if _query_cache is None:
+            _query_cache = QueryCache(embed_fn=_default_embed_fn())
+        return _query_cache
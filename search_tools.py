@@ -0,0 +1,237 @@
+import asyncio
+import json
+import os
+import weakref
+from typing import Dict, Type
+
+import httpx
+from langchain_core.tools import BaseTool
+from pydantic import BaseModel, Field
+
+from loop_bridge import run_sync, on_background_shutdown
+from query_cache import get_query_cache
+
+# Provider endpoints (overridable, e.g. to point at local stand-ins)
+TAVILY_API_URL = os.getenv("TAVILY_API_URL", "https://api.tavily.com")
+SEMANTIC_SCHOLAR_API_URL = os.getenv("SEMANTIC_SCHOLAR_API_URL", "https://api.semanticscholar.org/graph/v1")
+WIKIPEDIA_API_URL = os.getenv("WIKIPEDIA_API_URL", "https://en.wikipedia.org/w/api.php")
+
+# Per-request timeout in seconds
+SEARCH_TIMEOUT = float(os.getenv("SEARCH_TIMEOUT", "15"))
+# Maximum in-flight requests per provider, as comma separated "provider=limit" pairs
+SEARCH_CONCURRENCY = os.getenv("SEARCH_CONCURRENCY", "tavily=8,semanticscholar=2,wikipedia=4")
+
+USER_AGENT = "ESI-Scholarly-Instructor/1.0"
+
+
+def _parse_limits(spec: str) -> Dict[str, int]:
+    limits = {}
+    for item in spec.split(","):
+        if "=" in item:
+            provider, limit = item.split("=", 1)
+            limits[provider.strip()] = max(1, int(limit))
+    return limits
+
+_provider_limits = _parse_limits(SEARCH_CONCURRENCY)
+
+
+class _LoopResources:
+    """HTTP client and provider semaphores bound to one event loop."""
+
+    def __init__(self):
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(SEARCH_TIMEOUT, connect=5.0),
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=30),
+            headers={"User-Agent": USER_AGENT},
+        )
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def semaphore(self, provider: str) -> asyncio.Semaphore:
+        if provider not in self.semaphores:
+            self.semaphores[provider] = asyncio.Semaphore(_provider_limits.get(provider, 4))
+        return self.semaphores[provider]
+
+
+_resources: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopResources]" = weakref.WeakKeyDictionary()
+
+def _get_resources() -> _LoopResources:
+    loop = asyncio.get_running_loop()
+    resources = _resources.get(loop)
+    if resources is None:
+        resources = _LoopResources()
+        _resources[loop] = resources
+    return resources
+
+async def close_search_clients():
+    """Close the pooled HTTP client of the running event loop."""
+    resources = _resources.pop(asyncio.get_running_loop(), None)
+    if resources is not None:
+        await resources.client.aclose()
+
+on_background_shutdown(close_search_clients)
+
+
+async def _request(provider: str, method: str, url: str, **kwargs) -> httpx.Response:
+    """Send a request through the shared client under the provider's concurrency limit.
+
+    A single retry is made on HTTP 429, honouring Retry-After (capped at 5s).
+    """
+    resources = _get_resources()
+    async with resources.semaphore(provider):
+        response = await resources.client.request(method, url, **kwargs)
+        if response.status_code == 429:
+            try:
+                delay = min(float(response.headers.get("Retry-After", "1")), 5.0)
+            except ValueError:
+                delay = 1.0
+            await asyncio.sleep(delay)
+            response = await resources.client.request(method, url, **kwargs)
+        response.raise_for_status()
+        return response
+
+
+def _cacheable(result: str) -> bool:
+    """Only successful, non-empty searches are worth caching."""
+    return not result.startswith(("Error", "No good"))
+
+
+class SearchInput(BaseModel):
+    """Input for the search tools."""
+    query: str = Field(description="The search query")
+
+
+class AsyncTavilySearchTool(BaseTool):
+    """Tavily web search over the shared async HTTP client."""
+
+    name: str = "tavily_search"
+    description: str = "Search the web for current information, news, and general knowledge. Use this for real-time information, current events, or when you need up-to-date web content."
+    args_schema: Type[BaseModel] = SearchInput
+    max_results: int = 5
+    search_depth: str = "advanced"
+    include_answer: bool = True
+
+    def _run(self, query: str) -> str:
+        return run_sync(self._arun(query), timeout=SEARCH_TIMEOUT * 2)
+
+    async def _arun(self, query: str) -> str:
+        namespace = f"{self.name}:{self.max_results}:{self.search_depth}:{self.include_answer}"
+        return await get_query_cache().cached(namespace, query, lambda: self._search(query), _cacheable)
+
+    async def _search(self, query: str) -> str:
+        try:
+            response = await _request(
+                "tavily", "POST", f"{TAVILY_API_URL}/search",
+                headers={"Authorization": f"Bearer {os.getenv('TAVILY_API_KEY', '')}"},
+                json={
+                    "query": query,
+                    "max_results": self.max_results,
+                    "search_depth": self.search_depth,
+                    "include_answer": self.include_answer,
+                    "include_raw_content": False,
+                    "include_images": False,
+                },
+            )
+            data = response.json()
+            return json.dumps({
+                "query": query,
+                "answer": data.get("answer"),
+                "results": [
+                    {"title": r.get("title"), "url": r.get("url"), "content": r.get("content")}
+                    for r in data.get("results", [])
+                ],
+            }, indent=2)
+        except Exception as e:
+            return f"Error in Tavily search: {str(e)}"
+
+
+class AsyncSemanticScholarTool(BaseTool):
+    """Semantic Scholar paper search over the shared async HTTP client."""
+
+    name: str = "semanticscholar"
+    description: str = "A wrapper around semanticscholar.org. Useful for when you need to answer questions about research papers. Input should be a search query."
+    args_schema: Type[BaseModel] = SearchInput
+    top_k_results: int = 10
+
+    def _run(self, query: str) -> str:
+        return run_sync(self._arun(query), timeout=SEARCH_TIMEOUT * 2)
+
+    async def _arun(self, query: str) -> str:
+        namespace = f"{self.name}:{self.top_k_results}"
+        return await get_query_cache().cached(namespace, query, lambda: self._search(query), _cacheable)
+
+    async def _search(self, query: str) -> str:
+        try:
+            headers = {}
+            if os.getenv("SEMANTIC_SCHOLAR_API_KEY"):
+                headers["x-api-key"] = os.getenv("SEMANTIC_SCHOLAR_API_KEY")
+            response = await _request(
+                "semanticscholar", "GET", f"{SEMANTIC_SCHOLAR_API_URL}/paper/search",
+                headers=headers,
+                params={
+                    "query": query,
+                    "limit": self.top_k_results,
+                    "fields": "title,abstract,authors,year,venue,citationCount,externalIds",
+                },
+            )
+            papers = response.json().get("data") or []
+            if not papers:
+                return "No good Semantic Scholar Result was found"
+            documents = []
+            for paper in papers:
+                authors = ", ".join(a.get("name", "") for a in paper.get("authors") or [])
+                doi = (paper.get("externalIds") or {}).get("DOI")
+                documents.append(
+                    f"Published year: {paper.get('year')}\n"
+                    f"Title: {paper.get('title')}\n"
+                    f"Authors: {authors}\n"
+                    f"Venue: {paper.get('venue')}\n"
+                    f"Citations: {paper.get('citationCount')}\n"
+                    f"DOI: {'https://doi.org/' + doi if doi else 'N/A'}\n"
+                    f"Abstract: {paper.get('abstract')}\n"
+                )
+            return "\n\n".join(documents)
+        except Exception as e:
+            return f"Error in Semantic Scholar search: {str(e)}"
+
+
+class AsyncWikipediaTool(BaseTool):
+    """Wikipedia search returning page summaries, over the shared async HTTP client."""
+
+    name: str = "wikipedia"
+    description: str = "A wrapper around Wikipedia. Useful for when you need to answer general questions about people, places, companies, facts, historical events, or other subjects. Input should be a search query."
+    args_schema: Type[BaseModel] = SearchInput
+    top_k_results: int = 3
+    doc_content_chars_max: int = 4000
+
+    def _run(self, query: str) -> str:
+        return run_sync(self._arun(query), timeout=SEARCH_TIMEOUT * 2)
+
+    async def _arun(self, query: str) -> str:
+        namespace = f"{self.name}:{self.top_k_results}"
+        return await get_query_cache().cached(namespace, query, lambda: self._search(query), _cacheable)
+
+    async def _search(self, query: str) -> str:
+        try:
+            response = await _request(
+                "wikipedia", "GET", WIKIPEDIA_API_URL,
+                params={
+                    "action": "query",
+                    "format": "json",
+                    "generator": "search",
+                    "gsrsearch": query,
+                    "gsrlimit": self.top_k_results,
+                    "prop": "extracts",
+                    "exintro": 1,
+                    "explaintext": 1,
+                },
+            )
+            pages = (response.json().get("query") or {}).get("pages") or {}
+            summaries = [
+                f"Page: {page.get('title')}\nSummary: {page.get('extract', '').strip()}"
+                for page in sorted(pages.values(), key=lambda p: p.get("index", 0))
+            ]
+            if not summaries:
+                return "No good Wikipedia Search Result was found"
+            return "\n\n".join(summaries)[: self.doc_content_chars_max]
+        except Exception as e:
+            return f"Error in Wikipedia search: {str(e)}"
@@ -0,0 +1,23 @@
+import pandas as pd
+import pytest
+from pyarrow import feather
+
+from uploaded_data import DatasetStore
+
+
+@pytest.mark.parametrize("suffix", [".xlsx", ".csv"])
+def test_mixed_type_column_is_converted(tmp_path, suffix):
+    pytest.importorskip("openpyxl")
+    upload = tmp_path / f"survey{suffix}"
+    df = pd.DataFrame({"id": [1, 2, 3], "score": [5, "missing", 7]})
+    if suffix == ".xlsx":
+        df.to_excel(upload, index=False)
+    else:
+        df.to_csv(upload, index=False)
+
+    [dataset] = DatasetStore(root=str(tmp_path / "converted")).ingest(str(upload), upload.name)
+
+    table = feather.read_table(dataset.path).to_pandas()
+    assert table["score"].astype(str).tolist() == ["5", "missing", "7"]
+    assert table["id"].tolist() == [1, 2, 3]
+    assert dataset.rows == 3
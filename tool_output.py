@@ -0,0 +1,341 @@
+import json
+import os
+import re
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from html.parser import HTMLParser
+from typing import Any, Dict, List, Optional, Type
+from urllib.parse import urlsplit, urlunsplit
+
+from langchain_core.tools import BaseTool
+from pydantic import BaseModel, Field
+
+from code_executor import current_code_session
+
+# Token budget per tool output, as comma separated "tool=tokens" pairs (0 leaves a tool's output as is)
+TOOL_OUTPUT_BUDGETS = os.getenv(
+    "TOOL_OUTPUT_BUDGETS",
+    "tavily_search=1500,semanticscholar=2500,wikipedia=1200,rag_search=2500,crawl4ai_scraper=3000,"
+    "advanced_crawl4ai=3000,smart_extraction=2000,batch_crawl4ai=4000,python_repl=3000"
+)
+TOOL_OUTPUT_DEFAULT_BUDGET = int(os.getenv("TOOL_OUTPUT_DEFAULT_BUDGET", "2500"))
+# Tools returning web content, which is cleaned (HTML to text, boilerplate, duplicate links) before budgeting
+TOOL_OUTPUT_CLEAN_TOOLS = os.getenv(
+    "TOOL_OUTPUT_CLEAN_TOOLS",
+    "tavily_search,semanticscholar,wikipedia,crawl4ai_scraper,advanced_crawl4ai,smart_extraction,batch_crawl4ai"
+)
+# Links kept from a page's (deduplicated) link lists
+TOOL_OUTPUT_MAX_LINKS = int(os.getenv("TOOL_OUTPUT_MAX_LINKS", "25"))
+# Full outputs kept per chat for paging with read_tool_output (least recently used are dropped)
+TOOL_OUTPUT_STORE_SIZE = int(os.getenv("TOOL_OUTPUT_STORE_SIZE", "64"))
+
+PAGER_TOOL_NAME = "read_tool_output"
+
+# Lines that are site furniture rather than content
+_BOILERPLATE_RE = re.compile(
+    r"^\W*(skip to (main )?content|(accept|reject)( all)? cookies|we use cookies|cookie (policy|settings|preferences)|"
+    r"subscribe to our newsletter|all rights reserved|privacy policy|terms (of use|and conditions)|back to top|"
+    r"share (this|on)|follow us)\b.{0,60}$",
+    re.IGNORECASE,
+)
+# Short navigation labels dropped when they are a whole line on their own
+_NAV_LINES = {"menu", "search", "home", "sign in", "sign up", "log in", "login", "register", "share", "print",
+              "close", "next", "previous", "toggle navigation", "main menu"}
+_HTML_RE = re.compile(r"<(html|body|div|p|span|a|h[1-6]|ul|li|table|article|section)[\s>/]", re.IGNORECASE)
+_SKIP_TAGS = {"script", "style", "noscript", "svg", "iframe", "nav", "header", "footer", "aside", "form",
+              "button", "template"}
+_BLOCK_TAGS = {"p", "div", "section", "article", "main", "br", "tr", "table", "ul", "ol", "blockquote",
+               "pre", "figure", "figcaption", "dl", "dt", "dd"}
+
+_current_model: ContextVar[Optional[str]] = ContextVar("tool_output_model", default=None)
+
+
+def _parse_budgets(spec: str) -> Dict[str, int]:
+    budgets = {}
+    for item in spec.split(","):
+        if "=" in item:
+            tool, tokens = item.split("=", 1)
+            budgets[tool.strip()] = int(tokens)
+    return budgets
+
+_budgets = _parse_budgets(TOOL_OUTPUT_BUDGETS)
+_clean_tools = {name.strip() for name in TOOL_OUTPUT_CLEAN_TOOLS.split(",") if name.strip()}
+
+def tool_budget(tool_name: str) -> int:
+    return _budgets.get(tool_name, TOOL_OUTPUT_DEFAULT_BUDGET)
+
+
+@contextmanager
+def tool_output_model(model: str):
+    """Count tool output tokens with this model's tokenizer for the duration of the block."""
+    token = _current_model.set(model)
+    try:
+        yield
+    finally:
+        _current_model.reset(token)
+
+@lru_cache(maxsize=16)
+def _encoding(model: Optional[str]):
+    """tiktoken encoding for a model (a general one for non-OpenAI models), or None without tiktoken."""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model((model or "").split("/")[-1])
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Token count with tiktoken when installed, else ~4 characters per token.
+
+    Gemini's own tokenizer is only available through an API call, so a local
+    BPE tokenizer stands in for it; budgets only need to be roughly right.
+    """
+    encoding = _encoding(model or _current_model.get())
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+class _TextExtractor(HTMLParser):
+    """HTML to markdown-ish text: headings, list items and paragraphs; page furniture dropped."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip += 1
+        elif self._skip:
+            return
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n\n")
+        elif re.fullmatch(r"h[1-6]", tag):
+            self.parts.append("\n\n" + "#" * int(tag[1]) + " ")
+        elif tag == "li":
+            self.parts.append("\n- ")
+        elif tag in ("td", "th"):
+            self.parts.append(" | ")
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            self._skip = max(0, self._skip - 1)
+        elif self._skip:
+            return
+        elif tag in _BLOCK_TAGS or re.fullmatch(r"h[1-6]", tag):
+            self.parts.append("\n\n")
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+def html_to_text(html: str) -> str:
+    """Readable text from HTML, without scripts, styles, navigation, headers and footers."""
+    extractor = _TextExtractor()
+    try:
+        extractor.feed(html)
+        extractor.close()
+    except Exception:
+        # Malformed markup: fall back to stripping tags
+        return re.sub(r"<[^>]+>", " ", html)
+    return "".join(extractor.parts)
+
+def clean_text(text: str) -> str:
+    """Convert HTML if needed, drop boilerplate and repeated lines, and collapse whitespace."""
+    if _HTML_RE.search(text):
+        text = html_to_text(text)
+    lines, seen = [], set()
+    for line in text.splitlines():
+        line = re.sub(r"[ \t ]+", " ", line).strip()
+        if not line:
+            if lines and lines[-1]:
+                lines.append("")
+            continue
+        if _BOILERPLATE_RE.match(line) or line.lower().strip(" -|·•") in _NAV_LINES:
+            continue
+        # Navigation and link lists repeated across a page are kept once
+        key = line.lower()
+        if len(line) < 200 and key in seen:
+            continue
+        seen.add(key)
+        lines.append(line)
+    return "\n".join(lines).strip()
+
+def _normalize_link(url: str) -> str:
+    parts = urlsplit(url.strip())
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/") or "/", parts.query, ""))
+
+def dedupe_links(links: Any, max_links: int = TOOL_OUTPUT_MAX_LINKS) -> List[Dict[str, str]]:
+    """Flatten crawl4ai-style link lists ({"internal": [...], "external": [...]}) and drop duplicates."""
+    if isinstance(links, dict):
+        items = [dict(link, kind=kind) if isinstance(link, dict) else {"href": link, "kind": kind}
+                 for kind, group in links.items() for link in group or []]
+    else:
+        items = [link if isinstance(link, dict) else {"href": link} for link in links or []]
+    unique, seen = [], set()
+    for link in items:
+        href = link.get("href") or link.get("url") or ""
+        if not href or href.startswith(("javascript:", "mailto:", "#")):
+            continue
+        key = _normalize_link(href)
+        if key in seen:
+            continue
+        seen.add(key)
+        entry = {"href": href, "text": " ".join(str(link.get("text") or "").split())[:100]}
+        if link.get("kind"):
+            entry["kind"] = link["kind"]
+        unique.append(entry)
+    return unique[:max_links]
+
+def _compact_value(value: Any, key: Optional[str] = None) -> Any:
+    """Clean the strings of a parsed JSON output; dedupe link lists and results with the same URL."""
+    if key == "links":
+        return dedupe_links(value)
+    if key == "media" and isinstance(value, dict):
+        # Media lists are rarely useful to the model; keep counts and a few described images
+        images = [m for m in value.get("images") or [] if isinstance(m, dict) and m.get("alt")]
+        return {"counts": {kind: len(items or []) for kind, items in value.items()},
+                "images": [{"src": m.get("src"), "alt": m.get("alt")} for m in images[:5]]}
+    if isinstance(value, str):
+        return clean_text(value) if len(value) > 80 else value.strip()
+    if isinstance(value, dict):
+        return {k: _compact_value(v, k) for k, v in value.items() if v not in (None, "", [], {})}
+    if isinstance(value, list):
+        items, seen = [], set()
+        for item in value:
+            url = item.get("url") if isinstance(item, dict) else None
+            if url:
+                if _normalize_link(url) in seen:
+                    continue
+                seen.add(_normalize_link(url))
+            items.append(_compact_value(item))
+        return items
+    return value
+
+def compact_output(text: str) -> str:
+    """Shared cleanup for any tool output (JSON or text)."""
+    stripped = text.strip()
+    if stripped[:1] in ("{", "["):
+        try:
+            return json.dumps(_compact_value(json.loads(stripped)), ensure_ascii=False, indent=1)
+        except ValueError:
+            pass
+    return clean_text(text)
+
+
+def split_pages(text: str, budget: int, model: Optional[str] = None) -> List[str]:
+    """Split text into pages of at most ~budget tokens, at paragraph, then line, boundaries."""
+    total = count_tokens(text, model)
+    if total <= budget:
+        return [text]
+    # Work in characters using this text's own characters-per-token ratio
+    max_chars = max(200, int(budget * len(text) / max(total, 1)))
+    pages, current = [], ""
+    for block in re.split(r"(\n\s*\n)", text):
+        pieces = [block]
+        if len(block) > max_chars:
+            pieces = block.splitlines(keepends=True)
+        for piece in pieces:
+            while len(piece) > max_chars:
+                if current:
+                    pages.append(current)
+                    current = ""
+                pages.append(piece[:max_chars])
+                piece = piece[max_chars:]
+            if current and len(current) + len(piece) > max_chars:
+                pages.append(current)
+                current = ""
+            current += piece
+    if current.strip():
+        pages.append(current)
+    return [page.strip("\n") for page in pages if page.strip()]
+
+
+class ToolOutputStore:
+    """Full tool outputs kept out of the prompt, split into pages the agent can request."""
+
+    def __init__(self, size: int = TOOL_OUTPUT_STORE_SIZE):
+        self.size = size
+        self._outputs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, tool_name: str, pages: List[str]) -> str:
+        output_id = f"out_{uuid.uuid4().hex[:10]}"
+        with self._lock:
+            self._outputs[output_id] = {"tool": tool_name, "pages": pages}
+            while len(self._outputs) > self.size:
+                self._outputs.popitem(last=False)
+        return output_id
+
+    def get(self, output_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._outputs.get(output_id)
+            if entry is not None:
+                self._outputs.move_to_end(output_id)
+            return entry
+
+
+# One store per chat session, so an output id only resolves in the chat that produced it
+_sessions: Dict[str, ToolOutputStore] = {}
+_sessions_lock = threading.Lock()
+
+def session_tool_outputs(session_id: str) -> ToolOutputStore:
+    with _sessions_lock:
+        return _sessions.setdefault(session_id, ToolOutputStore())
+
+def forget_session_tool_outputs(session_id: str):
+    with _sessions_lock:
+        _sessions.pop(session_id, None)
+
+def _page_footer(output_id: str, page: int, pages: int) -> str:
+    if page >= pages:
+        return f"\n\n[Page {page} of {pages} of output {output_id}; end of output.]"
+    return (f"\n\n[Page {page} of {pages}. The rest of this output is stored as {output_id}; call "
+            f"{PAGER_TOOL_NAME} with output_id='{output_id}' and page={page + 1} to continue.]")
+
+def process_tool_output(tool_name: str, content: str) -> str:
+    """Clean a web tool's output and fit any tool's output to its token budget, storing the rest for paging."""
+    budget = tool_budget(tool_name)
+    if tool_name == PAGER_TOOL_NAME or budget <= 0 or not content or content.startswith("Error"):
+        return content
+    text = compact_output(content) if tool_name in _clean_tools else content
+    pages = split_pages(text, budget)
+    if len(pages) == 1:
+        return text
+    output_id = session_tool_outputs(current_code_session()).put(tool_name, pages)
+    return pages[0] + _page_footer(output_id, 1, len(pages))
+
+
+class ToolOutputInput(BaseModel):
+    """Input for the tool output pager."""
+    output_id: str = Field(description="The output id given at the end of a shortened tool result, e.g. out_1a2b3c4d5e")
+    page: int = Field(default=2, description="Page number to read (page 1 was already returned)")
+
+class ToolOutputPagerTool(BaseTool):
+    """Returns further pages of a tool output that was too long to return in full."""
+
+    name: str = PAGER_TOOL_NAME
+    description: str = """
+    Read more of a tool result that was shortened to fit the context. Shortened results end
+    with a note giving an output_id and the next page number; pass those here.
+    """
+    args_schema: Type[BaseModel] = ToolOutputInput
+
+    def _run(self, output_id: str, page: int = 2) -> str:
+        entry = session_tool_outputs(current_code_session()).get(output_id.strip())
+        if entry is None:
+            return f"Error: no stored output called {output_id} (it may have expired); run the original tool again."
+        pages = entry["pages"]
+        if not 1 <= page <= len(pages):
+            return f"Error: output {output_id} has pages 1-{len(pages)}."
+        return pages[page - 1] + _page_footer(output_id, page, len(pages))
+
+    async def _arun(self, output_id: str, page: int = 2) -> str:
+        return self._run(output_id, page)
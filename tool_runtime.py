@@ -0,0 +1,151 @@
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from langchain_core.tools import BaseTool
+from langchain_core.messages import ToolMessage
+
+from tool_output import process_tool_output
+from tracing import metrics, span
+
+# Maximum tool calls from one turn running at the same time
+TOOL_MAX_CONCURRENCY = int(os.getenv("TOOL_MAX_CONCURRENCY", "4"))
+# Wall-clock budget (seconds) shared by every tool call in one turn
+TURN_DEADLINE_SECONDS = float(os.getenv("TURN_DEADLINE_SECONDS", "90"))
+# Outputs longer than this are post-processed in a worker thread
+TOOL_OUTPUT_INLINE_CHARS = int(os.getenv("TOOL_OUTPUT_INLINE_CHARS", "20000"))
+
+
+@dataclass
+class TurnBudget:
+    """Deadline and fan-out limit shared by all tool calls of one agent turn."""
+    deadline: float
+    semaphore: asyncio.Semaphore
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+
+_current_turn: ContextVar[Optional[TurnBudget]] = ContextVar("current_turn", default=None)
+
+@contextmanager
+def turn_budget(deadline_seconds: float = TURN_DEADLINE_SECONDS,
+                max_concurrency: int = TOOL_MAX_CONCURRENCY):
+    """Bound the tool calls made while streaming one agent turn.
+
+    The budget is stored in a context variable, so it follows the tasks
+    LangGraph spawns for the turn without being threaded through the graph.
+    """
+    budget = TurnBudget(
+        deadline=time.monotonic() + deadline_seconds,
+        semaphore=asyncio.Semaphore(max(1, max_concurrency)),
+    )
+    token = _current_turn.set(budget)
+    try:
+        yield budget
+    finally:
+        _current_turn.reset(token)
+
+def turn_time_remaining() -> Optional[float]:
+    """Seconds left before the current turn's deadline, or None outside a turn."""
+    budget = _current_turn.get()
+    return budget.remaining() if budget is not None else None
+
+
+class BoundedTool(BaseTool):
+    """Wrap a tool so its async calls respect the current turn's budget.
+
+    LangGraph's ToolNode already runs the tool calls of one AI message
+    concurrently and returns results in call order; this wrapper caps how many
+    run at once and turns calls that overrun the turn deadline into an error
+    ToolMessage instead of holding up the whole answer.
+    """
+
+    inner: BaseTool
+
+    def __init__(self, inner: BaseTool, **kwargs):
+        super().__init__(
+            inner=inner,
+            name=inner.name,
+            description=inner.description,
+            args_schema=inner.args_schema,
+            return_direct=inner.return_direct,
+            **kwargs
+        )
+
+    @property
+    def args(self) -> dict:
+        return self.inner.args
+
+    @property
+    def tool_call_schema(self):
+        return self.inner.tool_call_schema
+
+    def get_input_schema(self, config=None):
+        return self.inner.get_input_schema(config)
+
+    def _timeout_result(self, input: Any):
+        message = f"Tool '{self.name}' did not finish before the turn deadline and was cancelled."
+        if isinstance(input, dict) and input.get("type") == "tool_call":
+            return ToolMessage(content=message, name=self.name, tool_call_id=input["id"], status="error")
+        return message
+
+    def _process_output(self, result: Any) -> Any:
+        """Clean and budget the output (see tool_output), keeping ToolMessage metadata."""
+        if isinstance(result, ToolMessage) and isinstance(result.content, str):
+            content = process_tool_output(self.name, result.content)
+            return result if content == result.content else result.model_copy(update={"content": content})
+        if isinstance(result, str):
+            return process_tool_output(self.name, result)
+        return result
+
+    def invoke(self, input: Any, config=None, **kwargs) -> Any:
+        return self._process_output(self.inner.invoke(input, config, **kwargs))
+
+    async def ainvoke(self, input: Any, config=None, **kwargs) -> Any:
+        with span("tool", tool=self.name) as current:
+            result = await self._ainvoke_bounded(input, config, **kwargs)
+            raw = result.content if isinstance(result, ToolMessage) else result
+            if isinstance(raw, str) and len(raw) > TOOL_OUTPUT_INLINE_CHARS:
+                # Parsing and tokenizing a large page would stall the event loop
+                result = await asyncio.to_thread(self._process_output, result)
+            else:
+                result = self._process_output(result)
+            current.attributes["raw_bytes"] = len(str(raw).encode("utf-8"))
+            content = result.content if isinstance(result, ToolMessage) else result
+            size = len(str(content).encode("utf-8"))
+            current.attributes["bytes"] = size
+            metrics.observe("tool_output_bytes", size, tool=self.name)
+            # Tools annotate the span with cache="hit"/"miss" when they go through a cache
+            if "cache" in current.attributes:
+                metrics.increment("tool_cache", tool=self.name, result=current.attributes["cache"])
+            return result
+
+    async def _ainvoke_bounded(self, input: Any, config=None, **kwargs) -> Any:
+        budget = _current_turn.get()
+        if budget is None:
+            return await self.inner.ainvoke(input, config, **kwargs)
+
+        async def bounded():
+            async with budget.semaphore:
+                return await self.inner.ainvoke(input, config, **kwargs)
+
+        remaining = budget.remaining()
+        if remaining <= 0:
+            return self._timeout_result(input)
+        try:
+            # Waiting for a free slot counts against the deadline too
+            return await asyncio.wait_for(bounded(), timeout=remaining)
+        except asyncio.TimeoutError:
+            print(f"Tool {self.name} cancelled at turn deadline")
+            return self._timeout_result(input)
+
+    def _run(self, *args, **kwargs) -> Any:
+        return self.inner._run(*args, **kwargs)
+
+    async def _arun(self, *args, **kwargs) -> Any:
+        return await self.inner._arun(*args, **kwargs)
@@ -0,0 +1,211 @@
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+# Append finished spans as JSON lines to this file (disabled when empty)
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+# Recent samples kept per histogram for percentile estimates
+TRACE_RESERVOIR = int(os.getenv("TRACE_RESERVOIR", "2048"))
+METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
+QUANTILES = (0.5, 0.95, 0.99)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Count, sum and a window of recent samples for p50/p95/p99."""
+
+    def __init__(self, reservoir: int = TRACE_RESERVOIR):
+        self.count = 0
+        self.sum = 0.0
+        self.samples: deque = deque(maxlen=reservoir)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        self.samples.append(value)
+
+    def quantile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+@dataclass
+class Span:
+    name: str
+    labels: Dict[str, str]
+    trace_id: str
+    span_id: str = field(default_factory=lambda: uuid.uuid4().hex[:16])
+    parent_id: Optional[str] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    start: float = field(default_factory=time.time)
+
+
+class Metrics:
+    """In-process histograms and counters, rendered as OpenMetrics text."""
+
+    def __init__(self):
+        self.histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(labels: Dict[str, Any]) -> LabelKey:
+        return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+    def observe(self, name: str, value: float, **labels):
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            key = self._key(labels)
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    def increment(self, name: str, value: float = 1.0, **labels):
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            key = self._key(labels)
+            series[key] = series.get(key, 0.0) + value
+
+    def summary(self) -> Dict[str, list]:
+        """{metric: [{labels, count, p50, p95, p99}]} for logs and benchmarks."""
+        with self._lock:
+            return {
+                name: [{"labels": dict(key), "count": h.count,
+                        **{f"p{int(q * 100)}": h.quantile(q) for q in QUANTILES}}
+                       for key, h in series.items()]
+                for name, series in self.histograms.items()
+            }
+
+    def render(self) -> str:
+        """OpenMetrics exposition: histograms as summaries with p50/p95/p99 quantiles."""
+        def fmt(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+            pairs = key + extra
+            if not pairs:
+                return ""
+            escaped = (f'{k}="{v}"'.replace("\n", " ") for k, v in pairs)
+            return "{" + ",".join(escaped) + "}"
+
+        lines = []
+        with self._lock:
+            for name, series in sorted(self.histograms.items()):
+                lines.append(f"# TYPE esi_{name} summary")
+                for key, h in series.items():
+                    for q in QUANTILES:
+                        lines.append(f"esi_{name}{fmt(key, (('quantile', str(q)),))} {h.quantile(q):.6f}")
+                    lines.append(f"esi_{name}_count{fmt(key)} {h.count}")
+                    lines.append(f"esi_{name}_sum{fmt(key)} {h.sum:.6f}")
+            for name, series in sorted(self.counters.items()):
+                lines.append(f"# TYPE esi_{name} counter")
+                for key, value in series.items():
+                    lines.append(f"esi_{name}_total{fmt(key)} {value:g}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+
+class _JsonlExporter:
+    """Writes finished spans from a background thread so tracing never blocks on disk."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.queue: queue.SimpleQueue = queue.SimpleQueue()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        threading.Thread(target=self._drain, name="trace-exporter", daemon=True).start()
+
+    def export(self, record: Dict[str, Any]):
+        self.queue.put(record)
+
+    def _drain(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                record = self.queue.get()
+                f.write(json.dumps(record, default=str) + "\n")
+                # Batch whatever else is already waiting before flushing
+                while not self.queue.empty():
+                    f.write(json.dumps(self.queue.get(), default=str) + "\n")
+                f.flush()
+
+
+metrics = Metrics()
+_exporter: Optional[_JsonlExporter] = _JsonlExporter(TRACE_FILE) if TRACE_FILE else None
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+@contextmanager
+def span(name: str, **labels):
+    """Time a block as a span: records `<name>_seconds` and exports it to TRACE_FILE.
+
+    Spans nest through a context variable, so tool and LLM spans started in
+    tasks spawned for a turn are linked to that turn's trace.
+    """
+    parent = _current_span.get()
+    current = Span(name=name, labels={k: str(v) for k, v in labels.items() if v is not None},
+                   trace_id=parent.trace_id if parent else uuid.uuid4().hex,
+                   parent_id=parent.span_id if parent else None)
+    token = _current_span.set(current)
+    started = time.perf_counter()
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        duration = time.perf_counter() - started
+        metrics.observe(f"{name}_seconds", duration, **current.labels)
+        if error:
+            metrics.increment(f"{name}_errors", **current.labels)
+        if _exporter is not None:
+            _exporter.export({
+                "trace_id": current.trace_id, "span_id": current.span_id, "parent_id": current.parent_id,
+                "name": name, "labels": current.labels, "attributes": current.attributes,
+                "start": current.start, "duration_ms": round(duration * 1000, 3), "error": error,
+            })
+
+def annotate(**attributes):
+    """Attach attributes (e.g. cache="hit") to the innermost open span, if any."""
+    current = _current_span.get()
+    if current is not None:
+        current.attributes.update(attributes)
+
+def record(name: str, duration: float, **labels):
+    """Record a duration measured elsewhere (e.g. between two streamed events)."""
+    metrics.observe(f"{name}_seconds", duration, **labels)
+    current = _current_span.get()
+    if _exporter is not None:
+        _exporter.export({
+            "trace_id": current.trace_id if current else None, "parent_id": current.span_id if current else None,
+            "name": name, "labels": labels, "start": time.time() - duration,
+            "duration_ms": round(duration * 1000, 3),
+        })
+
+
+def install_metrics_endpoint(app, path: str = METRICS_PATH):
+    """Serve OpenMetrics text at `path` on a FastAPI app (Chainlit's server)."""
+    from fastapi.responses import PlainTextResponse
+
+    async def metrics_endpoint():
+        return PlainTextResponse(metrics.render(),
+                                 media_type="application/openmetrics-text; version=1.0.0; charset=utf-8")
+
+    app.add_api_route(path, metrics_endpoint, methods=["GET"], include_in_schema=False)
+    # Chainlit's catch-all frontend route is registered first; match /metrics before it
+    app.router.routes.insert(0, app.router.routes.pop())
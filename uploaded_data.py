@@ -0,0 +1,247 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Type
+
+import pandas as pd
+from langchain_core.tools import BaseTool
+from pydantic import BaseModel, Field
+
+from code_executor import current_code_session
+
+# Converted datasets are cached here by content hash, so re-uploads are free
+DATASET_DIR = os.getenv("DATASET_DIR", os.path.join("cache", "datasets"))
+DATASET_EXTENSIONS = (".sav", ".zsav", ".por", ".rds", ".rdata", ".rda", ".csv", ".tsv", ".xlsx", ".xls")
+# Value counts kept per categorical column in the cached summary
+SUMMARY_TOP_VALUES = int(os.getenv("SUMMARY_TOP_VALUES", "10"))
+
+
+@dataclass
+class Dataset:
+    """A converted upload: Arrow files on disk plus a precomputed summary."""
+    name: str            # variable name in the Python session, e.g. df_my_data
+    source: str          # original file name
+    path: str            # Arrow IPC (Feather v2) file, uncompressed so it can be memory-mapped
+    rows: int
+    columns: int
+    summary: Dict[str, Any] = field(default_factory=dict)
+
+
+def is_dataset(file_name: str) -> bool:
+    return file_name.lower().endswith(DATASET_EXTENSIONS)
+
+def variable_name(file_name: str, table: Optional[str] = None) -> str:
+    """`my data.sav` -> `df_my_data` (the naming the system prompt promises)."""
+    stem = os.path.splitext(os.path.basename(file_name))[0]
+    if table:
+        stem = f"{stem}_{table}"
+    stem = re.sub(r"\W+", "_", stem).strip("_").lower() or "data"
+    return f"df_{stem}"
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def read_source(path: str, file_name: str) -> Dict[Optional[str], tuple]:
+    """Parse an upload into {table name: (DataFrame, metadata)}.
+
+    R workspaces can hold several data frames; every other format yields a
+    single table keyed by None. Metadata carries SPSS variable and value labels.
+    """
+    ext = os.path.splitext(file_name.lower())[1]
+    if ext in (".sav", ".zsav", ".por"):
+        import pyreadstat
+        reader = pyreadstat.read_por if ext == ".por" else pyreadstat.read_sav
+        df, meta = reader(path)
+        return {None: (df, {
+            "variable_labels": {k: v for k, v in meta.column_names_to_labels.items() if v},
+            "value_labels": {col: meta.value_labels[label_set]
+                             for col, label_set in meta.variable_to_label.items()
+                             if label_set in meta.value_labels},
+        })}
+    if ext in (".rds", ".rdata", ".rda"):
+        import pyreadr
+        result = pyreadr.read_r(path)
+        frames = {name: (df, {}) for name, df in result.items() if isinstance(df, pd.DataFrame)}
+        if ext == ".rds" or len(frames) == 1:
+            return {None: next(iter(frames.values()))} if frames else {}
+        return frames
+    if ext in (".xlsx", ".xls"):
+        return {None: (pd.read_excel(path), {})}
+    if ext == ".tsv":
+        return {None: (pd.read_csv(path, sep="\t"), {})}
+    return {None: (pd.read_csv(path, sep=None, engine="python"), {})}
+
+def summarize(df: pd.DataFrame, meta: Dict[str, Any], top_values: int = SUMMARY_TOP_VALUES) -> Dict[str, Any]:
+    """Schema and descriptive statistics, computed once at conversion time."""
+    variable_labels = meta.get("variable_labels", {})
+    value_labels = meta.get("value_labels", {})
+    columns = []
+    for name in df.columns:
+        series = df[name]
+        info: Dict[str, Any] = {
+            "name": str(name),
+            "dtype": str(series.dtype),
+            "missing": int(series.isna().sum()),
+            "unique": int(series.nunique(dropna=True)),
+        }
+        if name in variable_labels:
+            info["label"] = variable_labels[name]
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series) \
+                and name not in value_labels:
+            stats = series.describe()
+            info["stats"] = {k: (None if pd.isna(v) else round(float(v), 4)) for k, v in stats.items() if k != "count"}
+        else:
+            counts = series.value_counts(dropna=True).head(top_values)
+            labels = value_labels.get(name, {})
+            info["top_values"] = {str(labels.get(k, k)): int(v) for k, v in counts.items()}
+        columns.append(info)
+    return {"rows": int(len(df)), "columns": columns}
+
+def arrow_compatible(df: pd.DataFrame) -> pd.DataFrame:
+    """Make object columns convertible to Arrow.
+
+    Spreadsheets often mix numbers and text in one column (e.g. 5, "missing",
+    7), which Arrow rejects. Such columns become pandas strings; object
+    columns holding a single type are given their proper dtype.
+    """
+    import pyarrow as pa
+    df = df.infer_objects()
+    for name in df.columns[df.dtypes == object]:
+        try:
+            pa.array(df[name], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            df[name] = df[name].astype("string")
+    return df
+
+def _write_arrow(df: pd.DataFrame, path: str):
+    import pyarrow as pa
+    from pyarrow import feather
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    tmp_path = path + ".tmp"
+    # Uncompressed so readers can memory-map the file instead of decoding it
+    feather.write_feather(table, tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)
+
+
+class DatasetStore:
+    """Converts uploaded datasets once to Arrow and caches their summaries.
+
+    Conversion results live under DATASET_DIR/<sha256 of the upload>, so the
+    same file uploaded again (in any session) is not parsed a second time.
+    """
+
+    def __init__(self, root: str = DATASET_DIR):
+        self.root = root
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _lock_for(self, digest: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(digest, threading.Lock())
+
+    def ingest(self, path: str, file_name: str) -> List[Dataset]:
+        """Convert an uploaded file (or reuse an earlier conversion) and return its tables."""
+        digest = _file_sha256(path)
+        directory = os.path.join(self.root, digest)
+        manifest_path = os.path.join(directory, "summary.json")
+        with self._lock_for(digest):
+            try:
+                with open(manifest_path, "r", encoding="utf-8") as f:
+                    entries = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                os.makedirs(directory, exist_ok=True)
+                entries = []
+                for i, (table, (df, meta)) in enumerate(read_source(path, file_name).items()):
+                    file = f"table_{i}.arrow"
+                    # Arrow needs string column names
+                    df.columns = [str(c) for c in df.columns]
+                    df = arrow_compatible(df)
+                    _write_arrow(df, os.path.join(directory, file))
+                    entries.append({"table": table, "file": file, "rows": int(len(df)),
+                                    "columns": int(df.shape[1]), "summary": summarize(df, meta)})
+                tmp_path = manifest_path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(entries, f)
+                os.replace(tmp_path, manifest_path)
+                print(f"Converted dataset {file_name} ({len(entries)} table(s))")
+        return [Dataset(name=variable_name(file_name, entry["table"]), source=file_name,
+                        path=os.path.abspath(os.path.join(directory, entry["file"])),
+                        rows=entry["rows"], columns=entry["columns"], summary=entry["summary"])
+                for entry in entries]
+
+
+_store: Optional[DatasetStore] = None
+_store_lock = threading.Lock()
+
+def get_dataset_store() -> DatasetStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = DatasetStore()
+        return _store
+
+# Datasets uploaded in each chat session, by session id and variable name
+_session_datasets: Dict[str, Dict[str, Dataset]] = {}
+
+def register_datasets(session_id: str, datasets: List[Dataset]):
+    _session_datasets.setdefault(session_id, {}).update({d.name: d for d in datasets})
+
+def session_datasets(session_id: str) -> Dict[str, Dataset]:
+    return _session_datasets.get(session_id, {})
+
+def forget_session_datasets(session_id: str):
+    _session_datasets.pop(session_id, None)
+
+
+def format_summary(dataset: Dataset) -> str:
+    """Render a cached summary as compact text for the LLM."""
+    lines = [f"{dataset.name} (from {dataset.source}): {dataset.rows} rows x {dataset.columns} columns"]
+    for col in dataset.summary.get("columns", []):
+        line = f"- {col['name']} [{col['dtype']}]"
+        if col.get("label"):
+            line += f" \"{col['label']}\""
+        line += f" missing={col['missing']} unique={col['unique']}"
+        if "stats" in col:
+            line += " " + ", ".join(f"{k}={v}" for k, v in col["stats"].items())
+        elif col.get("top_values"):
+            line += " top: " + ", ".join(f"{k} ({v})" for k, v in col["top_values"].items())
+        lines.append(line)
+    return "\n".join(lines)
+
+
+class DatasetInput(BaseModel):
+    """Input for the uploaded dataset tool."""
+    name: Optional[str] = Field(default=None, description="Dataset variable name (e.g. df_my_data); omit to list all")
+
+class DatasetSummaryTool(BaseTool):
+    """Answers questions about uploaded datasets from their cached summaries."""
+
+    name: str = "describe_uploaded_data"
+    description: str = """
+    Describe the datasets the user has uploaded in this chat: variables, types, labels,
+    missing values, descriptive statistics and most frequent values. Use this FIRST for
+    questions like "what variables do I have?"; it is instant and does not run code.
+    Each dataset is also preloaded in python_repl under the name shown (df_...).
+    """
+    args_schema: Type[BaseModel] = DatasetInput
+
+    def _run(self, name: Optional[str] = None) -> str:
+        datasets = session_datasets(current_code_session())
+        if not datasets:
+            return "No datasets have been uploaded in this chat."
+        if name:
+            dataset = datasets.get(name) or datasets.get(variable_name(name))
+            if dataset is None:
+                return f"No uploaded dataset called {name}. Available: {', '.join(datasets)}"
+            return format_summary(dataset)
+        return "\n\n".join(format_summary(d) for d in datasets.values())
+
+    async def _arun(self, name: Optional[str] = None) -> str:
+        return self._run(name)